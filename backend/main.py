@@ -1,20 +1,36 @@
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field, ConfigDict
 from services.ner_service import NERService
 from services.std_service import StdService
 from services.abbr_service import AbbrService
 from services.corr_service import CorrService
 from services.gen_service import GenService
+from services.analysis_service import AnalysisService
+from services.cascade_service import CascadeService
+from utils.result_cache import ResultCache
+from utils.milvus_pool import CircuitOpenError
+from utils.admission import AdmissionController, LatencyMonitor, Overloaded, request_deadline
+from utils import profiling
+from utils.payload import slim_ner_response, slim_std_response
 from typing import List, Dict, Optional, Literal, Union, Any
+from functools import partial
+import asyncio
 import logging
+import orjson
+import os
+import random
+import time
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 创建 FastAPI 应用
-app = FastAPI()
+# orjson 序列化；大响应直接返回 ORJSONResponse，跳过 jsonable_encoder
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # 配置跨域资源共享
 app.add_middleware(
@@ -23,21 +39,80 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],
 )
 
+# 请求级性能剖析：PROFILING=1 或 PROFILE_SAMPLE_RATE > 0 时才注册中间件（关闭时没有 BaseHTTPMiddleware 的开销）；
+# 开启后请求头 X-Profile: 1 强制剖析该请求，或按 PROFILE_SAMPLE_RATE 比例随机采样（如 0.01）
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILING = os.getenv("PROFILING", "0") == "1" or PROFILE_SAMPLE_RATE > 0
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")  # collapsed-stack 文件输出目录
+
+async def profiling_middleware(request: Request, call_next):
+    enabled = request.headers.get("X-Profile") == "1" or \
+        (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+    if not enabled:
+        return await call_next(request)
+
+    # NER、嵌入和 LLM 调用多在工作线程中执行，采样全部线程
+    token = profiling.start_request()
+    sampler = profiling.StackSampler().start()
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        sampler.stop()
+        timings = profiling.finish_request(token)
+    total_ms = (time.perf_counter() - started) * 1000.0
+
+    response.headers["Server-Timing"] = profiling.server_timing_header(timings, total_ms)
+    stack_file = await asyncio.to_thread(sampler.dump, PROFILE_DIR, request.url.path)
+    logger.info(f"Profiled {request.url.path}: total={total_ms:.2f}ms stages={timings} stacks={stack_file}")
+    return response
+
+if PROFILING:
+    app.middleware("http")(profiling_middleware)
+
+# 过载保护拒绝的请求：返回 429 / 503 / 504，带 Retry-After
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=headers)
+
 # 初始化各个服务
 ner_service = NERService()  # 命名实体识别服务
-standardization_service = StdService()  # 术语标准化服务
+# NER + 标准化结果缓存，STD_CACHE_SIZE=0 关闭，设置 STD_CACHE_PATH 时持久化到 SQLite
+_cache_size = int(os.getenv("STD_CACHE_SIZE", "1024"))
+result_cache = ResultCache(_cache_size, os.getenv("STD_CACHE_PATH")) if _cache_size > 0 else None
+# STD_PARAGRAPH_REUSE=1 时按段落做 NER 和缓存（修订过的病历只重新分析变化的段落，但 NER 看不到段落外的上下文）
+analysis_service = AnalysisService(ner_service, result_cache,
+                                   paragraph_reuse=os.getenv("STD_PARAGRAPH_REUSE", "0") == "1")
+# /api/std 使用异步 Milvus 检索（客户端池 + 截止时间 + 重试 + 熔断，见 utils/milvus_pool.py）
+STD_ASYNC = os.getenv("STD_ASYNC", "1") == "1"
+
+# LLM 端点的准入控制：并发上限、有界队列、默认超时（秒），可用 <NAME>_MAX_CONCURRENCY 等环境变量覆盖
+admission = {
+    "abbr": AdmissionController.from_env("abbr", max_concurrency=4, max_queue=16, default_timeout=60),
+    "corr": AdmissionController.from_env("corr", max_concurrency=4, max_queue=16, default_timeout=60),
+    "gen": AdmissionController.from_env("gen", max_concurrency=2, max_queue=8, default_timeout=120),
+}
+# LLM 平均耗时超过 LLM_DEGRADE_LATENCY_MS 时切换到本地降级实现（0 表示不降级）
+_degrade_ms = float(os.getenv("LLM_DEGRADE_LATENCY_MS", "0"))
+abbr_latency = LatencyMonitor(_degrade_ms)
+corr_latency = LatencyMonitor(_degrade_ms)
+
+standardization_service = StdService.get()  # 术语标准化服务（默认配置，与请求共用同一个实例）
 abbr_service = AbbrService()  # 缩写扩展服务
 gen_service = GenService()  # 文本生成服务
 corr_service = CorrService()  # 拼写纠正服务
+cascade_service = CascadeService(abbr_service, admission["abbr"], abbr_latency)  # 置信度门控的 LLM 重排，与 /api/abbr 共用准入控制
 
 # 基础模型类
 class BaseInputModel(BaseModel):
     """基础输入模型，包含所有模型共享的字段"""
     model_config = ConfigDict(arbitrary_types_allowed=True)
     
-    llmOptions: Dict[str, str] = Field(
+    llmOptions: Dict[str, Any] = Field(
         default_factory=lambda: {
             "provider": "ollama",
             "model": "qwen2.5:7b"
@@ -45,9 +120,21 @@ class BaseInputModel(BaseModel):
         description="大语言模型配置选项"
     )
 
+class FederatedCollection(BaseModel):
+    """联合检索中的一个集合"""
+    dbName: Optional[str] = Field(
+        default=None,
+        description="向量数据库名称，默认与 embeddingOptions.dbName 相同"
+    )
+    collectionName: str = Field(..., description="集合名称")
+    weight: float = Field(
+        default=1.0,
+        description="融合权重"
+    )
+
 class EmbeddingOptions(BaseModel):
     """向量数据库配置选项"""
-    provider: Literal["huggingface", "openai", "bedrock"] = Field(
+    provider: Literal["huggingface", "openai", "bedrock", "fake"] = Field(
         default="huggingface",
         description="向量数据库提供商"
     )
@@ -63,6 +150,22 @@ class EmbeddingOptions(BaseModel):
         default="concepts_only_name",
         description="集合名称"
     )
+    searchMode: Literal["dense", "hybrid"] = Field(
+        default="dense",
+        description="检索模式：dense 仅稠密向量，hybrid 稠密向量 + BM25 稀疏向量"
+    )
+    fusion: Literal["rrf", "weighted"] = Field(
+        default="rrf",
+        description="hybrid 模式下的结果融合方法"
+    )
+    collections: Optional[List[FederatedCollection]] = Field(
+        default=None,
+        description="联合检索的集合列表（可位于不同数据库），提供时忽略 collectionName：查询向量只计算一次，各集合并发检索"
+    )
+    federatedFusion: Literal["max", "rrf", "weighted"] = Field(
+        default="max",
+        description="联合检索按 concept_id 融合的方法"
+    )
 
 class TextInput(BaseInputModel):
     """文本输入模型，用于标准化和命名实体识别"""
@@ -79,6 +182,26 @@ class TextInput(BaseInputModel):
         default_factory=EmbeddingOptions,
         description="向量数据库配置选项"
     )
+    verbosity: Literal["full", "compact", "minimal"] = Field(
+        default="full",
+        description="响应详细程度：compact 去掉 original_entities 和 synonyms，minimal 检索结果只保留 concept_id 和 distance"
+    )
+    fields: Optional[List[str]] = Field(
+        default=None,
+        description="检索结果保留的字段，优先于 verbosity"
+    )
+    llmRerank: Literal["off", "cascade", "always"] = Field(
+        default="off",
+        description="LLM 重排：cascade 只重排第一名不明确的术语（阈值见 utils/cascade.py），always 重排全部术语"
+    )
+
+class IncrementalInput(TextInput):
+    """增量分析输入模型：同一 documentId 的新修订只重新分析与上一修订相比变化的片段"""
+    documentId: str = Field(..., description="文档 ID")
+    granularity: Literal["sentence", "paragraph"] = Field(
+        default="sentence",
+        description="差异比较的粒度"
+    )
 
 class AbbrInput(BaseInputModel):
     """缩写扩展输入模型"""
@@ -87,9 +210,16 @@ class AbbrInput(BaseInputModel):
         default="",
         description="上下文信息"
     )
-    method: Literal["simple_ollama", "query_db_llm_rerank", "llm_rank_query_db"] = Field(
+    method: Literal["simple_ollama", "query_db_llm_rerank", "llm_rank_query_db", "llm_batch_query_db",
+                    "speculative_query_db", "cascade_query_db"] = Field(
         default="simple_ollama",
-        description="处理方法"
+        description="处理方法（llm_batch_query_db 一次扩展并标准化 text 中的全部缩写；"
+                    "speculative_query_db 同时进行 LLM 扩展和向量检索，检索结果明确时不等待 LLM；"
+                    "cascade_query_db 先做向量检索，结果不明确时才调用 LLM）"
+    )
+    escalation: Literal["expand", "rerank"] = Field(
+        default="expand",
+        description="cascade_query_db 升级到 LLM 的方式：expand 生成全称后再检索，rerank 在候选中选择"
     )
     embeddingOptions: Optional[EmbeddingOptions] = Field(
         default_factory=EmbeddingOptions,
@@ -113,6 +243,10 @@ class ErrorOptions(BaseModel):
         default="qwerty",
         description="键盘布局"
     )
+    seed: Optional[int] = Field(
+        default=None,
+        description="随机种子，相同种子生成相同的错误"
+    )
 
 class CorrInput(BaseInputModel):
     """拼写纠正输入模型"""
@@ -159,10 +293,18 @@ class GenInput(BaseInputModel):
         default="generate_medical_note",
         description="生成方法"
     )
+    parallel: bool = Field(
+        default=False,
+        description="generate_medical_note 时各部分并行生成"
+    )
+    stream: bool = Field(
+        default=False,
+        description="parallel 时按顺序以 NDJSON 流式返回各部分"
+    )
 
 # API 端点：术语标准化
 @app.post("/api/std")
-async def standardization(input: TextInput):
+async def standardization(input: TextInput, request: Request):
     try:
         # 记录请求信息
         logger.info(f"Received request: text={input.text}, options={input.options}, embeddingOptions={input.embeddingOptions}")
@@ -171,37 +313,26 @@ async def standardization(input: TextInput):
         all_medical_terms = input.options.pop('allMedicalTerms', False)
         term_types = {'allMedicalTerms': all_medical_terms}
 
-        # 进行命名实体识别
-        ner_results = ner_service.process(input.text, input.options, term_types)
-
-        # 初始化标准化服务
-        standardization_service = StdService(
-            provider=input.embeddingOptions.provider,
-            model=input.embeddingOptions.model,
-            db_path=f"db/{input.embeddingOptions.dbName}.db",
-            collection_name=input.embeddingOptions.collectionName
-        )
-
-        # 获取识别到的实体
-        entities = ner_results.get('entities', [])
-        if not entities:
-            return {"message": "No medical terms have been recognized", "standardized_terms": []}
-
-        # 标准化每个实体
-        standardized_results = []
-        for entity in entities:
-            std_result = standardization_service.search_similar_terms(entity['word'])
-            standardized_results.append({
-                "original_term": entity['word'],
-                "entity_group": entity['entity_group'],
-                "standardized_results": std_result
-            })
-
-        return {
-            "message": f"{len(entities)} medical terms have been recognized and standardized",
-            "standardized_terms": standardized_results
-        }
+        # NER + 标准化（相同文本和配置直接命中缓存，修订过的病历只重新分析变化的段落）
+        if STD_ASYNC:
+            # 异步路径：Milvus 检索带截止时间、重试和熔断，超时或熔断时返回 503
+            result = await analysis_service.astandardize(
+                input.text, input.options, term_types, input.embeddingOptions.model_dump()
+            )
+        else:
+            result = analysis_service.standardize(
+                input.text, input.options, term_types, input.embeddingOptions.model_dump()
+            )
+        if input.llmRerank != "off":
+            result = await cascade_service.arerank(
+                result, input.text, input.llmOptions, input.llmRerank,
+                deadline=request_deadline(request.headers, admission["abbr"].default_timeout)
+            )
+        return ORJSONResponse(slim_std_response(result, input.verbosity, input.fields))
 
+    except (asyncio.TimeoutError, CircuitOpenError) as e:
+        logger.error(f"Vector search unavailable: {e!r}")
+        raise HTTPException(status_code=503, detail="Vector search unavailable, please retry later")
     except Exception as e:
         logger.error(f"Error in standardization processing: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -212,77 +343,246 @@ async def ner(input: TextInput):
     try:
         logger.info(f"Received NER request: text={input.text}, options={input.options}, termTypes={input.termTypes}")
         results = ner_service.process(input.text, input.options, input.termTypes)
-        return results
+        return ORJSONResponse(slim_ner_response(results, input.verbosity))
     except Exception as e:
         logger.error(f"Error in NER processing: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# API 端点：增量命名实体识别
+@app.post("/api/ner/incremental")
+async def ner_incremental(input: IncrementalInput):
+    try:
+        logger.info(f"Received incremental NER request: documentId={input.documentId}, length={len(input.text)}")
+        result = analysis_service.incremental(
+            input.documentId, input.text, input.options, input.termTypes, granularity=input.granularity
+        )
+        return ORJSONResponse(slim_ner_response(result, input.verbosity))
+    except Exception as e:
+        logger.error(f"Error in incremental NER processing: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# API 端点：增量术语标准化
+@app.post("/api/std/incremental")
+async def standardization_incremental(input: IncrementalInput):
+    try:
+        logger.info(f"Received incremental std request: documentId={input.documentId}, length={len(input.text)}")
+        all_medical_terms = input.options.pop('allMedicalTerms', False)
+        term_types = {'allMedicalTerms': all_medical_terms}
+        result = analysis_service.incremental(
+            input.documentId, input.text, input.options, term_types,
+            input.embeddingOptions.model_dump(), input.granularity
+        )
+        result["standardized_terms"] = [{
+            "original_term": entity['word'],
+            "entity_group": entity['entity_group'],
+            "start": entity['start'],
+            "end": entity['end'],
+            "standardized_results": entity['standardized_results']
+        } for entity in result.pop("entities")]
+        return ORJSONResponse(slim_std_response(result, input.verbosity, input.fields))
+    except Exception as e:
+        logger.error(f"Error in incremental standardization processing: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# API 端点：删除文档的增量分析状态
+@app.delete("/api/documents/{document_id}")
+async def forget_document(document_id: str):
+    return {"documentId": document_id, "removed": analysis_service.forget(document_id)}
+
+# API 端点：级联策略的阈值和升级率
+@app.get("/api/cascade/metrics")
+async def cascade_metrics():
+    return cascade_service.metrics()
+
 # API 端点：拼写纠正
 @app.post("/api/corr")
-async def correct_notes(input: CorrInput):
+async def correct_notes(input: CorrInput, request: Request):
     try:
         if input.method == "correct_spelling":  # 拼写纠正
-            return corr_service.correct_spelling(input.text, input.llmOptions)
+            if corr_latency.degraded():  # LLM 过慢，使用本地词表纠错
+                return corr_service.local_correct(input.text)
+            return await admission["corr"].run(
+                corr_service.correct_spelling, input.text, input.llmOptions,
+                deadline=request_deadline(request.headers, admission["corr"].default_timeout),
+                monitor=corr_latency
+            )
         elif input.method == "add_mistakes":  # 添加错误（测试用）
             return corr_service.add_mistakes(input.text, input.errorOptions)
         else:
             raise HTTPException(status_code=400, detail="Invalid method")
+    except (HTTPException, Overloaded):
+        raise
     except Exception as e:
         logger.error(f"Error in correction processing: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # API 端点：缩写扩展
 @app.post("/api/abbr")
-async def expand_abbreviations(input: AbbrInput):
+async def expand_abbreviations(input: AbbrInput, request: Request):
     try:
+        controller = admission["abbr"]
+        deadline = request_deadline(request.headers, controller.default_timeout)
+        embedding_options = input.embeddingOptions.model_dump()
         if input.method == "simple_ollama":  # 简单扩展
-            output = abbr_service.simple_ollama_expansion(input.text, input.llmOptions)
+            output = await controller.run(abbr_service.simple_ollama_expansion, input.text, input.llmOptions,
+                                          deadline=deadline, monitor=abbr_latency)
             return {"input": input.text, "output": output}
         elif input.method == "query_db_llm_rerank":  # 数据库查询+重排序
-            return abbr_service.query_db_llm_rerank(
+            return await controller.run(
+                abbr_service.query_db_llm_rerank,
                 input.text, 
                 input.context, 
                 input.llmOptions,
-                input.embeddingOptions
+                embedding_options,
+                deadline=deadline
             )
         elif input.method == "llm_rank_query_db":  # LLM扩展+数据库标准化
-            return abbr_service.llm_rank_query_db(
+            if abbr_latency.degraded():  # LLM 过慢，使用缩写词典 + 向量检索
+                return await controller.run(abbr_service.dictionary_query_db,
+                                            input.text, input.context, embedding_options, deadline=deadline)
+            return await controller.run(
+                abbr_service.llm_rank_query_db,
                 input.text, 
                 input.context, 
                 input.llmOptions,
-                input.embeddingOptions
+                embedding_options,
+                deadline=deadline,
+                monitor=abbr_latency
+            )
+        elif input.method == "speculative_query_db":  # LLM 扩展与向量检索并行
+            if abbr_latency.degraded():
+                return await controller.run(abbr_service.dictionary_query_db,
+                                            input.text, input.context, embedding_options, deadline=deadline)
+            # 只记录真正的 LLM 调用耗时：结果明确时直接返回的请求不计入，截止时间到达时由服务按已等待的时间记录
+            return await controller.run(
+                partial(abbr_service.speculative_query_db, monitor=abbr_latency),
+                input.text,
+                input.context,
+                input.llmOptions,
+                embedding_options,
+                deadline=deadline
+            )
+        elif input.method == "cascade_query_db":  # 向量检索结果不明确时才调用 LLM
+            if abbr_latency.degraded():
+                return await controller.run(abbr_service.dictionary_query_db,
+                                            input.text, input.context, embedding_options, deadline=deadline)
+            # 只有升级到 LLM 时才由服务记录 LLM 调用耗时，直接返回的向量检索结果不计入
+            return await controller.run(
+                partial(abbr_service.cascade_query_db, monitor=abbr_latency),
+                input.text,
+                input.context,
+                input.llmOptions,
+                embedding_options,
+                input.escalation,
+                deadline=deadline
+            )
+        elif input.method == "llm_batch_query_db":  # 文档级：一次 LLM 调用 + 一次批量检索
+            degraded = abbr_latency.degraded()
+            return await controller.run(
+                abbr_service.llm_batch_query_db,
+                input.text,
+                input.llmOptions,
+                embedding_options,
+                not degraded,
+                deadline=deadline,
+                monitor=None if degraded else abbr_latency
             )
         else:
             raise HTTPException(status_code=400, detail="Invalid method")
+    except (HTTPException, Overloaded):
+        raise
     except Exception as e:
         logger.error(f"Error in abbreviation expansion: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def stream_medical_note(input: GenInput, controller: AdmissionController, deadline: float) -> StreamingResponse:
+    """
+    以 NDJSON 流式返回并行生成的病历：每完成一个部分输出一行 {"index", "section", "text"}（按部分顺序），
+    最后一行为 {"done": true}；超过截止时间或出错时最后一行为 {"error": ...}。整个输出过程占用一个 gen 槽位。
+    """
+    await controller.acquire(deadline)
+    started = time.monotonic()
+    released = False
+    succeeded = False
+
+    async def release():
+        # 正常结束时由 body 释放；客户端在开始读取响应体之前断开时 body 不会执行，由响应的后台任务释放
+        nonlocal released
+        if not released:
+            released = True
+            controller.release(time.monotonic() - started if succeeded else None)
+
+    async def body():
+        nonlocal succeeded
+        sections = gen_service.astream_medical_note(input.patient_info, input.symptoms, input.diagnosis,
+                                                    input.treatment, input.llmOptions)
+        try:
+            while True:
+                try:
+                    section = await asyncio.wait_for(sections.__anext__(), max(deadline - time.monotonic(), 0))
+                except StopAsyncIteration:
+                    break
+                yield orjson.dumps(section) + b"\n"
+            yield orjson.dumps({"done": True}) + b"\n"
+            succeeded = True
+        except asyncio.TimeoutError:
+            yield orjson.dumps({"error": "gen deadline exceeded"}) + b"\n"
+        except Exception as e:
+            logger.error(f"Error in streamed medical note generation: {str(e)}")
+            yield orjson.dumps({"error": str(e)}) + b"\n"
+        finally:
+            await sections.aclose()
+            await release()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson", background=BackgroundTask(release))
+
 # API 端点：医疗文本生成
 @app.post("/api/gen")
-async def generate_medical_content(input: GenInput):
+async def generate_medical_content(input: GenInput, request: Request):
     try:
-        if input.method == "generate_medical_note":  # 生成病历
-            return gen_service.generate_medical_note(
+        controller = admission["gen"]
+        deadline = request_deadline(request.headers, controller.default_timeout)
+        if input.method == "generate_medical_note" and input.parallel:  # 各部分并行生成
+            if input.stream:
+                return await stream_medical_note(input, controller, deadline)
+            return await controller.run(
+                gen_service.agenerate_medical_note_parallel,
+                input.patient_info,
+                input.symptoms,
+                input.diagnosis,
+                input.treatment,
+                input.llmOptions,
+                deadline=deadline
+            )
+        elif input.method == "generate_medical_note":  # 生成病历
+            return await controller.run(
+                gen_service.generate_medical_note,
                 input.patient_info,
                 input.symptoms,
                 input.diagnosis,
                 input.treatment,
-                input.llmOptions
+                input.llmOptions,
+                deadline=deadline
             )
         elif input.method == "generate_differential_diagnosis":  # 生成鉴别诊断
-            return gen_service.generate_differential_diagnosis(
+            return await controller.run(
+                gen_service.generate_differential_diagnosis,
                 input.symptoms,
-                input.llmOptions
+                input.llmOptions,
+                deadline=deadline
             )
         elif input.method == "generate_treatment_plan":  # 生成治疗计划
-            return gen_service.generate_treatment_plan(
+            return await controller.run(
+                gen_service.generate_treatment_plan,
                 input.diagnosis,
                 input.patient_info,
-                input.llmOptions
+                input.llmOptions,
+                deadline=deadline
             )
         else:
             raise HTTPException(status_code=400, detail="Invalid method")
+    except (HTTPException, Overloaded):
+        raise
     except Exception as e:
         logger.error(f"Error in medical content generation: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,133 @@
+"""
+多进程部署入口：先在主进程中加载模型和索引，再 fork 出多个 worker
+
+与 `uvicorn main:app --workers N`（每个 worker 各自导入 main、各加载一份模型）不同，
+这里 Medical-NER、嵌入模型和本地索引只在主进程加载一次，fork 后以写时复制方式共享，
+增加一个 worker 只需要几十 MB 的私有内存。
+
+用法（在 backend 目录执行）：
+    python serve.py --workers 4 --port 8000
+
+注意：
+- 需要先用 tools/export_local_index.py 导出默认集合的本地索引，Milvus Lite 客户端连接不能跨 fork 共享；
+  没有本地索引时直接退出，此时改用 `uvicorn main:app --workers N`
+- 只适用于 CPU 推理，CUDA 上下文不能跨 fork 使用
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("serve")
+
+
+def create_socket(host: str, port: int) -> socket.socket:
+    """在主进程中绑定监听端口，所有 worker 共享同一个 socket"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload():
+    """导入 main 模块，加载所有模型和索引，返回 FastAPI 应用"""
+    import torch
+    import main
+
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+        raise RuntimeError("CUDA is initialized in the master process; preload mode only supports CPU inference")
+    if main.standardization_service.local_index is None:
+        # 导入 main 时默认的 StdService 已经打开了 Milvus 客户端（gRPC 通道和 Milvus Lite 子进程），不能被 fork 出的 worker 共用
+        raise SystemExit("No local index found for the default collection, and the Milvus client opened while "
+                         "importing main cannot be shared across forked workers. Run tools/export_local_index.py "
+                         "first, or use `uvicorn main:app --workers N` instead.")
+
+    # 把预加载阶段创建的对象移出 GC 跟踪，避免子进程中的垃圾回收触碰这些页面导致写时复制
+    gc.collect()
+    gc.freeze()
+    return main.app
+
+
+def run_worker(app, sock: socket.socket, threads: int, log_level: str):
+    """worker 进程：设置 torch 线程数后在共享 socket 上运行 uvicorn"""
+    import torch
+    import uvicorn
+
+    torch.set_num_threads(threads)
+    config = uvicorn.Config(app, log_level=log_level)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def spawn_worker(app, sock: socket.socket, threads: int, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            run_worker(app, sock, threads, log_level)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preloading multi-process server for the medical NLP API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="每个 worker 的 torch 线程数，默认按 CPU 核数平均分配")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+    sock = create_socket(args.host, args.port)
+
+    logger.info("Preloading models and indexes")
+    started = time.perf_counter()
+    app = preload()
+    logger.info(f"Preloaded in {time.perf_counter() - started:.1f}s, starting {args.workers} workers "
+                f"({threads} torch threads each)")
+
+    workers = {spawn_worker(app, sock, threads, args.log_level) for _ in range(args.workers)}
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    # 监控 worker，异常退出时重新 fork
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited with status {status}, restarting")
+            workers.add(spawn_worker(app, sock, threads, args.log_level))
+
+    sock.close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
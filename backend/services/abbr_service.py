@@ -1,15 +1,42 @@
 from langchain_community.llms import Ollama
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from typing import Dict
+from utils.fake_backends import FakeLLM
+from typing import Dict, List, Optional
 from services.std_service import StdService
+from services.federated_std_service import create_std_service
+from utils.profiling import stage
+from utils.confidence import is_decisive
+from utils.cascade import CascadePolicy
+from utils.admission import LatencyMonitor
+import asyncio
+import json
 import os
+import re
+import time
 import logging
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+ABBREVIATIONS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  "data", "medical_abbreviations.json")
+
+# 候选缩写：单词（可含数字、/、&），或 b.i.d. 这类带点的写法
+_TOKEN_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9/&]*(?:\.[A-Za-z0-9]+)*\.?")
+_DOTTED_PATTERN = re.compile(r"^(?:[A-Za-z]\.){2,}$")
+
+
+def _merge_terms(terms: List[Dict], limit: int) -> List[Dict]:
+    """按 concept_id 合并多组检索结果（取较高得分），按得分降序取前 limit 个"""
+    merged = {}
+    for term in terms:
+        key = term.get("concept_id")
+        if key not in merged or term["distance"] > merged[key]["distance"]:
+            merged[key] = term
+    return sorted(merged.values(), key=lambda term: term["distance"], reverse=True)[:limit]
+
 class AbbrService:
     """
     医学术语缩写扩展服务
@@ -18,7 +45,14 @@ class AbbrService:
     2. LLM 生成 + 数据库查询：更准确但较慢
     """
     def __init__(self):
-        self.std_service = None  # 按需初始化标准化服务
+        # 常见医学缩写词典：大写缩写 -> 可能的全称
+        with open(ABBREVIATIONS_FILE, encoding="utf-8") as f:
+            self.abbreviations = json.load(f)
+        # 推测执行：向量检索结果第一名得分和领先幅度都达到阈值时，不再等待 LLM
+        self.speculative_min_score = float(os.getenv("ABBR_SPECULATIVE_MIN_SCORE", "0.75"))
+        self.speculative_margin = float(os.getenv("ABBR_SPECULATIVE_MARGIN", "0.05"))
+        # 级联：向量检索结果明确时直接返回，模糊时才调用 LLM（阈值见 utils/cascade.py 和 tools/calibrate_cascade.py）
+        self.cascade_policy = CascadePolicy.from_config("abbr")
         
     def _get_std_service(self, embedding_options: dict) -> StdService:
         """
@@ -30,6 +64,9 @@ class AbbrService:
                 - model: 模型名称
                 - dbName: 数据库名称
                 - collectionName: 集合名称
+                - searchMode: 检索模式 (dense/hybrid)
+                - fusion: hybrid 模式下的融合方法 (rrf/weighted)
+                - collections / federatedFusion: 联合检索多个集合（见 FederatedStdService）
             
         Returns:
             配置好的标准化服务实例
@@ -38,12 +75,7 @@ class AbbrService:
             ValueError: 当标准化服务初始化失败时
         """
         try:
-            return StdService(
-                provider=embedding_options.get("provider", "huggingface"),
-                model=embedding_options.get("model", "BAAI/bge-m3"),
-                db_path=f"db/{embedding_options.get('dbName', 'snomed_bge_m3')}.db",
-                collection_name=embedding_options.get("collectionName", "concepts_only_name")
-            )
+            return create_std_service(embedding_options)
         except Exception as e:
             logger.error(f"Failed to initialize StdService: {str(e)}")
             raise ValueError(f"Failed to initialize standardization service: {str(e)}")
@@ -54,7 +86,7 @@ class AbbrService:
         
         Args:
             llm_options: 语言模型配置选项，包含：
-                - provider: 模型提供商 (ollama/openai)
+                - provider: 模型提供商 (ollama/openai/fake)
                 - model: 模型名称
             
         Returns:
@@ -74,9 +106,26 @@ class AbbrService:
                 temperature=0,
                 api_key=os.getenv("OPENAI_API_KEY")
             )
+        elif provider == "fake":
+            return FakeLLM.from_options(llm_options)
         else:
             raise ValueError(f"Unsupported LLM provider: {provider}")
         
+    @staticmethod
+    def _expand_prompt():
+        """根据缩写和上下文生成全称的提示词"""
+        return ChatPromptTemplate.from_messages([
+            ("system", "Given the medical abbreviation and its context, provide the most likely expansion based on common medical usage."),
+            ("human", "Abbreviation: {abbreviation}\nContext: {context}")
+        ])
+
+    def _llm_expand(self, text: str, context: str, llm_options: dict) -> str:
+        """用 LLM 生成缩写的全称"""
+        chain = self._expand_prompt() | self._get_llm(llm_options)
+        expansion_result = chain.invoke({"abbreviation": text, "context": context})
+        # 从 AIMessage 中提取实际的文本内容
+        return expansion_result.content if hasattr(expansion_result, 'content') else str(expansion_result)
+
     def simple_ollama_expansion(self, text: str, llm_options: dict) -> Dict:
         """
         使用简单的 LLM 方法扩展缩写（快速但不保证准确性）
@@ -140,23 +189,13 @@ class AbbrService:
         """
         try:
             # 获取标准化服务实例
-            self.std_service = self._get_std_service(embedding_options)
+            std_service = self._get_std_service(embedding_options)
             
             # 使用 LLM 生成扩展
-            llm = self._get_llm(llm_options)
-            expand_prompt = ChatPromptTemplate.from_messages([
-                ("system", "Given the medical abbreviation and its context, provide the most likely expansion based on common medical usage."),
-                ("human", f"Abbreviation: {text}\nContext: {context}")
-            ])
-            
-            chain = expand_prompt | llm
-            expansion_result = chain.invoke({})
-            
-            # 从 AIMessage 中提取实际的文本内容
-            expansion_text = expansion_result.content if hasattr(expansion_result, 'content') else str(expansion_result)
+            expansion_text = self._llm_expand(text, context, llm_options)
             
             # 在数据库中查找相似的标准术语
-            std_terms = self.std_service.search_similar_terms(expansion_text)
+            std_terms = std_service.search_similar_terms(expansion_text)
             
             return {
                 "input": text,
@@ -167,4 +206,342 @@ class AbbrService:
             }
         except Exception as e:
             logger.error(f"Error in llm_rank_query_db: {str(e)}")
-            raise ValueError(f"Failed to process abbreviation expansion: {str(e)}") 
\ No newline at end of file
+            raise ValueError(f"Failed to process abbreviation expansion: {str(e)}") 
+
+    def dictionary_query_db(self, text: str, context: str, embedding_options: dict) -> Dict:
+        """
+        缩写词典 + 向量检索（不调用 LLM，作为 llm_rank_query_db 在 LLM 过慢时的降级实现）
+
+        缩写有多个全称时，选择与 "全称 + 上下文" 最相近的标准术语距离最高的全称；
+        词典中没有的缩写直接用原文检索。
+
+        Args:
+            text: 需要扩展的缩写
+            context: 缩写出现的上下文
+            embedding_options: 嵌入模型配置选项
+
+        Returns:
+            与 llm_rank_query_db 相同结构的字典，method 为 "dictionary_db"
+        """
+        std_service = self._get_std_service(embedding_options)
+        expansions = self.abbreviations.get(text.strip().upper().rstrip("."), [])
+
+        if not expansions:
+            expansion_text = text
+            std_terms = std_service.search_similar_terms(text)
+        elif len(expansions) == 1:
+            expansion_text = expansions[0]
+            std_terms = std_service.search_similar_terms(expansion_text)
+        else:
+            # 用上下文消歧：每个候选全称带上上下文检索，取最相近结果得分最高的全称
+            best = None
+            for expansion in expansions:
+                scored = std_service.search_similar_terms(f"{expansion} {context}".strip(), limit=1)
+                score = scored[0]["distance"] if scored else float("-inf")
+                if best is None or score > best[0]:
+                    best = (score, expansion)
+            expansion_text = best[1]
+            std_terms = std_service.search_similar_terms(expansion_text)
+
+        return {
+            "input": text,
+            "context": context,
+            "expansion": expansion_text,
+            "standardized_terms": std_terms,
+            "method": "dictionary_db",
+            "degraded": True
+        }
+
+    def find_abbreviations(self, text: str) -> List[Dict]:
+        """
+        找出文本中所有候选缩写
+
+        候选为：至少含两个大写字母的单词（COPD、HbA1c）、b.i.d. 这类带点的写法，
+        以及缩写词典中有的、不是全小写的单词（Afib）。
+
+        Returns:
+            按首次出现排序的列表，每项包含 abbreviation（规范化的大写形式）和 occurrences（[{start, end}]）
+        """
+        found = {}
+        for match in _TOKEN_PATTERN.finditer(text):
+            token, start, end = match.group(), match.start(), match.end()
+            if token.endswith(".") and not _DOTTED_PATTERN.match(token):
+                token, end = token[:-1], end - 1
+            key = token.upper().rstrip(".")
+            uppercase = sum(ch.isupper() for ch in token)
+            if not (uppercase >= 2 or _DOTTED_PATTERN.match(token)
+                    or (key in self.abbreviations and token != token.lower())):
+                continue
+            found.setdefault(key, []).append({"start": start, "end": end})
+        return [{"abbreviation": key, "occurrences": occurrences} for key, occurrences in found.items()]
+
+    def _llm_expand_all(self, text: str, abbreviations: List[str], llm_options: dict) -> Dict[str, Optional[str]]:
+        """一次 LLM 调用返回所有缩写的全称（LLM 判断不是缩写的词不在结果中），解析失败时返回空字典"""
+        llm = self._get_llm(llm_options)
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "Given a clinical note and a list of tokens found in it, expand each token that is a medical abbreviation "
+                       "to its most likely full form in the context of the note."),
+            ("system", "Answer with a single JSON object mapping every listed token to its expansion, "
+                       "or to null if the token is not an abbreviation. Do NOT include any other text."),
+            ("human", "Note: {note}\nTokens: {tokens}"),
+        ])
+        result = (prompt | llm).invoke({"note": text, "tokens": json.dumps(abbreviations)})
+        content = result.content if hasattr(result, 'content') else str(result)
+
+        # 兼容模型在 JSON 前后附带的说明文字或 ``` 代码块
+        begin, end = content.find("{"), content.rfind("}")
+        try:
+            parsed = json.loads(content[begin:end + 1]) if begin >= 0 and end > begin else {}
+        except json.JSONDecodeError:
+            logger.warning(f"LLM returned invalid JSON for batch abbreviation expansion: {content[:200]}")
+            return {}
+        if not isinstance(parsed, dict):
+            return {}
+        return {str(key).upper().rstrip("."): value.strip()
+                for key, value in parsed.items() if isinstance(value, str) and value.strip()}
+
+    def llm_batch_query_db(self, text: str, llm_options: dict, embedding_options: dict, use_llm: bool = True) -> Dict:
+        """
+        文档级缩写扩展：一次 LLM 调用扩展文本中的全部缩写，再用一次批量向量检索标准化所有全称
+
+        LLM 没有给出（或判断不是缩写）的词回退到缩写词典；两者都没有时不扩展。
+
+        Args:
+            text: 病历文本
+            llm_options: 语言模型配置选项
+            embedding_options: 嵌入模型配置选项
+            use_llm: 为 False 时只使用缩写词典（LLM 过慢时的降级实现）
+
+        Returns:
+            {
+                "input": 原始文本,
+                "expanded_text": 缩写替换为全称后的文本,
+                "abbreviations": [{abbreviation, expansion, source (llm/dictionary), occurrences, standardized_terms}],
+                "method": "llm_batch_db"（降级时为 "dictionary_batch_db"，并带 degraded = true）
+            }
+        """
+        candidates = self.find_abbreviations(text)
+        llm_expansions = {}
+        if candidates and use_llm:
+            with stage("llm_expand"):
+                llm_expansions = self._llm_expand_all(text, [item["abbreviation"] for item in candidates], llm_options)
+
+        expanded = []
+        for item in candidates:
+            key = item["abbreviation"]
+            dictionary = self.abbreviations.get(key)
+            if llm_expansions.get(key):
+                expansion, source = llm_expansions[key], "llm"
+            elif dictionary:
+                # 多个全称时取词典中的第一个（最常用）
+                expansion, source = dictionary[0], "dictionary"
+            else:
+                continue
+            expanded.append(dict(item, expansion=expansion, source=source))
+
+        if expanded:
+            std_service = self._get_std_service(embedding_options)
+            with stage("std_search"):
+                std_terms = std_service.search_similar_terms_batch([item["expansion"] for item in expanded])
+            for item, terms in zip(expanded, std_terms):
+                item["standardized_terms"] = terms
+
+        replacements = sorted((occurrence["start"], occurrence["end"], item["expansion"])
+                              for item in expanded for occurrence in item["occurrences"])
+        parts, position = [], 0
+        for start, end, expansion in replacements:
+            parts.extend((text[position:start], expansion))
+            position = end
+        parts.append(text[position:])
+        expanded_text = "".join(parts)
+
+        result = {
+            "input": text,
+            "expanded_text": expanded_text,
+            "abbreviations": expanded,
+            "method": "llm_batch_db" if use_llm else "dictionary_batch_db"
+        }
+        if not use_llm:
+            result["degraded"] = True
+        return result
+
+    async def speculative_query_db(self, text: str, context: str, llm_options: dict, embedding_options: dict,
+                                   limit: int = 5, timeout: float = None,
+                                   monitor: Optional[LatencyMonitor] = None) -> Dict:
+        """
+        llm_rank_query_db 的推测执行版本
+
+        LLM 扩展与 "缩写 + 上下文" 的向量检索同时进行：检索结果明确（见 utils/confidence.py）时
+        立即返回并取消 LLM 调用；否则等待 LLM 扩展，再检索扩展后的全称，两组候选按 concept_id 合并（取较高得分）。
+
+        Args:
+            text: 需要扩展的缩写
+            context: 缩写出现的上下文
+            llm_options: 语言模型配置选项
+            embedding_options: 嵌入模型配置选项
+            limit: 返回结果的最大数量
+            timeout: 单次 Milvus 检索的截止时间（秒）
+            monitor: 记录 LLM 调用耗时的 LatencyMonitor：只记录真正完成的 LLM 调用，以及等待 LLM 时
+                被取消（请求截止时间到达）的耗时；结果明确、LLM 被提前取消的请求不计入
+
+        Returns:
+            与 llm_rank_query_db 相同结构的字典，method 为 "speculative_db"，
+            另含 decisive（是否直接采用了向量检索结果）；明确时 expansion 为第一名的 concept_name
+        """
+        llm = self._get_llm(llm_options)
+        llm_task = asyncio.ensure_future((self._expand_prompt() | llm).ainvoke({"abbreviation": text, "context": context}))
+        llm_started = time.monotonic()
+        if monitor is not None:
+            llm_task.add_done_callback(
+                lambda task: None if task.cancelled() else monitor.observe(time.monotonic() - llm_started))
+
+        try:
+            std_service = await asyncio.to_thread(self._get_std_service, embedding_options)
+            with stage("speculative_search"):
+                vector_terms = await std_service.asearch_similar_terms(f"{text} {context}".strip(), limit, timeout)
+        except BaseException:
+            llm_task.cancel()
+            raise
+
+        if is_decisive(vector_terms, self.speculative_min_score, self.speculative_margin):
+            llm_task.cancel()
+            return {
+                "input": text,
+                "context": context,
+                "expansion": vector_terms[0]["concept_name"],
+                "standardized_terms": vector_terms,
+                "method": "speculative_db",
+                "decisive": True
+            }
+
+        try:
+            with stage("llm_expand"):
+                expansion_result = await llm_task
+        except asyncio.CancelledError:
+            # 截止时间到达时 LLM 仍未返回：按已等待的时间计入，否则卡住的 LLM 永远不会触发降级
+            if monitor is not None:
+                monitor.observe(time.monotonic() - llm_started)
+            raise
+        except Exception as e:
+            # LLM 失败时退回向量检索结果
+            logger.warning(f"LLM expansion failed in speculative_query_db, using vector results: {str(e)}")
+            expansion_text = None
+            std_terms = vector_terms
+        else:
+            expansion_text = expansion_result.content if hasattr(expansion_result, 'content') else str(expansion_result)
+            llm_terms = await std_service.asearch_similar_terms(expansion_text, limit, timeout)
+            std_terms = _merge_terms(llm_terms + vector_terms, limit)
+
+        return {
+            "input": text,
+            "context": context,
+            "expansion": expansion_text,
+            "standardized_terms": std_terms,
+            "method": "speculative_db",
+            "decisive": False
+        }
+
+    def rerank_candidates(self, term: str, context: str, candidates: List[Dict], llm_options: dict) -> List[Dict]:
+        """
+        让 LLM 从向量检索的候选中选出最符合 term（在上下文中的含义）的标准术语
+
+        Args:
+            term: 缩写或医学术语
+            context: 所在的上下文
+            candidates: 向量检索结果
+            llm_options: 语言模型配置选项
+
+        Returns:
+            选中的候选移到第一位并带 llm_selected: True，其余保持原顺序；LLM 回答无法解析时原样返回
+        """
+        if len(candidates) < 2:
+            return list(candidates)
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "You are given a medical term from a clinical note, its context and numbered candidate standard concepts. "
+                       "Answer ONLY with the number of the candidate that best matches the meaning of the term in this context."),
+            ("human", "Term: {term}\nContext: {context}\nCandidates:\n{candidates}")
+        ])
+        listing = "\n".join(f"{i}. {candidate.get('concept_name')} ({candidate.get('domain_id')}, {candidate.get('concept_class_id')})"
+                            for i, candidate in enumerate(candidates, start=1))
+        result = (prompt | self._get_llm(llm_options)).invoke({"term": term, "context": context, "candidates": listing})
+        answer = result.content if hasattr(result, 'content') else str(result)
+
+        match = re.search(r"\d+", answer)
+        if not match or not 1 <= int(match.group()) <= len(candidates):
+            logger.warning(f"Could not parse LLM rerank answer for {term!r}: {answer[:100]!r}")
+            return list(candidates)
+        chosen = int(match.group()) - 1
+        return [dict(candidates[chosen], llm_selected=True)] + [candidate for i, candidate in enumerate(candidates) if i != chosen]
+
+    def query_db_llm_rerank(self, text: str, context: str, llm_options: dict, embedding_options: dict,
+                            limit: int = 5) -> Dict:
+        """
+        先用 "缩写 + 上下文" 向量检索候选标准术语，再由 LLM 选出最合适的一个
+
+        Returns:
+            与 llm_rank_query_db 相同结构的字典，expansion 为 LLM 选中的 concept_name，method 为 "db_llm_rerank"
+        """
+        std_service = self._get_std_service(embedding_options)
+        with stage("vector_search"):
+            candidates = std_service.search_similar_terms(f"{text} {context}".strip(), limit)
+        with stage("llm_rerank"):
+            std_terms = self.rerank_candidates(text, context, candidates, llm_options)
+        return {
+            "input": text,
+            "context": context,
+            "expansion": std_terms[0]["concept_name"] if std_terms else None,
+            "standardized_terms": std_terms,
+            "method": "db_llm_rerank"
+        }
+
+    def cascade_query_db(self, text: str, context: str, llm_options: dict, embedding_options: dict,
+                         escalation: str = "expand", limit: int = 5,
+                         monitor: Optional[LatencyMonitor] = None) -> Dict:
+        """
+        置信度门控的级联：先做 "缩写 + 上下文" 的向量检索，结果明确（self.cascade_policy）时直接返回，
+        只有模糊的情况才调用 LLM
+
+        Args:
+            text: 需要扩展的缩写
+            context: 缩写出现的上下文
+            llm_options: 语言模型配置选项
+            embedding_options: 嵌入模型配置选项
+            escalation: 升级方式：expand 由 LLM 生成全称后再检索（与向量结果合并），rerank 由 LLM 在候选中选择
+            limit: 返回结果的最大数量
+            monitor: 记录 LLM 调用耗时的 LatencyMonitor，只在升级时记录（包括失败的调用）
+
+        Returns:
+            与 llm_rank_query_db 相同结构的字典，method 为 "cascade_db"，另含 escalated（是否调用了 LLM）；
+            未升级时 expansion 为第一名的 concept_name，LLM 调用失败时退回向量检索结果
+        """
+        if escalation not in ("expand", "rerank"):
+            raise ValueError(f"Unsupported escalation: {escalation}")
+        std_service = self._get_std_service(embedding_options)
+        with stage("vector_search"):
+            vector_terms = std_service.search_similar_terms(f"{text} {context}".strip(), limit)
+
+        result = {"input": text, "context": context, "method": "cascade_db"}
+        if self.cascade_policy.accepts(vector_terms):
+            return dict(result, expansion=vector_terms[0]["concept_name"], standardized_terms=vector_terms,
+                        escalated=False)
+
+        try:
+            llm_started = time.monotonic()
+            try:
+                if escalation == "rerank":
+                    with stage("llm_rerank"):
+                        std_terms = self.rerank_candidates(text, context, vector_terms, llm_options)
+                    expansion_text = std_terms[0]["concept_name"] if std_terms else None
+                else:
+                    with stage("llm_expand"):
+                        expansion_text = self._llm_expand(text, context, llm_options)
+            finally:
+                if monitor is not None:
+                    monitor.observe(time.monotonic() - llm_started)
+            if escalation == "expand":
+                std_terms = _merge_terms(std_service.search_similar_terms(expansion_text, limit) + vector_terms, limit)
+        except Exception as e:
+            logger.warning(f"LLM {escalation} failed in cascade_query_db, using vector results: {str(e)}")
+            expansion_text, std_terms = None, vector_terms
+        return dict(result, expansion=expansion_text, standardized_terms=std_terms, escalated=True,
+                    escalation=escalation)
@@ -0,0 +1,297 @@
+from services.ner_service import NERService
+from services.std_service import StdService
+from services.federated_std_service import create_std_service
+from utils.result_cache import ResultCache, cache_key
+from utils.text_segments import split_paragraphs, split_sentences
+from utils.profiling import stage
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import threading
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 缓存格式或分析流程变化时递增，使旧缓存失效
+CACHE_VERSION = 2
+
+
+class AnalysisService:
+    """
+    NER + 术语标准化的组合分析服务
+    对相同的文本和配置直接返回缓存结果；开启 paragraph_reuse 时修订过的病历按段落复用未变化部分的结果
+    """
+    def __init__(self, ner_service: NERService, cache: Optional[ResultCache] = None,
+                 paragraph_reuse: bool = False, max_documents: int = 1000):
+        """
+        Args:
+            ner_service: 命名实体识别服务
+            cache: 结果缓存，为 None 时不缓存
+            paragraph_reuse: 是否按段落分别分析和缓存（病历修订时只重新分析变化的段落）。
+                NER 只能看到所在段落的上下文，识别结果可能与整篇分析不同，因此默认关闭
+            max_documents: 增量分析最多保留的文档修订状态数（LRU 淘汰）
+        """
+        self.ner_service = ner_service
+        self.cache = cache
+        self.paragraph_reuse = paragraph_reuse
+        self.max_documents = max_documents
+        # document_id -> 上一修订的状态 {"config", "revision", "segments": [(片段文本, 片段内实体)]}
+        self._documents: "OrderedDict[str, Dict]" = OrderedDict()
+        self._documents_lock = threading.Lock()
+
+    def _get_std_service(self, embedding_options: Dict) -> StdService:
+        """embedding_options 中有 collections 时返回联合检索的 FederatedStdService（检索接口相同）"""
+        with stage("std_init"):
+            return create_std_service(embedding_options)
+
+    def _config(self, options: Dict, term_types: Dict, embedding_options: Dict) -> List:
+        """参与缓存键计算的配置（包括模型版本和是否按段落分析）"""
+        return [CACHE_VERSION, self.ner_service.model_name, self.paragraph_reuse, options, term_types, embedding_options]
+
+    def analyze_span(self, text: str, options: Dict, term_types: Dict,
+                     std_service: Optional[StdService]) -> List[Dict]:
+        """
+        对一段文本做 NER 并标准化每个实体
+
+        Args:
+            std_service: 标准化服务，为 None 时只做 NER，返回 NERService 的原始实体
+
+        Returns:
+            实体列表，每个实体包含 word、entity_group、start、end（相对 text 的偏移）和 standardized_results
+        """
+        with stage("ner"):
+            ner_results = self.ner_service.process(text, options, term_types)
+
+        if std_service is None:
+            return ner_results.get('entities', [])
+
+        entities = []
+        for entity in ner_results.get('entities', []):
+            entities.append({
+                "word": entity['word'],
+                "entity_group": entity['entity_group'],
+                "start": entity['start'],
+                "end": entity['end'],
+                "standardized_results": std_service.search_similar_terms(entity['word'])
+            })
+        return entities
+
+    def standardize(self, text: str, options: Dict, term_types: Dict, embedding_options: Dict) -> Dict:
+        """
+        识别文本中的医学术语并标准化
+
+        Args:
+            text: 输入文本
+            options: NER 处理选项
+            term_types: 需要识别的术语类型
+            embedding_options: 向量数据库配置选项
+
+        Returns:
+            与 /api/std 响应一致的字典
+        """
+        config = self._config(options, term_types, embedding_options)
+        doc_key = cache_key("doc", text, config)
+        if self.cache is not None:
+            with stage("cache"):
+                cached = self.cache.get(doc_key)
+            if cached is not None:
+                return cached
+
+        entities = self.analyze_segments(text, options, term_types, embedding_options)
+        result = self._response(entities)
+        if self.cache is not None:
+            self.cache.put(doc_key, result)
+        return result
+
+    async def astandardize(self, text: str, options: Dict, term_types: Dict, embedding_options: Dict,
+                           timeout: Optional[float] = None) -> Dict:
+        """
+        standardize 的异步版本：与同步版本一样按段落读写缓存，只对未命中的段落做 NER（在线程中执行），
+        各实体的检索通过 StdService.asearch_similar_terms 并发进行
+
+        Args:
+            timeout: 单次 Milvus 检索的截止时间（秒）
+
+        Raises:
+            asyncio.TimeoutError: 检索超时
+            CircuitOpenError: Milvus 熔断
+        """
+        config = self._config(options, term_types, embedding_options)
+        doc_key = cache_key("doc", text, config)
+        if self.cache is not None:
+            with stage("cache"):
+                cached = self.cache.get(doc_key)
+            if cached is not None:
+                return cached
+
+        entities = await self.aanalyze_segments(text, options, term_types, embedding_options, timeout)
+        result = self._response(entities)
+        if self.cache is not None:
+            self.cache.put(doc_key, result)
+        return result
+
+    def _response(self, entities: List[Dict]) -> Dict:
+        """构造 /api/std 的响应"""
+        if not entities:
+            return {"message": "No medical terms have been recognized", "standardized_terms": []}
+        return {
+            "message": f"{len(entities)} medical terms have been recognized and standardized",
+            "standardized_terms": [{
+                "original_term": entity['word'],
+                "entity_group": entity['entity_group'],
+                "standardized_results": entity['standardized_results']
+            } for entity in entities]
+        }
+
+    def analyze_segments(self, text: str, options: Dict, term_types: Dict,
+                         embedding_options: Dict) -> List[Dict]:
+        """
+        分段分析全文，已缓存的段落直接复用，返回以全文偏移表示的实体列表
+        """
+        config = self._config(options, term_types, embedding_options)
+        std_service = None
+        segments = split_paragraphs(text) if self.cache is not None and self.paragraph_reuse else [(0, len(text))]
+
+        entities = []
+        for start, end in segments:
+            segment = text[start:end]
+            key = cache_key("paragraph", segment, config)
+            segment_entities = self.cache.get(key) if self.cache is not None and len(segments) > 1 else None
+            if segment_entities is None:
+                if std_service is None:
+                    std_service = self._get_std_service(embedding_options)
+                segment_entities = self.analyze_span(segment, options, term_types, std_service)
+                if self.cache is not None and len(segments) > 1:
+                    self.cache.put(key, segment_entities)
+            for entity in segment_entities:
+                entity["start"] += start
+                entity["end"] += start
+                entities.append(entity)
+        return entities
+
+    async def aanalyze_span(self, text: str, options: Dict, term_types: Dict, std_service: StdService,
+                            timeout: Optional[float] = None) -> List[Dict]:
+        """analyze_span 的异步版本：NER 在线程中执行，各实体的检索并发进行"""
+        with stage("ner"):
+            ner_results = await asyncio.to_thread(self.ner_service.process, text, options, term_types)
+        ner_entities = ner_results.get('entities', [])
+        searches = [std_service.asearch_similar_terms(entity['word'], timeout=timeout) for entity in ner_entities]
+        return [{
+            "word": entity['word'],
+            "entity_group": entity['entity_group'],
+            "start": entity['start'],
+            "end": entity['end'],
+            "standardized_results": std_result
+        } for entity, std_result in zip(ner_entities, await asyncio.gather(*searches))]
+
+    async def aanalyze_segments(self, text: str, options: Dict, term_types: Dict, embedding_options: Dict,
+                                timeout: Optional[float] = None) -> List[Dict]:
+        """
+        analyze_segments 的异步版本：段落缓存的读写方式相同，未命中的段落并发分析
+        """
+        config = self._config(options, term_types, embedding_options)
+        segments = split_paragraphs(text) if self.cache is not None and self.paragraph_reuse else [(0, len(text))]
+        per_segment = len(segments) > 1
+
+        keys = [cache_key("paragraph", text[start:end], config) for start, end in segments]
+        segment_entities = [self.cache.get(key) if per_segment else None for key in keys]
+        missed = [index for index, cached in enumerate(segment_entities) if cached is None]
+        if missed:
+            std_service = await asyncio.to_thread(self._get_std_service, embedding_options)
+            analyzed = await asyncio.gather(*[
+                self.aanalyze_span(text[segments[index][0]:segments[index][1]], options, term_types,
+                                   std_service, timeout)
+                for index in missed
+            ])
+            for index, span_entities in zip(missed, analyzed):
+                segment_entities[index] = span_entities
+                if per_segment:
+                    self.cache.put(keys[index], span_entities)
+
+        entities = []
+        for (start, _), span_entities in zip(segments, segment_entities):
+            for entity in span_entities:
+                entity["start"] += start
+                entity["end"] += start
+                entities.append(entity)
+        return entities
+
+    def incremental(self, document_id: str, text: str, options: Dict, term_types: Dict,
+                    embedding_options: Optional[Dict] = None, granularity: str = "sentence") -> Dict:
+        """
+        增量分析文档的新修订：与上一修订按句子或段落做差异比较，只对变化的片段重新做 NER 和标准化，
+        未变化片段的实体直接复用，偏移量按片段的新位置平移
+
+        Args:
+            document_id: 文档 ID，用于关联同一文档的各次修订
+            text: 新修订的全文
+            options: NER 处理选项
+            term_types: 需要识别的术语类型
+            embedding_options: 向量数据库配置选项，为 None 时只做 NER
+            granularity: 差异比较的粒度，"sentence" 或 "paragraph"
+
+        Returns:
+            包含 revision、entities（全文偏移）以及复用/重新分析片段数的字典
+        """
+        splitter = split_paragraphs if granularity == "paragraph" else split_sentences
+        config = cache_key(granularity, self._config(options, term_types, embedding_options))
+        spans = splitter(text)
+        new_segments = [text[start:end] for start, end in spans]
+
+        with self._documents_lock:
+            previous = self._documents.get(document_id)
+        if previous is None or previous["config"] != config:
+            previous = {"revision": 0, "segments": []}
+
+        # 片段序列的差异比较，相同的片段沿用上一修订的实体
+        old_segments = previous["segments"]
+        reused: Dict[int, List[Dict]] = {}
+        matcher = SequenceMatcher(None, [segment for segment, _ in old_segments], new_segments, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                for offset in range(i2 - i1):
+                    reused[j1 + offset] = old_segments[i1 + offset][1]
+
+        std_service = None
+        segments = []
+        entities = []
+        for index, (start, end) in enumerate(spans):
+            segment_entities = reused.get(index)
+            if segment_entities is None:
+                if embedding_options is not None and std_service is None:
+                    std_service = self._get_std_service(embedding_options)
+                segment_entities = self.analyze_span(new_segments[index], options, term_types, std_service)
+            segments.append((new_segments[index], segment_entities))
+            for entity in segment_entities:
+                shifted = dict(entity, start=entity["start"] + start, end=entity["end"] + start)
+                if "original_entities" in entity:
+                    shifted["original_entities"] = [
+                        dict(e, start=e["start"] + start, end=e["end"] + start) for e in entity["original_entities"]
+                    ]
+                entities.append(shifted)
+
+        revision = previous["revision"] + 1
+        with self._documents_lock:
+            self._documents[document_id] = {"config": config, "revision": revision, "segments": segments}
+            self._documents.move_to_end(document_id)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+
+        logger.info(f"Incremental analysis of {document_id} r{revision}: "
+                    f"{len(reused)} segments reused, {len(spans) - len(reused)} analyzed")
+        return {
+            "documentId": document_id,
+            "revision": revision,
+            "text": text,
+            "entities": entities,
+            "reused_segments": len(reused),
+            "analyzed_segments": len(spans) - len(reused)
+        }
+
+    def forget(self, document_id: str) -> bool:
+        """删除文档的增量分析状态"""
+        with self._documents_lock:
+            return self._documents.pop(document_id, None) is not None
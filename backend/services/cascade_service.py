@@ -0,0 +1,104 @@
+from services.abbr_service import AbbrService
+from utils.admission import AdmissionController, LatencyMonitor
+from utils.cascade import CascadePolicy
+from utils.profiling import stage
+from typing import Dict, Optional
+import asyncio
+import logging
+import os
+import time
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class CascadeService:
+    """
+    置信度门控的级联服务
+    标准化结果中第一名明确的术语直接返回向量检索结果，只有模糊的术语才交给 LLM 在候选中重排；
+    缩写扩展的级联见 AbbrService.cascade_query_db，两者的升级率由 metrics 汇总
+    """
+    def __init__(self, abbr_service: AbbrService, controller: Optional[AdmissionController] = None,
+                 monitor: Optional[LatencyMonitor] = None):
+        """
+        Args:
+            abbr_service: 提供 LLM 重排（rerank_candidates）和缩写级联策略的缩写扩展服务
+            controller: LLM 重排使用的准入控制（与 /api/abbr 共用并发上限和队列），为 None 时直接在线程中调用
+            monitor: 记录 LLM 调用耗时的 LatencyMonitor，LLM 过慢时不再重排
+        """
+        self.abbr_service = abbr_service
+        self.controller = controller
+        self.monitor = monitor
+        self.std_policy = CascadePolicy.from_config("std")
+        # 交给 LLM 的上下文：术语所在位置前后各若干字符
+        self.context_chars = int(os.getenv("CASCADE_CONTEXT_CHARS", "200"))
+        # 同一请求中同时进行的 LLM 重排数
+        self.concurrency = int(os.getenv("CASCADE_LLM_CONCURRENCY", "4"))
+
+    def _context(self, text: str, term: str) -> str:
+        position = text.find(term)
+        if position < 0:
+            return text[:2 * self.context_chars]
+        return text[max(0, position - self.context_chars):position + len(term) + self.context_chars]
+
+    async def arerank(self, result: Dict, text: str, llm_options: Dict, mode: str = "cascade",
+                      deadline: Optional[float] = None) -> Dict:
+        """
+        对 /api/std 的结果做 LLM 重排
+
+        Args:
+            result: AnalysisService.standardize 的结果（可能来自缓存，不会被修改）
+            text: 原文，用于截取术语的上下文
+            llm_options: 语言模型配置选项
+            mode: cascade 只重排模糊的术语（计入升级率），always 重排全部术语
+            deadline: 请求的截止时间（time.monotonic() 时间基准），每次 LLM 调用都经过 controller 的准入控制
+
+        Returns:
+            新的结果字典：每个术语带 cascade（vector/llm_rerank），顶层带 escalated（调用 LLM 的术语数）；
+            LLM 调用失败、被准入控制拒绝或超过截止时间的术语保留向量检索结果；
+            LLM 过慢（monitor 建议降级）时全部保留向量检索结果，顶层带 degraded: true
+        """
+        if mode not in ("cascade", "always"):
+            raise ValueError(f"Unsupported rerank mode: {mode}")
+        terms = result.get("standardized_terms", [])
+        if self.monitor is not None and self.monitor.degraded():
+            return dict(result, standardized_terms=[dict(term, cascade="vector") for term in terms],
+                        escalated=0, degraded=True)
+        escalate = [mode == "always" or not self.std_policy.accepts(term["standardized_results"]) for term in terms]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        if self.controller is not None and deadline is None:
+            deadline = time.monotonic() + self.controller.default_timeout
+
+        async def rerank(term):
+            args = (term["original_term"], self._context(text, term["original_term"]),
+                    term["standardized_results"], llm_options)
+            async with semaphore:
+                if self.controller is None:
+                    return await asyncio.to_thread(self.abbr_service.rerank_candidates, *args)
+                return await self.controller.run(self.abbr_service.rerank_candidates, *args,
+                                                 deadline=deadline, monitor=self.monitor)
+
+        with stage("llm_rerank"):
+            reranked = await asyncio.gather(*[rerank(term) for term, escalated in zip(terms, escalate) if escalated],
+                                            return_exceptions=True)
+        reranked = iter(reranked)
+        cascaded = []
+        for term, escalated in zip(terms, escalate):
+            if not escalated:
+                cascaded.append(dict(term, cascade="vector"))
+                continue
+            candidates = next(reranked)
+            if isinstance(candidates, Exception):
+                logger.warning(f"LLM rerank failed for {term['original_term']!r}, using vector results: {candidates!r}")
+                candidates = term["standardized_results"]
+            cascaded.append(dict(term, standardized_results=candidates, cascade="llm_rerank"))
+        return dict(result, standardized_terms=cascaded, escalated=sum(escalate))
+
+    def metrics(self) -> Dict:
+        """各级联策略的阈值、直接返回 / 升级次数和升级率"""
+        return {
+            "abbr": self.abbr_service.cascade_policy.stats(),
+            "std": self.std_policy.stats(),
+        }
@@ -1,21 +1,29 @@
 from langchain_community.llms import Ollama
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
+from utils.fake_backends import FakeLLM
+from utils.spelling import LocalSpellingCorrector
+from utils.typo_generator import TypoGenerator
 from typing import Dict
 import os
+import threading
 import logging
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
 class CorrService:
     """
     医疗文本拼写纠正服务
     提供拼写错误纠正功能
     """
     def __init__(self):
-        pass
+        self._local_corrector = None  # 按需构建本地纠错词表
+        self._local_corrector_lock = threading.Lock()
+        self._typo_generators = {}  # 键盘布局 -> 错误生成器（相邻键表只计算一次）
         
     def _get_llm(self, llm_options: dict):
         """
@@ -41,6 +49,8 @@ class CorrService:
                 temperature=0,
                 api_key=os.getenv("OPENAI_API_KEY")
             )
+        elif provider == "fake":
+            return FakeLLM.from_options(llm_options)
         else:
             raise ValueError(f"Unsupported LLM provider: {provider}")
         
@@ -74,3 +84,57 @@ class CorrService:
             "input": text,
             "corrected_text": corrected_text
         }
+
+    def local_correct(self, text: str) -> Dict:
+        """
+        使用本地词表纠正拼写错误（LLM 过慢时的降级实现，见 utils/spelling.py）
+
+        Args:
+            text: 需要纠正的文本
+
+        Returns:
+            包含原始文本和纠正后文本的字典
+        """
+        with self._local_corrector_lock:
+            if self._local_corrector is None:
+                self._local_corrector = LocalSpellingCorrector.from_sources(
+                    os.path.join(DATA_DIR, "SNOMED_5000.csv"),
+                    os.path.join(DATA_DIR, "medical_abbreviations.json")
+                )
+        return {
+            "input": text,
+            "corrected_text": self._local_corrector.correct(text),
+            "method": "local_dictionary",
+            "degraded": True
+        }
+
+    def add_mistakes(self, text: str, error_options) -> Dict:
+        """
+        向文本中注入合成拼写错误（构造纠错评测数据，见 utils/typo_generator.py）
+
+        Args:
+            text: 原始文本
+            error_options: 错误生成选项（ErrorOptions 或字典），包含：
+                - probability: 每个单词出错的概率
+                - maxErrors: 最大错误数量
+                - keyboard: 键盘布局 (qwerty/azerty)
+                - seed: 随机种子，相同种子结果相同（可选）
+
+        Returns:
+            包含原始文本、错误文本和错误列表（真值）的字典
+        """
+        options = error_options.model_dump() if hasattr(error_options, "model_dump") else dict(error_options)
+        keyboard = options.get("keyboard", "qwerty")
+        generator = self._typo_generators.get(keyboard)
+        if generator is None:
+            generator = self._typo_generators.setdefault(keyboard, TypoGenerator(keyboard))
+        corrupted, edits = generator.corrupt(text,
+                                             probability=options.get("probability", 0.3),
+                                             max_errors=options.get("maxErrors", 5),
+                                             seed=options.get("seed"))
+        return {
+            "input": text,
+            "text_with_mistakes": corrupted,
+            "edits": edits,
+            "method": "add_mistakes"
+        }
@@ -0,0 +1,196 @@
+from services.std_service import StdService
+from utils.embedding_factory import embed_queries
+from utils.fusion import fuse
+from utils.profiling import stage
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import os
+import threading
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FEDERATED_FUSIONS = ("max", "rrf", "weighted")
+
+
+class FederatedStdService:
+    """
+    多集合联合检索服务
+    查询向量只计算一次，各集合（可以位于不同的数据库文件）并发检索，结果按 concept_id 融合，
+    总延迟取决于最慢的一个集合，而不是各集合之和。接口与 StdService 的检索方法一致。
+    """
+    # 同步检索共用的线程池（各集合的检索在其中并发执行）
+    _executor: Optional[ThreadPoolExecutor] = None
+    _executor_lock = threading.Lock()
+    # 进程内按配置共享的实例（见 create_std_service）
+    _instances: Dict[tuple, "FederatedStdService"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self,
+                 sources: List[Dict],
+                 provider="huggingface",
+                 model="BAAI/bge-m3",
+                 search_mode="dense",
+                 fusion="rrf",
+                 federated_fusion="max"):
+        """
+        初始化联合检索服务
+
+        Args:
+            sources: 检索的集合列表，每项包含 db_path、collection_name，可选 weight（融合权重，默认 1）
+            provider: 嵌入模型提供商，各集合必须使用同一个嵌入模型构建
+            model: 使用的模型名称
+            search_mode: 各集合的检索模式 (dense/hybrid)
+            fusion: hybrid 模式下集合内部的融合方法 (rrf/weighted)
+            federated_fusion: 跨集合按 concept_id 融合的方法：
+                max       取各集合中（加权后）最高的余弦相似度
+                rrf       倒数排名融合，同时被多个集合召回的概念排名靠前
+                weighted  各集合得分 min-max 归一化后加权求和
+        """
+        if not sources:
+            raise ValueError("Federated search requires at least one collection")
+        if federated_fusion not in FEDERATED_FUSIONS:
+            raise ValueError(f"Unsupported federated fusion method: {federated_fusion}")
+        self.federated_fusion = federated_fusion
+        self.weights = [float(source.get("weight", 1.0)) for source in sources]
+        # 同一个进程内嵌入模型只加载一次（EmbeddingFactory 缓存），各集合的 StdService 与单集合检索共用
+        self.services = [
+            StdService.get(provider=provider, model=model, db_path=source["db_path"],
+                           collection_name=source["collection_name"], search_mode=search_mode, fusion=fusion)
+            for source in sources
+        ]
+        self.embedding_func = self.services[0].embedding_func
+        # 结果中标记概念来自哪些集合；集合位于多个数据库时带上数据库名
+        single_db = len({source["db_path"] for source in sources}) == 1
+        self.names = [
+            source["collection_name"] if single_db
+            else f"{os.path.splitext(os.path.basename(source['db_path']))[0]}/{source['collection_name']}"
+            for source in sources
+        ]
+
+    @classmethod
+    def get(cls, sources: List[Dict], provider="huggingface", model="BAAI/bge-m3", search_mode="dense",
+            fusion="rrf", federated_fusion="max") -> "FederatedStdService":
+        """进程内按配置共享的实例，参数与构造函数相同"""
+        key = (tuple((source["db_path"], source["collection_name"], float(source.get("weight", 1.0)))
+                     for source in sources), provider, model, search_mode, fusion, federated_fusion)
+        with cls._instances_lock:
+            service = cls._instances.get(key)
+            if service is None:
+                service = cls(sources, provider, model, search_mode, fusion, federated_fusion)
+                cls._instances[key] = service
+            return service
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=int(os.getenv("STD_FEDERATED_WORKERS", "8")),
+                                                   thread_name_prefix="federated-search")
+            return cls._executor
+
+    def search_similar_terms(self, query: str, limit: int = 5) -> List[Dict]:
+        """
+        在全部集合中搜索与查询文本相似的医学术语
+
+        Returns:
+            与 StdService.search_similar_terms 相同格式的结果列表，每个结果额外包含：
+            - fusion_score: 跨集合融合得分（结果按其降序排列）
+            - sources: 召回该概念的集合
+            distance 为该概念在各集合中最高的余弦相似度，元数据取自该集合
+        """
+        with stage("embedding"):
+            query_embedding = self.embedding_func.embed_query(query)
+        with stage("federated_search"):
+            futures = [self._get_executor().submit(service.search_embedded, query, query_embedding, limit)
+                       for service in self.services]
+            per_source = [future.result() for future in futures]
+        return self._fuse(per_source, limit)
+
+    async def asearch_similar_terms(self, query: str, limit: int = 5, timeout: float = None) -> List[Dict]:
+        """
+        search_similar_terms 的异步版本，各集合通过 StdService.asearch_embedded 并发检索
+
+        任何一个集合超时（asyncio.TimeoutError）或熔断（CircuitOpenError）时整体抛出同样的异常
+        """
+        with stage("embedding"):
+            query_embedding = await asyncio.to_thread(self.embedding_func.embed_query, query)
+        with stage("federated_search"):
+            per_source = await asyncio.gather(*[
+                service.asearch_embedded(query, query_embedding, limit, timeout) for service in self.services
+            ])
+        return self._fuse(per_source, limit)
+
+    def search_similar_terms_batch(self, queries: List[str], limit: int = 5) -> List[List[Dict]]:
+        """批量检索：查询向量与单条检索一样用 embed_query 计算，各集合并发执行批量检索"""
+        unique = list(dict.fromkeys(queries))
+        if not unique:
+            return []
+        with stage("embedding"):
+            embeddings = embed_queries(self.embedding_func, unique)
+        with stage("federated_search"):
+            futures = [self._get_executor().submit(service.search_embedded_batch, unique, embeddings, limit)
+                       for service in self.services]
+            per_source = [future.result() for future in futures]
+        by_query = {query: self._fuse([results[i] for results in per_source], limit)
+                    for i, query in enumerate(unique)}
+        return [by_query[query] for query in queries]
+
+    def _fuse(self, per_source: List[List[Dict]], limit: int) -> List[Dict]:
+        """按 concept_id 融合各集合的结果"""
+        best: Dict[str, Dict] = {}
+        sources: Dict[str, List[str]] = {}
+        ranked_lists = []
+        for name, results in zip(self.names, per_source):
+            ranked, seen = [], set()
+            for result in results:
+                concept_id = result.get("concept_id")
+                # 同一集合中重复的概念只保留排名最高的一条
+                if concept_id in seen:
+                    continue
+                seen.add(concept_id)
+                ranked.append((concept_id, result["distance"]))
+                sources.setdefault(concept_id, []).append(name)
+                if concept_id not in best or result["distance"] > best[concept_id]["distance"]:
+                    best[concept_id] = result
+            ranked_lists.append(ranked)
+
+        fused = fuse(ranked_lists, self.federated_fusion, self.weights)[:limit]
+        return [dict(best[concept_id], fusion_score=score, sources=sources[concept_id])
+                for concept_id, score in fused]
+
+
+def create_std_service(embedding_options: Dict):
+    """
+    按 embeddingOptions 获取标准化服务：提供 collections 时为 FederatedStdService，否则为单集合的 StdService；
+    相同配置在进程内共用一个实例（StdService.get / FederatedStdService.get）
+
+    Args:
+        embedding_options: 嵌入模型配置选项，包含 provider、model、dbName、collectionName、searchMode、fusion，
+            以及可选的 collections（[{dbName, collectionName, weight}]）和 federatedFusion (max/rrf/weighted)
+    """
+    provider = embedding_options.get("provider", "huggingface")
+    model = embedding_options.get("model", "BAAI/bge-m3")
+    search_mode = embedding_options.get("searchMode", "dense")
+    fusion = embedding_options.get("fusion", "rrf")
+    collections = embedding_options.get("collections")
+    if collections:
+        default_db = embedding_options.get("dbName", "snomed_bge_m3")
+        sources = [{
+            "db_path": f"db/{collection.get('dbName') or default_db}.db",
+            "collection_name": collection["collectionName"],
+            "weight": collection.get("weight", 1.0),
+        } for collection in collections]
+        return FederatedStdService.get(sources, provider=provider, model=model, search_mode=search_mode,
+                                       fusion=fusion, federated_fusion=embedding_options.get("federatedFusion", "max"))
+    return StdService.get(
+        provider=provider,
+        model=model,
+        db_path=f"db/{embedding_options.get('dbName', 'snomed_bge_m3')}.db",
+        collection_name=embedding_options.get("collectionName", "concepts_only_name"),
+        search_mode=search_mode,
+        fusion=fusion
+    )
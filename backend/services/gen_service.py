@@ -1,7 +1,9 @@
 from langchain_community.llms import Ollama
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from typing import Dict, List
+from utils.fake_backends import FakeLLM
+from typing import AsyncIterator, Dict, List
+import asyncio
 import os
 import logging
 
@@ -9,13 +11,23 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 并行生成病历时的各个部分：(标题, 该部分的写作要求)
+NOTE_SECTIONS = [
+    ("Patient Information", "Summarize the patient's identifying information and relevant medical history."),
+    ("Chief Complaint", "State the chief complaint in one or two sentences, in the patient's terms where possible."),
+    ("History of Present Illness", "Describe the onset, course, character and associated symptoms of the present illness."),
+    ("Physical Examination", "Document the physical examination findings consistent with the symptoms and diagnosis."),
+    ("Assessment and Plan", "Give the assessment and the management plan based on the diagnosis and treatment."),
+]
+
 class GenService:
     """
     医疗文本生成服务
     提供医疗笔记、鉴别诊断和治疗计划等医疗文本的生成功能
     """
     def __init__(self):
-        pass
+        # 并行生成病历时同时进行的 LLM 调用数
+        self.section_concurrency = int(os.getenv("GEN_SECTION_CONCURRENCY", str(len(NOTE_SECTIONS))))
         
     def _get_llm(self, llm_options: dict):
         """
@@ -41,6 +53,8 @@ class GenService:
                 temperature=0.7,  # 稍微提高温度以获得更有创意的输出
                 api_key=os.getenv("OPENAI_API_KEY")
             )
+        elif provider == "fake":
+            return FakeLLM.from_options(llm_options)
         else:
             raise ValueError(f"Unsupported LLM provider: {provider}")
 
@@ -91,13 +105,96 @@ class GenService:
         ])
         
         chain = prompt | llm
-        result = chain.invoke({
+        result = chain.invoke(self._note_inputs(patient_info, symptoms, diagnosis, treatment))
+        
+        return {
+            "input": {
+                "patient_info": patient_info,
+                "symptoms": symptoms,
+                "diagnosis": diagnosis,
+                "treatment": treatment
+            },
+            "output": result.content if hasattr(result, 'content') else str(result)
+        }
+
+    def _note_inputs(self, patient_info: Dict, symptoms: List[str], diagnosis: str, treatment: str) -> Dict:
+        """病历生成提示词的输入变量（各部分共享）"""
+        return {
             "patient_info": str(patient_info),
             "symptoms": "\n".join(symptoms),
             "diagnosis": diagnosis,
             "treatment": treatment
-        })
-        
+        }
+
+    async def astream_medical_note(self,
+                                   patient_info: Dict,
+                                   symptoms: List[str],
+                                   diagnosis: str,
+                                   treatment: str,
+                                   llm_options: dict) -> AsyncIterator[Dict]:
+        """
+        并行生成病历的各个部分，按部分顺序逐个产出
+
+        每个部分是一次独立的 LLM 调用（共享相同的患者信息、症状、诊断和治疗输入），
+        最多 section_concurrency 个同时进行；前面的部分完成后立即产出，总耗时接近最慢的部分。
+        迭代提前结束（客户端断开、超时）时取消尚未完成的调用。
+
+        Yields:
+            {"index": 序号（从 1 开始）, "section": 标题, "text": 生成的内容}
+        """
+        llm = self._get_llm(llm_options)
+        inputs = self._note_inputs(patient_info, symptoms, diagnosis, treatment)
+        semaphore = asyncio.Semaphore(max(self.section_concurrency, 1))
+
+        async def generate(title: str, instruction: str) -> str:
+            others = ", ".join(name for name, _ in NOTE_SECTIONS if name != title)
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", f"""You are a professional medical note writer.
+            You are writing ONLY the "{title}" section of a structured medical note;
+            the other sections ({others}) are written separately.
+            {instruction}
+            Do NOT include the section heading or any other section. Be concise.
+            Use medical terminology appropriately and maintain a professional tone."""),
+                ("human", """
+            Patient Information:
+            {patient_info}
+            
+            Symptoms:
+            {symptoms}
+            
+            Diagnosis:
+            {diagnosis}
+            
+            Treatment:
+            {treatment}
+            """)
+            ])
+            async with semaphore:
+                result = await (prompt | llm).ainvoke(inputs)
+            return result.content if hasattr(result, 'content') else str(result)
+
+        tasks = [asyncio.ensure_future(generate(title, instruction)) for title, instruction in NOTE_SECTIONS]
+        try:
+            for index, ((title, _), task) in enumerate(zip(NOTE_SECTIONS, tasks), start=1):
+                yield {"index": index, "section": title, "text": (await task).strip()}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def agenerate_medical_note_parallel(self,
+                                              patient_info: Dict,
+                                              symptoms: List[str],
+                                              diagnosis: str,
+                                              treatment: str,
+                                              llm_options: dict) -> Dict:
+        """
+        generate_medical_note 的并行版本：各部分并行生成后按顺序拼接
+
+        Returns:
+            与 generate_medical_note 相同的字典，另含 sections（各部分的标题和内容）
+        """
+        sections = [section async for section in
+                    self.astream_medical_note(patient_info, symptoms, diagnosis, treatment, llm_options)]
         return {
             "input": {
                 "patient_info": patient_info,
@@ -105,7 +202,8 @@ class GenService:
                 "diagnosis": diagnosis,
                 "treatment": treatment
             },
-            "output": result.content if hasattr(result, 'content') else str(result)
+            "output": "\n\n".join(f"{section['index']}. {section['section']}\n{section['text']}" for section in sections),
+            "sections": sections
         }
 
     def generate_differential_diagnosis(self,
@@ -1,22 +1,139 @@
+from concurrent.futures import ProcessPoolExecutor
 from transformers import pipeline
+from utils.text_segments import split_sentences
+from utils.fast_ner import FastTokenClassifier
+import multiprocessing
+import threading
 import torch
 import logging
+import os
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 并行 NER 工作进程中的模型副本
+_worker_pipe = None
+
+
+def available_cores():
+    """当前进程可用的 CPU 核心列表（考虑 taskset / cgroup 的亲和性限制）"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _load_pipe(model_name, device, fast_path):
+    """加载 NER 模型：fast_path 时使用带分词缓存的 FastTokenClassifier，否则使用 transformers pipeline"""
+    if fast_path:
+        return FastTokenClassifier(model_name, device=device,
+                                   cache_size=int(os.getenv("NER_TOKEN_CACHE_SIZE", "10000")))
+    return pipeline("token-classification",
+                    model=model_name,
+                    aggregation_strategy='simple',
+                    device=device)
+
+
+def _init_worker(model_name, core_slices, fast_path=False):
+    """工作进程初始化：绑定到一组核心，按核心数设置 torch 线程数并加载模型副本"""
+    global _worker_pipe
+    cores = core_slices.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    torch.set_num_interop_threads(1)
+    _worker_pipe = _load_pipe(model_name, -1, fast_path)
+
+
+def _recognize_chunk(text):
+    """在工作进程中识别一个文本块，返回可序列化的实体列表（偏移相对文本块）"""
+    return [dict(entity, score=float(entity['score'])) for entity in _worker_pipe(text)]
+
+
 class NERService:
     """
     医学术语命名实体识别服务
     使用 Clinical-AI-Apollo/Medical-NER 模型进行医疗文本的实体识别
     """
-    def __init__(self):
+    model_name = "Clinical-AI-Apollo/Medical-NER"
+
+    def __init__(self, parallel_workers=None, parallel_min_chars=None, fast_path=None):
+        """
+        Args:
+            parallel_workers: 长文本并行 NER 的工作进程数，"auto" 按可用核心数决定，0 关闭；
+                默认读取环境变量 NER_PARALLEL_WORKERS（默认 0）
+            parallel_min_chars: 文本长度达到该值才走并行路径，默认读取 NER_PARALLEL_MIN_CHARS（默认 2000）
+            fast_path: 使用 fast tokenizer + 句子分词缓存 + 数组化聚合的推理实现（utils/fast_ner.py），
+                默认读取环境变量 NER_FAST_PATH（默认 0）
+        """
         # 初始化 NER 模型，使用 GPU 如果可用
-        self.pipe = pipeline("token-classification", 
-                           model="Clinical-AI-Apollo/Medical-NER", 
-                           aggregation_strategy='simple',
-                           device=0 if torch.cuda.is_available() else -1)
+        if fast_path is None:
+            fast_path = os.getenv("NER_FAST_PATH", "0") == "1"
+        self.fast_path = fast_path
+        self.pipe = _load_pipe(self.model_name, 0 if torch.cuda.is_available() else -1, fast_path)
+
+        if parallel_workers is None:
+            parallel_workers = os.getenv("NER_PARALLEL_WORKERS", "0")
+        cores = available_cores()
+        if parallel_workers == "auto":
+            # 每个副本 2 个线程：BERT 类小模型单线程效率最高的区间，同时保持足够的进程并发
+            parallel_workers = max(1, len(cores) // 2)
+        self.parallel_workers = min(int(parallel_workers), len(cores))
+        self.parallel_min_chars = int(parallel_min_chars or os.getenv("NER_PARALLEL_MIN_CHARS", "2000"))
+        if self.parallel_workers > 0 and torch.cuda.is_available():
+            logger.info("GPU available, parallel CPU NER disabled")
+            self.parallel_workers = 0
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        """延迟创建进程池（在 serve.py fork 出 worker 之后），每个进程独占一组核心"""
+        with self._pool_lock:
+            if self._pool is None:
+                cores = available_cores()
+                per_worker = max(1, len(cores) // self.parallel_workers)
+                # spawn：不继承父进程的 torch 线程池和模型状态
+                context = multiprocessing.get_context("spawn")
+                core_slices = context.Queue()
+                for i in range(self.parallel_workers):
+                    core_slices.put(cores[i * per_worker:(i + 1) * per_worker])
+                self._pool = ProcessPoolExecutor(max_workers=self.parallel_workers,
+                                                 mp_context=context,
+                                                 initializer=_init_worker,
+                                                 initargs=(self.model_name, core_slices, self.fast_path))
+                logger.info(f"Started {self.parallel_workers} NER workers with {per_worker} threads each")
+            return self._pool
+
+    def _recognize(self, text):
+        """
+        识别实体：长文本按句子切成块，分发到进程池并行识别，再把偏移量换算回全文
+        """
+        if self.parallel_workers == 0 or len(text) < self.parallel_min_chars:
+            return self.pipe(text)
+
+        # 把句子合并成大小接近的块，每个工作进程约分到 4 块，兼顾负载均衡和调度开销
+        target = max(len(text) // (self.parallel_workers * 4), 200)
+        chunks = []
+        chunk_start = chunk_end = None
+        for start, end in split_sentences(text):
+            if chunk_start is not None and end - chunk_start > target:
+                chunks.append((chunk_start, chunk_end))
+                chunk_start = None
+            if chunk_start is None:
+                chunk_start = start
+            chunk_end = end
+        if chunk_start is not None:
+            chunks.append((chunk_start, chunk_end))
+
+        pool = self._get_pool()
+        results = pool.map(_recognize_chunk, [text[start:end] for start, end in chunks])
+        entities = []
+        for (offset, _), chunk_entities in zip(chunks, results):
+            for entity in chunk_entities:
+                entity['start'] += offset
+                entity['end'] += offset
+                entities.append(entity)
+        return entities
   
     def process(self, text, options, term_types):
         """
@@ -31,8 +148,29 @@ class NERService:
             包含识别出的实体和原始文本的字典
         """
         # 使用模型进行实体识别
-        result = self.pipe(text)
-        
+        result = self._recognize(text)
+        return self._postprocess(result, text, options, term_types)
+
+    def process_batch(self, texts, options, term_types, batch_size=32):
+        """
+        批量识别多段文本（离线批处理用），模型以 batch_size 为单位做批量推理
+
+        Args:
+            texts: 文本列表
+            options: 处理选项
+            term_types: 需要识别的术语类型
+            batch_size: 模型推理的批大小
+
+        Returns:
+            与 texts 一一对应的 process 结果列表
+        """
+        if not texts:
+            return []
+        results = self.pipe(list(texts), batch_size=batch_size)
+        return [self._postprocess(result, text, options, term_types) for text, result in zip(texts, results)]
+
+    def _postprocess(self, result, text, options, term_types):
+        """合并、去重叠、过滤模型输出的实体"""
         # 确保结果是实体列表
         if isinstance(result, dict):
             result = result.get('entities', [])
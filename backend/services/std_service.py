@@ -1,8 +1,19 @@
-from pymilvus import MilvusClient
+from pymilvus import MilvusClient, DataType
+import numpy as np
 from dotenv import load_dotenv
-from utils.embedding_factory import EmbeddingFactory
+from utils.embedding_factory import EmbeddingFactory, embed_queries
 from utils.embedding_config import EmbeddingProvider, EmbeddingConfig
+from utils.profiling import stage
+from utils.local_index import LocalIndex, index_dir_for
+from utils.concept_store import ConceptStore, FIELDS as CONCEPT_FIELDS
+from utils.sparse_encoder import BM25SparseEncoder, SparseIndex, BM25_FILE
+from utils.fusion import fuse
+from utils.milvus_pool import MilvusClientPool
+from utils.snomed_hierarchy import SnomedHierarchy
+from utils.index_bundle import BundleError, check_model, read_manifest
+import asyncio
 import os
+import threading
 from typing import List, Dict
 import logging
 
@@ -17,25 +28,44 @@ class StdService:
     医学术语标准化服务
     使用向量数据库进行医学术语的标准化和相似度搜索
     """
+    # 已确认与嵌入模型一致的索引目录 (index_dir, model)，模型指纹每个进程只比对一次
+    _verified_indexes = set()
+    _verified_lock = threading.Lock()
+    # 进程内按配置共享的实例（见 get）
+    _instances: Dict[tuple, "StdService"] = {}
+    _instances_lock = threading.Lock()
+
     def __init__(self, 
                  provider="huggingface",
                  model="BAAI/bge-m3",
                  db_path="db/snomed_bge_m3.db",
-                 collection_name="concepts_only_name"):
+                 collection_name="concepts_only_name",
+                 search_mode="dense",
+                 fusion="rrf"):
         """
         初始化标准化服务
         
         Args:
-            provider: 嵌入模型提供商 (openai/bedrock/huggingface)
+            provider: 嵌入模型提供商 (openai/bedrock/huggingface/fake)
             model: 使用的模型名称
             db_path: Milvus 数据库路径
             collection_name: 集合名称
+            search_mode: 检索模式 (dense/hybrid)，hybrid 同时使用 BM25 稀疏向量做词法匹配
+            fusion: hybrid 模式下的融合方法 (rrf/weighted)
+
+        如果存在由 tools/export_local_index.py 导出的本地索引（db/<dbName>_index/<collectionName>），
+        优先使用内存映射的本地索引检索，不再连接 Milvus；
+        如果只导出了概念存储（--metadata-only），Milvus 只返回主键和距离，元数据由概念存储补全。
+        索引目录中有索引包的 manifest.json（tools/index_bundle.py）时，其嵌入模型必须与 model 一致，否则抛出 BundleError。
+        如果存在由 tools/export_snomed_hierarchy.py 导出的层级快照（SNOMED_HIERARCHY_DIR，默认 db/snomed_hierarchy），
+        可以用 search_within 把结果限定在某个概念的下位概念中。
         """
         # 根据 provider 字符串匹配正确的枚举值
         provider_mapping = {
             'openai': EmbeddingProvider.OPENAI,
             'bedrock': EmbeddingProvider.BEDROCK,
-            'huggingface': EmbeddingProvider.HUGGINGFACE
+            'huggingface': EmbeddingProvider.HUGGINGFACE,
+            'fake': EmbeddingProvider.FAKE
         }
         
         # 创建 embedding 函数
@@ -49,10 +79,84 @@ class StdService:
         )
         self.embedding_func = EmbeddingFactory.create_embedding_function(config)
         
-        # 连接 Milvus
-        self.client = MilvusClient(db_path)
+        # 优先使用本地索引，否则连接 Milvus
         self.collection_name = collection_name
-        self.client.load_collection(self.collection_name)
+        index_dir = index_dir_for(db_path, collection_name)
+        self._check_index_model(index_dir, model)
+        self.local_index = LocalIndex.open(index_dir) if LocalIndex.exists(index_dir) else None
+        if self.local_index is None:
+            self.concept_store = ConceptStore.open(index_dir) if ConceptStore.exists(index_dir) else None
+            self.client = MilvusClient(db_path)
+            self.client.load_collection(self.collection_name)
+            # 异步检索路径使用的客户端池（线程和连接在第一次异步调用时才创建）
+            self.pool = MilvusClientPool.get(db_path)
+            # FLOAT16_VECTOR 集合的查询向量需要以 float16 数组传入
+            fields = self.client.describe_collection(self.collection_name)["fields"]
+            self.vector_dtype = next((np.float16 for field in fields
+                                      if field["name"] == "vector" and field["type"] == DataType.FLOAT16_VECTOR),
+                                     None)
+            # 入库时创建了 vector_reduced 字段的集合，先在低维字段上粗排再全维重排
+            self.reduced_dim = next((int(field["params"]["dim"]) for field in fields
+                                     if field["name"] == "vector_reduced"), None)
+            self.rerank_candidates = int(os.getenv("STD_RERANK_CANDIDATES", "100"))
+        else:
+            self.concept_store = self.local_index.concepts
+
+        # hybrid 模式需要入库时拟合的 BM25 编码器（create_milvus_db.py 中 enable_sparse = True）
+        if search_mode not in ("dense", "hybrid"):
+            raise ValueError(f"Unsupported search mode: {search_mode}")
+        self.search_mode = search_mode
+        self.fusion = fusion
+        self.sparse_encoder = None
+        self.sparse_index = None
+        if search_mode == "hybrid":
+            encoder_path = os.path.join(index_dir, BM25_FILE)
+            if not os.path.isfile(encoder_path):
+                raise ValueError(f"Hybrid search requires a BM25 encoder at {encoder_path}")
+            self.sparse_encoder = BM25SparseEncoder.load(encoder_path)
+            if self.local_index is not None:
+                if not SparseIndex.exists(index_dir):
+                    raise ValueError(f"Local index at {index_dir} has no sparse postings; re-export it")
+                self.sparse_index = SparseIndex(index_dir)
+
+        hierarchy_dir = os.getenv("SNOMED_HIERARCHY_DIR", "db/snomed_hierarchy")
+        self.hierarchy = SnomedHierarchy.open(hierarchy_dir) if SnomedHierarchy.exists(hierarchy_dir) else None
+
+    @classmethod
+    def get(cls,
+            provider="huggingface",
+            model="BAAI/bge-m3",
+            db_path="db/snomed_bge_m3.db",
+            collection_name="concepts_only_name",
+            search_mode="dense",
+            fusion="rrf") -> "StdService":
+        """
+        进程内按配置共享的实例，参数与构造函数相同
+
+        各请求共用同一个实例，集合只加载一次，并发的检索不会因为其他请求的实例被回收而失去已加载的集合
+        """
+        key = (provider, model, db_path, collection_name, search_mode, fusion)
+        with cls._instances_lock:
+            service = cls._instances.get(key)
+            if service is None:
+                service = cls(*key)
+                cls._instances[key] = service
+            return service
+
+    def _check_index_model(self, index_dir: str, model: str):
+        """索引包或本地索引记录的嵌入模型与当前配置不一致时抛出 BundleError"""
+        key = (os.path.abspath(index_dir), model)
+        if key in StdService._verified_indexes:
+            return
+        manifest = read_manifest(index_dir)
+        if manifest is not None:
+            check_model(manifest, model, self.embedding_func)
+        elif LocalIndex.exists(index_dir):
+            built_with = LocalIndex.open(index_dir).model
+            if built_with and built_with != model:
+                raise BundleError(f"Local index at {index_dir} was built with {built_with}, but {model} is configured")
+        with StdService._verified_lock:
+            StdService._verified_indexes.add(key)
 
     def search_similar_terms(self, query: str, limit: int = 5) -> List[Dict]:
         """
@@ -73,14 +177,105 @@ class StdService:
             - concept_code: 概念代码
             - synonyms: 同义词
             - distance: 相似度距离
+            hybrid 模式下额外包含 fusion_score（融合得分，结果按其降序排列）
         """
         # 获取查询的向量表示
-        query_embedding = self.embedding_func.embed_query(query)
+        with stage("embedding"):
+            query_embedding = self.embedding_func.embed_query(query)
+        return self.search_embedded(query, query_embedding, limit)
+
+    def search_within(self, query: str, ancestor_code: str, limit: int = 5, candidates: int = 50) -> List[Dict]:
+        """
+        只返回属于 ancestor_code（SNOMED 概念代码）本身或其下位概念的检索结果
+
+        Args:
+            query: 查询文本
+            ancestor_code: 限定范围的上位概念代码，如 404684003（Clinical finding）
+            limit: 返回结果的最大数量
+            candidates: 过滤前检索的候选数量
+
+        Returns:
+            与 search_similar_terms 相同格式的结果列表
+        """
+        if self.hierarchy is None:
+            raise ValueError("search_within requires a SNOMED hierarchy snapshot (tools/export_snomed_hierarchy.py)")
+        results = self.search_similar_terms(query, max(limit, candidates))
+        with stage("hierarchy_filter"):
+            results = [result for result in results
+                       if self.hierarchy.is_a(result.get("concept_code"), ancestor_code)]
+        return results[:limit]
+
+    def search_similar_terms_batch(self, queries: List[str], limit: int = 5) -> List[List[Dict]]:
+        """
+        批量检索，结果与逐条调用 search_similar_terms 相同
+
+        重复的查询只检索一次；查询向量与 search_similar_terms 一样用 embed_query 计算（见 embed_queries），
+        本地索引和 Milvus 稠密检索以批量方式执行。
+
+        Args:
+            queries: 查询文本列表
+            limit: 每个查询返回结果的最大数量
+
+        Returns:
+            与 queries 一一对应的结果列表
+        """
+        unique = list(dict.fromkeys(queries))
+        if not unique:
+            return []
+        with stage("embedding"):
+            embeddings = embed_queries(self.embedding_func, unique)
+        by_query = dict(zip(unique, self.search_embedded_batch(unique, embeddings, limit)))
+        return [by_query[query] for query in queries]
+
+    def search_embedded_batch(self, queries: List[str], embeddings, limit: int = 5) -> List[List[Dict]]:
+        """用已计算好的查询向量批量检索（queries 不去重），返回与 queries 一一对应的结果列表"""
+        if self.search_mode == "hybrid" or (self.local_index is None and self.reduced_dim):
+            results = [self.search_embedded(query, embedding, limit) for query, embedding in zip(queries, embeddings)]
+        elif self.local_index is not None:
+            with stage("local_index"):
+                results = [[dict(self.local_index.metadata(row), distance=score) for row, score in hits]
+                           for hits in self.local_index.search_batch(embeddings, limit)]
+        else:
+            with stage("milvus"):
+                search_result = self.client.search(
+                    collection_name=self.collection_name,
+                    data=[self._milvus_vector(embedding) for embedding in embeddings],
+                    anns_field="vector",
+                    limit=limit,
+                    output_fields=[] if self.concept_store is not None else CONCEPT_FIELDS,
+                )
+            with stage("hydrate"):
+                if self.concept_store is not None:
+                    # 合并成一次补全，缺失主键的回退查询也只有一次
+                    flat = self._hydrate([hit for hits in search_result for hit in hits])
+                    results, offset = [], 0
+                    for hits in search_result:
+                        results.append(flat[offset:offset + len(hits)])
+                        offset += len(hits)
+                else:
+                    results = [[dict({name: hit['entity'].get(name) for name in CONCEPT_FIELDS},
+                                     distance=float(hit['distance'])) for hit in hits]
+                               for hits in search_result]
+        return results
+
+    def search_embedded(self, query: str, query_embedding, limit: int = 5) -> List[Dict]:
+        """按检索模式用已计算好的查询向量检索（多个集合共用同一个查询向量时使用，见 FederatedStdService）"""
+        if self.search_mode == "hybrid":
+            return self._hybrid_search(query, query_embedding, limit)
         
+        if self.local_index is not None:
+            with stage("local_index"):
+                hits = self.local_index.search(query_embedding, limit)
+                return [dict(self.local_index.metadata(row), distance=score) for row, score in hits]
+
+        if self.reduced_dim:
+            return self._reduced_search(query_embedding, limit)
+
         # 设置搜索参数
         search_params = {
             "collection_name": self.collection_name,
-            "data": [query_embedding],
+            "data": [self._milvus_vector(query_embedding)],
+            "anns_field": "vector",
             "limit": limit,
             "output_fields": [
                 "concept_id", "concept_name", "domain_id", 
@@ -89,9 +284,17 @@ class StdService:
             ],
             # "filter": "domain_id == 'Condition'"
         }
+        if self.concept_store is not None:
+            # 只取主键和距离，元数据从本地概念存储读取
+            search_params["output_fields"] = []
         
         # 搜索相似项
-        search_result = self.client.search(**search_params)
+        with stage("milvus"):
+            search_result = self.client.search(**search_params)
+
+        if self.concept_store is not None:
+            with stage("hydrate"):
+                return self._hydrate(search_result[0])
 
         results = []
         for hit in search_result[0]:
@@ -109,7 +312,167 @@ class StdService:
 
         return results
 
-    def __del__(self):
-        """清理资源，释放集合"""
-        if hasattr(self, 'client') and hasattr(self, 'collection_name'):
-            self.client.release_collection(self.collection_name)
\ No newline at end of file
+    async def asearch_similar_terms(self, query: str, limit: int = 5, timeout: float = None) -> List[Dict]:
+        """
+        search_similar_terms 的异步版本
+
+        嵌入计算在线程中执行；稠密模式下的 Milvus 检索通过客户端池调用，
+        带截止时间、退避重试和熔断（见 utils/milvus_pool.py），超时抛出 asyncio.TimeoutError，
+        熔断时抛出 CircuitOpenError。本地索引、hybrid 和降维检索整体在线程中执行同步版本。
+
+        Args:
+            query: 查询文本
+            limit: 返回结果的最大数量
+            timeout: Milvus 调用的截止时间（秒），默认使用池的 MILVUS_TIMEOUT
+
+        Returns:
+            与 search_similar_terms 相同
+        """
+        with stage("embedding"):
+            query_embedding = await asyncio.to_thread(self.embedding_func.embed_query, query)
+        return await self.asearch_embedded(query, query_embedding, limit, timeout)
+
+    async def asearch_embedded(self, query: str, query_embedding, limit: int = 5, timeout: float = None) -> List[Dict]:
+        """search_embedded 的异步版本，Milvus 调用方式与 asearch_similar_terms 相同"""
+        if self.local_index is not None or self.search_mode == "hybrid" or self.reduced_dim:
+            return await asyncio.to_thread(self.search_embedded, query, query_embedding, limit)
+
+        output_fields = [] if self.concept_store is not None else CONCEPT_FIELDS
+        with stage("milvus"):
+            search_result = await self.pool.call(
+                "search",
+                timeout=timeout,
+                collection_name=self.collection_name,
+                data=[self._milvus_vector(query_embedding)],
+                anns_field="vector",
+                limit=limit,
+                output_fields=output_fields,
+            )
+
+        if self.concept_store is not None:
+            with stage("hydrate"):
+                return await asyncio.to_thread(self._hydrate, search_result[0])
+        return [dict({name: hit['entity'].get(name) for name in CONCEPT_FIELDS}, distance=float(hit['distance']))
+                for hit in search_result[0]]
+
+    def _milvus_vector(self, query_embedding):
+        """按集合的向量字段类型转换查询向量"""
+        if self.vector_dtype is None:
+            return query_embedding
+        return np.asarray(query_embedding, dtype=self.vector_dtype)
+
+    def _reduced_search(self, query_embedding, limit: int) -> List[Dict]:
+        """
+        两阶段检索：在 vector_reduced（截断前缀）上取 rerank_candidates 个候选，再用全维向量精确重排
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        reduced_query = query[:self.reduced_dim]
+        with stage("milvus"):
+            candidates = self.client.search(
+                collection_name=self.collection_name,
+                data=[(reduced_query / (np.linalg.norm(reduced_query) or 1.0)).tolist()],
+                anns_field="vector_reduced",
+                limit=max(limit, self.rerank_candidates),
+                output_fields=["vector"],
+            )[0]
+
+        with stage("rerank"):
+            if not candidates:
+                return []
+            full = np.asarray([np.frombuffer(hit['entity']['vector'], dtype=np.float16)
+                               if isinstance(hit['entity']['vector'], bytes) else hit['entity']['vector']
+                               for hit in candidates], dtype=np.float32)
+            full /= np.maximum(np.linalg.norm(full, axis=1, keepdims=True), 1e-12)
+            exact = full @ query
+            best = np.argsort(-exact)[:limit]
+
+        with stage("hydrate"):
+            return self._hydrate([{'id': candidates[i]['id'], 'distance': float(exact[i])} for i in best])
+
+    def _hybrid_search(self, query: str, query_embedding, limit: int) -> List[Dict]:
+        """
+        稠密向量 + BM25 稀疏向量的混合检索
+
+        两路各取 limit 个候选后按 self.fusion 融合，distance 仍为与查询的稠密余弦相似度。
+        """
+        sparse_query = self.sparse_encoder.encode_query(query)
+
+        if self.local_index is not None:
+            with stage("local_index"):
+                dense_hits = self.local_index.search(query_embedding, limit)
+                sparse_hits = self.sparse_index.search(sparse_query, limit) if sparse_query else []
+                fused = fuse([dense_hits, sparse_hits], self.fusion)[:limit]
+                rows = [row for row, _ in fused]
+                distances = self.local_index.scores(rows, query_embedding)
+                return [dict(self.local_index.metadata(row), distance=distance, fusion_score=score)
+                        for (row, score), distance in zip(fused, distances)]
+
+        with stage("milvus"):
+            dense_result = self.client.search(
+                collection_name=self.collection_name,
+                data=[self._milvus_vector(query_embedding)],
+                anns_field="vector",
+                limit=limit,
+                output_fields=[],
+            )[0]
+            sparse_result = []
+            if sparse_query:
+                sparse_result = self.client.search(
+                    collection_name=self.collection_name,
+                    data=[sparse_query],
+                    anns_field="sparse_vector",
+                    limit=limit,
+                    output_fields=[],
+                    search_params={"metric_type": "IP"},
+                )[0]
+            fused = fuse([[(hit['id'], hit['distance']) for hit in dense_result],
+                          [(hit['id'], hit['distance']) for hit in sparse_result]], self.fusion)[:limit]
+
+            # 只被词法检索召回的概念，补算其稠密相似度
+            distances = {hit['id']: hit['distance'] for hit in dense_result}
+            lexical_only = [pk for pk, _ in fused if pk not in distances]
+            if lexical_only:
+                rescored = self.client.search(
+                    collection_name=self.collection_name,
+                    data=[self._milvus_vector(query_embedding)],
+                    anns_field="vector",
+                    filter=f"id in {lexical_only}",
+                    limit=len(lexical_only),
+                    output_fields=[],
+                )[0]
+                distances.update({hit['id']: hit['distance'] for hit in rescored})
+
+        with stage("hydrate"):
+            results = self._hydrate([{'id': pk, 'distance': distances.get(pk, 0.0)} for pk, _ in fused])
+        for result, (_, score) in zip(results, fused):
+            result["fusion_score"] = score
+        return results
+
+    def _hydrate(self, hits) -> List[Dict]:
+        """
+        根据 Milvus 返回的主键从概念存储补全元数据
+
+        概念存储落后于集合（导出后又插入了新概念）或没有导出概念存储时，缺失的主键回退到 Milvus 查询。
+        """
+        if self.concept_store is not None:
+            rows = self.concept_store.rows_for_pks(hit['id'] for hit in hits)
+        else:
+            rows = [-1] * len(hits)
+        missing = [hit['id'] for hit, row in zip(hits, rows) if row < 0]
+        fallback = {}
+        if missing:
+            records = self.client.get(collection_name=self.collection_name, ids=missing,
+                                      output_fields=CONCEPT_FIELDS)
+            fallback = {record['id']: record for record in records}
+
+        results = []
+        for hit, row in zip(hits, rows):
+            if row >= 0:
+                result = self.concept_store.get(int(row))
+            else:
+                record = fallback.get(hit['id'], {})
+                result = {name: record.get(name) for name in CONCEPT_FIELDS}
+            result["distance"] = float(hit['distance'])
+            results.append(result)
+        return results
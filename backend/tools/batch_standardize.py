@@ -0,0 +1,327 @@
+"""
+离线批量 NER + 术语标准化（不经过 FastAPI / uvicorn）
+
+流式读取 JSONL / CSV / Parquet 中的病历，按批做 NER（NERService.process_batch）和标准化
+（StdService.search_similar_terms_batch，同一批内重复的实体只检索一次），结果增量写入 JSONL 或 Parquet。
+每写入 --checkpoint-every 条记录保存一次断点，中断后用相同参数重新运行即从断点继续。
+
+--workers 大于 1 时使用进程池，每个进程加载一份模型，torch 线程数按可用核心数平均分配；
+多进程需要本地索引（tools/export_local_index.py）或 Milvus 服务端，Milvus Lite 文件不能被多个进程同时打开。
+
+输出：每条记录包含 id、entity_count 和 entities（实体及其标准化结果）；
+Parquet 输出为目录（part-00000.parquet, ...），entities 列以 JSON 字符串保存，避免不同批次推断出不同的嵌套结构。
+
+用法（在项目根目录执行）：
+    python backend/tools/batch_standardize.py --input notes.jsonl --output results.jsonl --text-field text --id-field note_id
+    python backend/tools/batch_standardize.py --input notes.parquet --output results_parquet --workers 4
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+
+from tqdm import tqdm
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 设置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 工作进程中的服务实例
+_ner_service = None
+_std_service = None
+_settings = None
+
+
+def detect_format(path, explicit=None):
+    """根据扩展名判断文件格式"""
+    if explicit:
+        return explicit
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if extension in (".csv", ".tsv"):
+        return "csv"
+    if extension in (".parquet", ".pq") or os.path.isdir(path):
+        return "parquet"
+    raise ValueError(f"Cannot infer format of {path}, use --input-format/--output-format")
+
+
+def read_records(path, fmt, text_field, id_field, read_batch_size=10000):
+    """流式读取 (id, text)，没有 id 字段时以记录序号作为 id"""
+    if fmt == "jsonl":
+        with open(path, encoding="utf-8") as f:
+            index = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                yield str(record.get(id_field, index)), record.get(text_field) or ""
+                index += 1
+    elif fmt == "csv":
+        csv.field_size_limit(sys.maxsize)
+        with open(path, newline="", encoding="utf-8") as f:
+            delimiter = "\t" if path.endswith(".tsv") else ","
+            for index, record in enumerate(csv.DictReader(f, delimiter=delimiter)):
+                yield str(record.get(id_field) or index), record.get(text_field) or ""
+    else:
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        columns = [text_field] + ([id_field] if id_field in parquet_file.schema_arrow.names else [])
+        index = 0
+        for batch in parquet_file.iter_batches(batch_size=read_batch_size, columns=columns):
+            texts = batch.column(text_field).to_pylist()
+            ids = batch.column(id_field).to_pylist() if id_field in columns else range(index, index + len(texts))
+            for record_id, text in zip(ids, texts):
+                yield str(record_id), text or ""
+            index += len(texts)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class JsonlWriter:
+    """JSONL 输出：逐批追加，断点记录文件偏移，恢复时截掉断点之后写入的部分"""
+
+    def __init__(self, path, state):
+        self.path = path
+        offset = state.get("offset", 0)
+        self.file = open(path, "r+b" if offset and os.path.exists(path) else "wb")
+        self.file.seek(offset)
+        self.file.truncate()
+
+    def write(self, records):
+        for record in records:
+            self.file.write((json.dumps(record, ensure_ascii=False, default=float) + "\n").encode("utf-8"))
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {"offset": self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """Parquet 输出：每次 flush 写一个分片文件，断点记录已完成的分片数"""
+
+    def __init__(self, path, state):
+        import pyarrow as pa
+        self.pa = pa
+        self.schema = pa.schema([("id", pa.string()), ("entity_count", pa.int32()), ("entities", pa.string())])
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.parts = state.get("parts", 0)
+        # 删除断点之后未完成的分片
+        for name in os.listdir(path):
+            if name.startswith("part-") and int(name[5:10]) >= self.parts:
+                os.remove(os.path.join(path, name))
+        self.rows = []
+
+    def write(self, records):
+        for record in records:
+            self.rows.append({"id": record["id"], "entity_count": record["entity_count"],
+                              "entities": json.dumps(record["entities"], ensure_ascii=False, default=float)})
+
+    def flush(self):
+        import pyarrow.parquet as pq
+        if self.rows:
+            table = self.pa.Table.from_pylist(self.rows, schema=self.schema)
+            part_path = os.path.join(self.path, f"part-{self.parts:05d}.parquet")
+            pq.write_table(table, part_path + ".tmp")
+            os.replace(part_path + ".tmp", part_path)
+            self.parts += 1
+            self.rows = []
+        return {"parts": self.parts}
+
+    def close(self):
+        pass
+
+
+def save_checkpoint(path, state):
+    """原子地写入断点文件"""
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def init_worker(settings, threads=None):
+    """加载 NER 模型和标准化服务（每个工作进程一份）"""
+    global _ner_service, _std_service, _settings
+    import torch
+    from services.ner_service import NERService
+    from services.std_service import StdService
+    if threads:
+        torch.set_num_threads(threads)
+    _settings = settings
+    _ner_service = NERService(parallel_workers=0)
+    _std_service = StdService(provider=settings["provider"], model=settings["model"], db_path=settings["db"],
+                              collection_name=settings["collection"], search_mode=settings["search_mode"],
+                              fusion=settings["fusion"])
+
+
+def process_batch(batch):
+    """对一批 (id, text) 做 NER 和标准化，返回输出记录列表"""
+    texts = [text for _, text in batch]
+    ner_results = _ner_service.process_batch(texts, _settings["options"], _settings["term_types"],
+                                             batch_size=_settings["ner_batch_size"])
+    words = [entity["word"] for result in ner_results for entity in result["entities"]]
+    std_results = iter(_std_service.search_similar_terms_batch(words, _settings["limit"]))
+
+    records = []
+    for (record_id, _), result in zip(batch, ner_results):
+        entities = []
+        for entity in result["entities"]:
+            entities.append({
+                "word": entity["word"],
+                "entity_group": entity["entity_group"],
+                "start": entity["start"],
+                "end": entity["end"],
+                "score": float(entity["score"]),
+                "standardized_results": next(std_results),
+            })
+        records.append({"id": record_id, "entity_count": len(entities), "entities": entities})
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline batch NER + terminology standardization")
+    parser.add_argument("--input", required=True, help="输入文件（JSONL / CSV / Parquet）")
+    parser.add_argument("--output", required=True, help="输出 JSONL 文件或 Parquet 目录")
+    parser.add_argument("--input-format", choices=["jsonl", "csv", "parquet"])
+    parser.add_argument("--output-format", choices=["jsonl", "parquet"])
+    parser.add_argument("--text-field", default="text")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--checkpoint", default=None, help="断点文件，默认 <output>.checkpoint.json")
+    parser.add_argument("--checkpoint-every", type=int, default=10000, help="每写入多少条记录保存一次断点")
+    parser.add_argument("--batch-size", type=int, default=256, help="每个任务包含的病历数")
+    parser.add_argument("--ner-batch-size", type=int, default=32, help="NER 模型推理的批大小")
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数，1 表示在当前进程中运行")
+    parser.add_argument("--limit", type=int, default=5, help="每个实体保留的标准化结果数")
+    parser.add_argument("--all-medical-terms", action="store_true", help="识别所有类型的医学术语")
+    parser.add_argument("--term-types", default="symptom,disease,therapeuticProcedure",
+                        help="不使用 --all-medical-terms 时识别的术语类型")
+    parser.add_argument("--no-combine-bio-structure", action="store_true", help="不合并生物结构和症状实体")
+    parser.add_argument("--provider", default="huggingface")
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    parser.add_argument("--db", default="backend/db/snomed_bge_m3.db")
+    parser.add_argument("--collection", default="concepts_only_name")
+    parser.add_argument("--search-mode", choices=["dense", "hybrid"], default="dense")
+    parser.add_argument("--fusion", choices=["rrf", "weighted"], default="rrf")
+    args = parser.parse_args()
+
+    input_format = detect_format(args.input, args.input_format)
+    # 输出目录可能还不存在：不是 .jsonl 文件就按 Parquet 目录处理
+    output_format = args.output_format or ("jsonl" if args.output.endswith((".jsonl", ".ndjson")) else "parquet")
+    checkpoint_path = args.checkpoint or f"{args.output.rstrip('/')}.checkpoint.json"
+
+    # 读取断点；输入或输出不同则不能续跑
+    state = {"input": os.path.abspath(args.input), "output": os.path.abspath(args.output),
+             "records": 0, "entities": 0, "writer": {}}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved["input"] != state["input"] or saved["output"] != state["output"]:
+            parser.error(f"{checkpoint_path} belongs to a different input/output pair")
+        state = saved
+        logging.info(f"Resuming after {state['records']} records")
+
+    term_types = {"allMedicalTerms": args.all_medical_terms}
+    term_types.update({name: True for name in args.term_types.split(",") if name})
+    settings = {
+        "options": {"combineBioStructure": not args.no_combine_bio_structure},
+        "term_types": term_types,
+        "ner_batch_size": args.ner_batch_size,
+        "limit": args.limit,
+        "provider": args.provider,
+        "model": args.model,
+        "db": args.db,
+        "collection": args.collection,
+        "search_mode": args.search_mode,
+        "fusion": args.fusion,
+    }
+
+    writer = (JsonlWriter if output_format == "jsonl" else ParquetWriter)(args.output, state["writer"])
+    records = itertools.islice(read_records(args.input, input_format, args.text_field, args.id_field),
+                               state["records"], None)
+    batches = batched(records, args.batch_size)
+
+    pool = None
+    if args.workers > 1:
+        from services.ner_service import available_cores
+        threads = max(1, len(available_cores()) // args.workers)
+        pool = multiprocessing.get_context("spawn").Pool(args.workers, initializer=init_worker,
+                                                        initargs=(settings, threads))
+        # 有界的在途任务数，避免一次性把整个输入读入内存
+        pending = deque()
+
+        def results():
+            for batch in batches:
+                pending.append((len(batch), sum(len(text) for _, text in batch),
+                                pool.apply_async(process_batch, (batch,))))
+                if len(pending) >= args.workers * 2:
+                    count, chars, result = pending.popleft()
+                    yield count, chars, result.get()
+            while pending:
+                count, chars, result = pending.popleft()
+                yield count, chars, result.get()
+    else:
+        init_worker(settings)
+
+        def results():
+            for batch in batches:
+                yield len(batch), sum(len(text) for _, text in batch), process_batch(batch)
+
+    started = time.perf_counter()
+    base_records, base_entities = state["records"], state["entities"]
+    processed = entities = chars = 0
+    since_checkpoint = 0
+
+    def checkpoint():
+        state["writer"] = writer.flush()
+        state["records"] = base_records + processed
+        state["entities"] = base_entities + entities
+        save_checkpoint(checkpoint_path, state)
+
+    progress = tqdm(initial=base_records, unit="note", desc="Standardizing")
+    try:
+        for count, batch_chars, output in results():
+            writer.write(output)
+            processed += count
+            entities += sum(record["entity_count"] for record in output)
+            chars += batch_chars
+            since_checkpoint += count
+            progress.update(count)
+            progress.set_postfix(entities=base_entities + entities,
+                                 ent_per_s=f"{entities / (time.perf_counter() - started):.0f}")
+            if since_checkpoint >= args.checkpoint_every:
+                checkpoint()
+                since_checkpoint = 0
+        checkpoint()
+    finally:
+        progress.close()
+        writer.close()
+        if pool is not None:
+            pool.terminate()
+
+    elapsed = time.perf_counter() - started
+    logging.info(f"Processed {processed} notes ({chars} chars, {entities} entities) in {elapsed:.1f}s: "
+                 f"{processed / elapsed:.1f} notes/s, {entities / elapsed:.1f} entities/s, "
+                 f"{chars / elapsed / 1000:.1f} kchars/s; total {state['records']} notes -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+在带标注的数据上拟合级联阈值（utils/cascade.py），写入阈值文件供 AbbrService / CascadeService 读取
+
+标注数据为 JSONL 或 CSV，每条包含 query（缩写或术语）、可选的 context 和标准答案 concept_id：
+    {"query": "SOB", "context": "pt c/o SOB on exertion", "concept_id": "312437"}
+abbr 策略的检索文本与 AbbrService.cascade_query_db 一致，为 "query context"；std 策略只用 query。
+没有标注数据时可用 --concepts 从 SNOMED CSV 构造（FSN 变体和层级快照中的同义词，与 tools/evaluate_embeddings.py 相同）。
+
+每条查询检索一次（批量计算嵌入），记录第一名得分、领先第二名的幅度和第一名是否正确，
+在直接返回结果的准确率不低于 --target-precision 的阈值中，选择直接返回比例最大（升级率最低）的一组。
+
+用法（在项目根目录执行）：
+    python backend/tools/calibrate_cascade.py --policy abbr --labels abbr_labels.jsonl --target-precision 0.95
+    python backend/tools/calibrate_cascade.py --policy std --concepts backend/data/SNOMED_5000.csv --dry-run
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.std_service import StdService
+from utils.cascade import calibrate, confidence_features, save_thresholds
+from utils.snomed_hierarchy import SnomedHierarchy
+from evaluate_embeddings import build_queries, load_concepts
+
+# 设置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 结果表中额外列出的准确率目标
+REPORT_PRECISIONS = [0.9, 0.95, 0.98, 0.99]
+
+
+def load_labels(path):
+    """读取标注数据，返回 [(query, context, concept_id)]"""
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            records = list(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    return [(str(record["query"]), str(record.get("context") or ""), str(record["concept_id"])) for record in records]
+
+
+def print_report(rows):
+    print(f"{'target':>8}  {'min_score':>9}  {'min_margin':>10}  {'precision':>9}  {'escalation':>10}")
+    for target, thresholds in rows:
+        if thresholds is None:
+            print(f"{target:>8.2f}  {'-':>9}  {'-':>10}  {'-':>9}  {'1.000':>10}")
+            continue
+        print(f"{target:>8.2f}  {thresholds['min_score']:>9.4f}  {thresholds['min_margin']:>10.4f}  "
+              f"{thresholds['precision']:>9.3f}  {thresholds['escalation_rate']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit cascade thresholds (top-1 score and margin) on labeled queries")
+    parser.add_argument("--policy", choices=["abbr", "std"], required=True)
+    parser.add_argument("--labels", default=None, help="标注数据（JSONL / CSV：query, context, concept_id）")
+    parser.add_argument("--concepts", default=None, help="没有标注数据时，从 SNOMED CSV 构造查询")
+    parser.add_argument("--hierarchy", default="backend/db/snomed_hierarchy", help="--concepts 时加入同义词查询的层级快照")
+    parser.add_argument("--max-queries", type=int, default=5000)
+    parser.add_argument("--provider", default="huggingface")
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    parser.add_argument("--db", default="backend/db/snomed_bge_m3.db")
+    parser.add_argument("--collection", default="concepts_only_name")
+    parser.add_argument("--search-mode", choices=["dense", "hybrid"], default="dense")
+    parser.add_argument("--limit", type=int, default=5, help="检索结果数，与线上调用一致")
+    parser.add_argument("--target-precision", type=float, default=0.95, help="直接返回结果的最低准确率")
+    parser.add_argument("--min-accepted", type=int, default=20, help="直接返回的最少查询数")
+    parser.add_argument("--output", default="backend/db/cascade_thresholds.json", help="阈值文件")
+    parser.add_argument("--dry-run", action="store_true", help="只输出结果，不写入阈值文件")
+    args = parser.parse_args()
+
+    if args.labels:
+        labels = load_labels(args.labels)
+    elif args.concepts:
+        hierarchy = SnomedHierarchy.open(args.hierarchy) if SnomedHierarchy.exists(args.hierarchy) else None
+        labels = [(query, "", concept_id)
+                  for query, concept_id in build_queries(load_concepts(args.concepts), hierarchy, args.max_queries)]
+    else:
+        raise SystemExit("Either --labels or --concepts is required")
+    if not labels:
+        raise SystemExit("No labeled queries")
+
+    std_service = StdService(provider=args.provider, model=args.model, db_path=args.db,
+                             collection_name=args.collection, search_mode=args.search_mode)
+    queries = [f"{query} {context}".strip() if args.policy == "abbr" else query for query, context, _ in labels]
+    results = std_service.search_similar_terms_batch(queries, args.limit)
+    top_scores, margins = confidence_features(results)
+    correct = [bool(hits) and str(hits[0].get("concept_id")) == concept_id
+               for hits, (_, _, concept_id) in zip(results, labels)]
+    logging.info(f"{len(labels)} labeled queries, top-1 accuracy {sum(correct) / len(correct):.3f}")
+
+    targets = sorted(set(REPORT_PRECISIONS + [args.target_precision]))
+    report = [(target, calibrate(top_scores, margins, correct, target, args.min_accepted)) for target in targets]
+    print_report(report)
+
+    thresholds = dict(report)[args.target_precision]
+    if thresholds is None:
+        raise SystemExit(f"No thresholds reach precision {args.target_precision} with at least "
+                         f"{args.min_accepted} accepted queries; every query would escalate")
+    thresholds.update(model=args.model, collection=args.collection, search_mode=args.search_mode)
+    if args.dry_run:
+        logging.info(f"Dry run, {args.policy} thresholds: {thresholds}")
+        return
+    save_thresholds(args.policy, thresholds, args.output)
+    logging.info(f"Wrote {args.policy} thresholds (min_score={thresholds['min_score']:.4f}, "
+                 f"min_margin={thresholds['min_margin']:.4f}, escalation rate {thresholds['escalation_rate']:.3f}) "
+                 f"to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,19 @@
 from pymilvus import model
 from pymilvus import MilvusClient
-import pandas as pd
+import numpy as np
 from tqdm import tqdm
 import logging
 from dotenv import load_dotenv
 load_dotenv()
 import torch    
-from pymilvus import MilvusClient, DataType, FieldSchema, CollectionSchema
+from pymilvus import MilvusClient, DataType, FieldSchema, CollectionSchema, Collection, connections
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.concept_table import CONCEPT_COLUMNS, build_documents, column_batch, read_concepts
+from utils.local_index import index_dir_for
+from utils.sparse_encoder import BM25SparseEncoder, BM25_FILE
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -35,12 +42,30 @@ client = MilvusClient(db_path)
 collection_name = "concepts_only_name"
 # collection_name = "concepts_with_synonym"
 
-# 加载数据
+# 是否额外存储 BM25 稀疏向量，供 StdService 的 hybrid 检索模式使用
+enable_sparse = False
+
+# 向量存储精度：float32 / float16（内存减半）
+# int8 / binary 量化在导出的本地索引上进行，见 tools/quantize_local_index.py
+vector_dtype = "float32"
+
+# 降维粗排字段维度（如 256），None 表示不创建；
+# 存储 Matryoshka 截断并重新归一化的前缀，StdService 会先在该字段上粗排再全维重排
+# BGE-M3 未做 Matryoshka 训练，PCA 降维请在导出的本地索引上进行，见 tools/reduce_local_index.py
+reduced_dim = None
+
+# 加载数据（PyArrow 列式读取，所有列为字符串，空值为 "NA"）
 logging.info("Loading data from CSV")
-df = pd.read_csv(file_path, 
-                 dtype=str, 
-                low_memory=False,
-                 ).fillna("NA")
+table = read_concepts(file_path)
+
+# 嵌入文档：目前只用 concept_name；附加 FSN / 同义词等列时作为 build_documents 的后续参数
+documents = build_documents(table.column('concept_name'))
+
+# 在全部概念文本上拟合 BM25（与嵌入使用同一份文档）
+if enable_sparse:
+    sparse_encoder = BM25SparseEncoder().fit(documents.to_pylist())
+    sparse_encoder.save(os.path.join(index_dir_for(db_path, collection_name), BM25_FILE))
+    logging.info(f"Fitted BM25 encoder with {len(sparse_encoder.vocabulary)} terms")
 
 # 获取向量维度（使用一个样本文档）
 sample_doc = "Sample Text"
@@ -50,7 +75,9 @@ vector_dim = len(sample_embedding)
 # 构造Schema
 fields = [
     FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-    FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=vector_dim), # BGE-m3 最重要
+    FieldSchema(name="vector",
+                dtype=DataType.FLOAT16_VECTOR if vector_dtype == "float16" else DataType.FLOAT_VECTOR,
+                dim=vector_dim), # BGE-m3 最重要
     FieldSchema(name="concept_id", dtype=DataType.VARCHAR, max_length=50),
     FieldSchema(name="concept_name", dtype=DataType.VARCHAR, max_length=200),
     FieldSchema(name="domain_id", dtype=DataType.VARCHAR, max_length=20),
@@ -65,6 +92,10 @@ fields = [
     # FieldSchema(name="definitions", dtype=DataType.VARCHAR, max_length=1000), # 定义
     FieldSchema(name="input_file", dtype=DataType.VARCHAR, max_length=500),
 ]
+if enable_sparse:
+    fields.append(FieldSchema(name="sparse_vector", dtype=DataType.SPARSE_FLOAT_VECTOR))
+if reduced_dim:
+    fields.append(FieldSchema(name="vector_reduced", dtype=DataType.FLOAT_VECTOR, dim=reduced_dim))
 schema = CollectionSchema(fields, 
                           "SNOMED-CT Concepts", 
                           enable_dynamic_field=True)
@@ -86,88 +117,79 @@ index_params.add_index(
     metric_type="COSINE",  # 使用余弦相似度作为向量相似度度量方式
     params={"nlist": 1024}  # 索引参数：nlist表示聚类中心的数量，值越大检索精度越高但速度越慢
 )
+if enable_sparse:
+    index_params.add_index(
+        field_name="sparse_vector",
+        index_type="SPARSE_INVERTED_INDEX",  # 稀疏向量倒排索引
+        metric_type="IP",  # 文档侧 BM25 权重与查询侧 IDF 的内积即 BM25 得分
+    )
+if reduced_dim:
+    index_params.add_index(
+        field_name="vector_reduced",
+        index_type="AUTOINDEX",
+        metric_type="COSINE",
+    )
 
 client.create_index(
     collection_name=collection_name,
     index_params=index_params
 )
 
+# 列式插入：每批按 schema 字段顺序（跳过自动主键）组织为列，不逐行构造字典
+connections.connect(alias="ingest", uri=db_path)
+collection = Collection(collection_name, using="ingest")
+insert_fields = [field.name for field in schema.fields if not field.auto_id]
+
 # 批量处理
 batch_size = 1024
 
-for start_idx in tqdm(range(0, len(df), batch_size), desc="Processing batches"):
-    end_idx = min(start_idx + batch_size, len(df))
-    batch_df = df.iloc[start_idx:end_idx]
-
-    # 准备文档
-    # docs = [f"Term: {row['concept_name']}; Synonyms: {row['Synonyms']}" for _, row in batch_df.iterrows()]
-    docs = []
-    for _, row in batch_df.iterrows():
-        doc_parts = [row['concept_name']]
-
-        # if row['Full Name'] != "NA" and row['Full Name'] != row['concept_name']:
-        #     doc_parts.append(",Full Name: " + row['Full Name'])
-
-        # if row['Synonyms'] != "NA" and row['Synonyms'] != row['concept_name']:
-        #     doc_parts.append(", Synonyms: " + row['Synonyms'])
-
-        # if row['Definitions'] != "NA" and row['Definitions'] not in [row['concept_name'], row.get('Full Name', '')]:
-        #     doc_parts.append(", Definitions: " + row['Definitions'])
-
-        docs.append(" ".join(doc_parts))
+for start_idx in tqdm(range(0, table.num_rows, batch_size), desc="Processing batches"):
+    end_idx = min(start_idx + batch_size, table.num_rows)
+    batch_number = start_idx // batch_size + 1
+    docs = documents[start_idx:end_idx].to_pylist()
 
     # 生成嵌入
     try:
-        embeddings = embedding_function(docs)
-        logging.info(f"Generated embeddings for batch {start_idx // batch_size + 1}")
+        embeddings = np.asarray(embedding_function(docs), dtype=np.float32)
+        logging.info(f"Generated embeddings for batch {batch_number}")
     except Exception as e:
-        logging.error(f"Error generating embeddings for batch {start_idx // batch_size + 1}: {e}")
+        logging.error(f"Error generating embeddings for batch {batch_number}: {e}")
         continue
 
-    # 准备数据
-    data = [
-        {
-            # "id": idx + start_idx,
-            "vector": embeddings[idx],
-            "concept_id": str(row['concept_id']),
-            "concept_name": str(row['concept_name']),
-            "domain_id": str(row['domain_id']),
-            "vocabulary_id": str(row['vocabulary_id']),
-            "concept_class_id": str(row['concept_class_id']),
-            "standard_concept": str(row['standard_concept']),
-            "concept_code": str(row['concept_code']),
-            "valid_start_date": str(row['valid_start_date']),
-            "valid_end_date": str(row['valid_end_date']),
-            # "invalid_reason": str(row['invalid_reason']),
-            # "full_name": str(row['Full Name']),
-            # "synonyms": str(row['Synonyms']),
-            # "definitions": str(row['Definitions']),
-            "input_file": file_path
-        } for idx, (_, row) in enumerate(batch_df.iterrows())
-    ]
+    # 准备列数据
+    columns = column_batch(table, start_idx, end_idx, CONCEPT_COLUMNS)
+    columns["input_file"] = [file_path] * (end_idx - start_idx)
+    # COSINE 度量会自动归一化，截断前缀即可
+    if reduced_dim:
+        columns["vector_reduced"] = list(embeddings[:, :reduced_dim])
+    columns["vector"] = list(embeddings.astype(np.float16) if vector_dtype == "float16" else embeddings)
+    if enable_sparse:
+        columns["sparse_vector"] = sparse_encoder.encode_documents(docs)
 
     # 插入数据 - 1024个向量条目，即1024个医疗术语（标准概念）
     try:
-        res = client.insert(
-            collection_name=collection_name,
-            data=data
-        )
-        logging.info(f"Inserted batch {start_idx // batch_size + 1}, result: {res}")
+        res = collection.insert([columns[name] for name in insert_fields])
+        logging.info(f"Inserted batch {batch_number}, result: {res}")
     except Exception as e:
-        logging.error(f"Error inserting batch {start_idx // batch_size + 1}: {e}")
+        logging.error(f"Error inserting batch {batch_number}: {e}")
 
+collection.flush()
+connections.disconnect("ingest")
 logging.info("Insert process completed.")
 
 # 示例查询
 # query = "somatic hallucination"
 query = "SOB"
 query_embeddings = embedding_function([query])
+if vector_dtype == "float16":
+    query_embeddings = [np.asarray(query_embeddings[0], dtype=np.float16)]
 
 
 # 搜索余弦相似度最高的
 search_result = client.search(
     collection_name=collection_name,
-    data=[query_embeddings[0].tolist()],
+    data=[query_embeddings[0] if vector_dtype == "float16" else query_embeddings[0].tolist()],
+    anns_field="vector",
     limit=5,
     output_fields=["concept_name", 
                 #    "synonyms", 
@@ -1,14 +1,19 @@
 from pymilvus import model
 from pymilvus import MilvusClient
-import pandas as pd
+import numpy as np
 from tqdm import tqdm
 import logging
 from dotenv import load_dotenv
 load_dotenv()
 import torch    
-from pymilvus import MilvusClient, DataType, FieldSchema, CollectionSchema
+from pymilvus import MilvusClient, DataType, FieldSchema, CollectionSchema, Collection, connections
 from neo4j import GraphDatabase
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.concept_table import CONCEPT_COLUMNS, build_documents, column_batch, read_concepts
+from utils.snomed_hierarchy import SnomedHierarchy
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -66,41 +71,28 @@ except Exception as e:
     logging.error(f"Failed to connect to Neo4j: {e}")
     raise
 
-def get_concept_descriptions(concept_id, concept_code):
+# 有层级快照（tools/export_snomed_hierarchy.py）时直接读取同义词，不再逐条查询 Neo4j
+hierarchy_dir = os.getenv("SNOMED_HIERARCHY_DIR", "backend/db/snomed_hierarchy")
+hierarchy = SnomedHierarchy.open(hierarchy_dir) if SnomedHierarchy.exists(hierarchy_dir) else None
+if hierarchy is not None:
+    logging.info(f"Using SNOMED hierarchy snapshot at {hierarchy_dir}")
+
+def get_batch_descriptions(concept_codes):
+    """一批概念的描述（以空格连接），找不到的概念为空字符串；每批只查询一次 Neo4j"""
+    if hierarchy is not None:
+        return hierarchy.synonyms_batch(concept_codes)
     with neo4j_driver.session() as session:
-        # 首先检查概念是否存在
-        concept_check = session.run("""
-            MATCH (c:ObjectConcept {id: $concept_code})
-            RETURN c.id as id, c.FSN as fsn
-        """, concept_code=concept_code)
-        concept = concept_check.single()
-        
-        if not concept:
-            logging.warning(f"Concept {concept_id} (code: {concept_code}) not found in Neo4j")
-            return []
-            
-        logging.info(f"Found concept: {concept['id']} with FSN: {concept['fsn']}")
-        
-        # 修改查询以获取所有描述
         result = session.run("""
-            MATCH (c:ObjectConcept {id: $concept_code})-[:HAS_DESCRIPTION]->(d:Description)
-            RETURN d.term as term, d.descriptionType as type, d.active as active
-            ORDER BY d.descriptionType
-        """, concept_code=concept_code)
-        
-        # 获取所有结果
-        descriptions = [(record["term"], record["type"], record["active"]) for record in result]
-        
-        # 添加日志
-        if descriptions:
-            logging.info(f"Found {len(descriptions)} descriptions for concept {concept['id']}:")
-            for term, type_, active in descriptions:
-                logging.info(f"  - Term: {term}, Type: {type_}, Active: {active}")
-        else:
-            logging.warning(f"No descriptions found for concept {concept['id']}")
-            
-        # 只返回术语文本
-        return [desc[0] for desc in descriptions]
+            UNWIND $concept_codes AS concept_code
+            MATCH (c:ObjectConcept {id: concept_code})-[:HAS_DESCRIPTION]->(d:Description)
+            WITH concept_code, d ORDER BY d.descriptionType
+            RETURN concept_code, collect(d.term) AS terms
+        """, concept_codes=list(set(concept_codes)))
+        descriptions = {record["concept_code"]: " ".join(record["terms"]) for record in result}
+    missing = sum(1 for code in concept_codes if code not in descriptions)
+    if missing:
+        logging.warning(f"{missing} of {len(concept_codes)} concepts have no descriptions in Neo4j")
+    return [descriptions.get(code, "") for code in concept_codes]
 
 # 初始化 OpenAI 嵌入函数
 embedding_function = model.dense.SentenceTransformerEmbeddingFunction(
@@ -130,12 +122,9 @@ if client.has_collection(collection_name):
     logging.info(f"Dropping existing collection: {collection_name}")
     client.drop_collection(collection_name)
 
-# 加载数据
+# 加载数据（PyArrow 列式读取，所有列为字符串，空值为 "NA"）
 logging.info("Loading data from CSV")
-df = pd.read_csv(file_path, 
-                 dtype=str, 
-                low_memory=False,
-                 ).fillna("NA")
+table = read_concepts(file_path)
 
 # 获取向量维度（使用一个样本文档）
 sample_doc = "Sample Text"
@@ -187,72 +176,45 @@ client.create_index(
     index_params=index_params
 )
 
+# 列式插入：每批按 schema 字段顺序（跳过自动主键）组织为列，不逐行构造字典
+connections.connect(alias="ingest", uri=db_path)
+collection = Collection(collection_name, using="ingest")
+insert_fields = [field.name for field in schema.fields if not field.auto_id]
+
 # 批量处理
 batch_size = 1024
 
-for start_idx in tqdm(range(0, len(df), batch_size), desc="Processing batches"):
-    end_idx = min(start_idx + batch_size, len(df))
-    batch_df = df.iloc[start_idx:end_idx]
+for start_idx in tqdm(range(0, table.num_rows, batch_size), desc="Processing batches"):
+    end_idx = min(start_idx + batch_size, table.num_rows)
+    batch_number = start_idx // batch_size + 1
+    columns = column_batch(table, start_idx, end_idx, CONCEPT_COLUMNS)
 
-    # 准备文档
-    docs = []
-    for _, row in batch_df.iterrows():
-        concept_id = row['concept_id']
-        concept_code = row['concept_code']
-        concept_name = row['concept_name']
-        
-        # 从Neo4j获取同义词
-        synonyms = get_concept_descriptions(concept_id, concept_code)
-        synonyms_text = " ".join(synonyms) if synonyms else ""
-        
-        # 组合概念名称和同义词 - 这就好比是图数据库资源和普通文本资源的组合检索呀！！！！
-        doc_parts = [concept_name]
-        if synonyms_text:
-            doc_parts.append(synonyms_text)
-            
-        docs.append(" ".join(doc_parts))
+    # 从Neo4j（或层级快照）批量获取同义词，与概念名称组合 - 这就好比是图数据库资源和普通文本资源的组合检索呀！！！！
+    synonyms = get_batch_descriptions(columns['concept_code'])
+    docs = build_documents(table.column('concept_name')[start_idx:end_idx], synonyms).to_pylist()
 
     # 生成嵌入
     try:
-        embeddings = embedding_function(docs)
-        logging.info(f"Generated embeddings for batch {start_idx // batch_size + 1}")
+        embeddings = np.asarray(embedding_function(docs), dtype=np.float32)
+        logging.info(f"Generated embeddings for batch {batch_number}")
     except Exception as e:
-        logging.error(f"Error generating embeddings for batch {start_idx // batch_size + 1}: {e}")
+        logging.error(f"Error generating embeddings for batch {batch_number}: {e}")
         continue
 
-    # 准备数据
-    data = []
-    for idx, (_, row) in enumerate(batch_df.iterrows()):
-        concept_id = row['concept_id']
-        concept_code = row['concept_code']
-        synonyms = get_concept_descriptions(concept_id, concept_code)
-        synonyms_text = " ".join(synonyms) if synonyms else ""
-        
-        data.append({
-            "vector": embeddings[idx],
-            "concept_id": str(row['concept_id']),
-            "concept_name": str(row['concept_name']),
-            "domain_id": str(row['domain_id']),
-            "vocabulary_id": str(row['vocabulary_id']),
-            "concept_class_id": str(row['concept_class_id']),
-            "standard_concept": str(row['standard_concept']),
-            "concept_code": str(row['concept_code']),
-            "valid_start_date": str(row['valid_start_date']),
-            "valid_end_date": str(row['valid_end_date']),
-            "synonyms": synonyms_text,
-            "input_file": file_path
-        })
+    # 准备列数据
+    columns["vector"] = list(embeddings)
+    columns["synonyms"] = synonyms
+    columns["input_file"] = [file_path] * (end_idx - start_idx)
 
     # 插入数据 - 1024个向量条目，即1024个医疗术语（标准概念）
     try:
-        res = client.insert(
-            collection_name=collection_name,
-            data=data
-        )
-        logging.info(f"Inserted batch {start_idx // batch_size + 1}, result: {res}")
+        res = collection.insert([columns[name] for name in insert_fields])
+        logging.info(f"Inserted batch {batch_number}, result: {res}")
     except Exception as e:
-        logging.error(f"Error inserting batch {start_idx // batch_size + 1}: {e}")
+        logging.error(f"Error inserting batch {batch_number}: {e}")
 
+collection.flush()
+connections.disconnect("ingest")
 logging.info("Insert process completed.")
 
 # 关闭Neo4j连接
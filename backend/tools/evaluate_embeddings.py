@@ -0,0 +1,233 @@
+"""
+嵌入模型评估：候选模型 × 索引配置的 recall@k、MRR、嵌入吞吐、索引内存和检索延迟对比
+
+带标注的查询集从 SNOMED CSV 自动构造：
+- FSN 列中以 "; " 分隔的每个名称去掉语义标签（如 "(disorder)"）后，与 concept_name 不同的作为查询；
+- 有 SNOMED 层级快照（tools/export_snomed_hierarchy.py）时，概念的其他有效描述（同义词）也作为查询。
+每条查询的标准答案是它所属概念的 concept_id，检索库为全部概念的 concept_name（与 concepts_only_name 集合一致）。
+
+每个模型把概念写入临时的本地索引（utils/local_index.py），各索引配置复用 StdService 本地检索的同一套代码：
+    float32           精确检索
+    float16/int8/binary  量化码粗排 + float32 重排（见 tools/quantize_local_index.py）
+    pca<维度>/truncate<维度>  降维粗排 + float32 重排（见 tools/reduce_local_index.py）
+索引内存为常驻内存的部分（float32 向量，或粗排用的量化码/降维向量；重排只通过 mmap 读取候选行）。
+
+用法（在项目根目录执行）：
+    python backend/tools/evaluate_embeddings.py --models huggingface:BAAI/bge-m3 huggingface:sentence-transformers/all-mpnet-base-v2 \\
+        --index-configs float32 int8 binary pca256 --min-recall 0.9 --output embedding_eval.csv
+"""
+import argparse
+import copy
+import csv
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.embedding_config import EmbeddingConfig, EmbeddingProvider
+from utils.embedding_factory import EmbeddingFactory
+from utils.concept_store import FIELDS as CONCEPT_FIELDS
+from utils.local_index import LocalIndex, LocalIndexWriter
+from utils.projection import Projection
+from utils.quantization import QUANTIZATION_KINDS, Quantizer
+from utils.snomed_hierarchy import SnomedHierarchy
+
+# 设置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SEMANTIC_TAG = re.compile(r"\s*\([^()]*\)\s*$")
+COLUMNS = ["model", "index", "dim", "recall@1", "recall@5", "mrr@10", "embed_docs_per_s",
+           "index_mb", "search_p50_ms", "search_p95_ms"]
+
+
+def load_concepts(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row for row in csv.DictReader(f) if row.get("concept_name")]
+
+
+def build_queries(concepts, hierarchy=None, max_queries=None, seed=42):
+    """
+    构造 [(查询文本, concept_id)]
+
+    只保留与 concept_name 不同（忽略大小写）的名称；同一概念内重复的名称只保留一次。
+    """
+    queries = []
+    for concept in concepts:
+        name = concept["concept_name"].strip().lower()
+        names = (concept.get("FSN") or "").split("; ")
+        if hierarchy is not None and concept.get("concept_code"):
+            names.extend(hierarchy.synonyms(concept["concept_code"]))
+        seen = {name}
+        for variant in names:
+            variant = SEMANTIC_TAG.sub("", variant).strip()
+            if variant and variant.lower() not in seen:
+                seen.add(variant.lower())
+                queries.append((variant, concept["concept_id"]))
+    if max_queries and len(queries) > max_queries:
+        rng = np.random.default_rng(seed)
+        queries = [queries[i] for i in np.sort(rng.choice(len(queries), size=max_queries, replace=False))]
+    return queries
+
+
+def parse_model(spec):
+    """provider:model，省略 provider 时为 huggingface"""
+    provider, _, model = spec.partition(":")
+    if not model or provider not in {p.value for p in EmbeddingProvider}:
+        return EmbeddingProvider.HUGGINGFACE, spec
+    return EmbeddingProvider(provider), model
+
+
+def embed(function, texts, batch_size):
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(function(texts[start:start + batch_size]))
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def embed_queries(embedding_function, texts, batch_size):
+    """
+    查询与线上 StdService 一致使用 embed_query 编码：指令模型和非对称模型（如 multilingual-e5-large-instruct、
+    gte-Qwen2）对查询和文档的编码方式不同，用 embed_documents 编码查询得到的召回率不代表线上效果
+    """
+    return embed(lambda batch: [embedding_function.embed_query(text) for text in batch], texts, batch_size)
+
+
+def configure(base, config, rerank_candidates):
+    """在 float32 索引上挂接量化码或降维向量，返回新的 LocalIndex 和常驻内存字节数"""
+    if config == "float32":
+        return base, base.vectors.nbytes
+    index = copy.copy(base)
+    index.rerank_candidates = rerank_candidates
+    if config in QUANTIZATION_KINDS:
+        index.quantizer = Quantizer.fit(config, base.vectors)
+        index.codes = index.quantizer.encode(base.vectors)
+        return index, index.codes.nbytes
+    match = re.fullmatch(r"(pca|truncate)(\d+)", config)
+    if not match:
+        raise ValueError(f"Unsupported index config: {config}")
+    dim = int(match.group(2))
+    if dim >= base.vectors.shape[1]:
+        raise ValueError(f"{config} needs fewer than {base.vectors.shape[1]} dimensions")
+    index.projection = Projection.fit(match.group(1), base.vectors, dim)
+    index.reduced = index.projection.transform_all(base.vectors)
+    return index, index.reduced.nbytes
+
+
+def evaluate(index, query_vectors, gold_rows, k=10):
+    """逐条检索（与在线服务一致），返回 recall@1、recall@5、MRR@10 和延迟分位数"""
+    ranks = np.full(len(query_vectors), np.inf)
+    latencies = np.empty(len(query_vectors))
+    for i, query in enumerate(query_vectors):
+        started = time.perf_counter()
+        rows = [row for row, _ in index.search(query, k)]
+        latencies[i] = time.perf_counter() - started
+        for rank, row in enumerate(rows, start=1):
+            if row in gold_rows[i]:
+                ranks[i] = rank
+                break
+    return {
+        "recall@1": float(np.mean(ranks <= 1)),
+        "recall@5": float(np.mean(ranks <= 5)),
+        "mrr@10": float(np.mean(np.where(np.isfinite(ranks), 1.0 / ranks, 0.0))),
+        "search_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "search_p95_ms": float(np.percentile(latencies, 95) * 1000),
+    }
+
+
+def print_table(rows, recommended=None):
+    widths = {name: max(len(name), *(len(format_value(row[name])) for row in rows)) for name in COLUMNS}
+    print("  ".join(name.ljust(widths[name]) for name in COLUMNS))
+    for row in rows:
+        marker = "  <- recommended" if row is recommended else ""
+        print("  ".join(format_value(row[name]).ljust(widths[name]) for name in COLUMNS) + marker)
+
+
+def format_value(value):
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding models and index configs on SNOMED queries")
+    parser.add_argument("--concepts", default="backend/data/SNOMED_5000.csv", help="含 concept_name 和 FSN 列的概念 CSV")
+    parser.add_argument("--hierarchy", default="backend/db/snomed_hierarchy", help="SNOMED 层级快照目录（存在时加入同义词查询）")
+    parser.add_argument("--models", nargs="+", default=["huggingface:BAAI/bge-m3"], help="provider:model 列表")
+    parser.add_argument("--index-configs", nargs="+", default=["float32", "int8", "binary"])
+    parser.add_argument("--rerank-candidates", type=int, default=100)
+    parser.add_argument("--max-queries", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64, help="嵌入计算的批大小")
+    parser.add_argument("--min-recall", type=float, default=None, help="recall@5 的达标线，给出满足条件的最省资源配置")
+    parser.add_argument("--output", default=None, help="结果 CSV")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    concepts = load_concepts(args.concepts)
+    hierarchy = SnomedHierarchy.open(args.hierarchy) if SnomedHierarchy.exists(args.hierarchy) else None
+    queries = build_queries(concepts, hierarchy, args.max_queries, args.seed)
+    if not queries:
+        raise SystemExit("No labeled queries could be built (FSN variants equal concept names and no hierarchy snapshot)")
+    rows_by_concept = {}
+    for row, concept in enumerate(concepts):
+        rows_by_concept.setdefault(concept["concept_id"], set()).add(row)
+    gold_rows = [rows_by_concept[concept_id] for _, concept_id in queries]
+    documents = [concept["concept_name"] for concept in concepts]
+    logging.info(f"{len(concepts)} concepts, {len(queries)} labeled queries"
+                 f"{' (with hierarchy synonyms)' if hierarchy is not None else ''}")
+
+    results = []
+    for spec in args.models:
+        provider, model = parse_model(spec)
+        started = time.perf_counter()
+        embedding_function = EmbeddingFactory.create_embedding_function(EmbeddingConfig(provider=provider, model_name=model))
+        logging.info(f"Loaded {spec} in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        document_vectors = embed(embedding_function.embed_documents, documents, args.batch_size)
+        docs_per_second = len(documents) / (time.perf_counter() - started)
+        query_vectors = embed_queries(embedding_function, [text for text, _ in queries], args.batch_size)
+
+        index = base = None
+        with tempfile.TemporaryDirectory() as index_dir:
+            writer = LocalIndexWriter(index_dir, len(documents), document_vectors.shape[1], info={"model": model})
+            writer.add(list(range(len(documents))), document_vectors,
+                       [{name: str(concept.get(name) or "") for name in CONCEPT_FIELDS} for concept in concepts])
+            writer.close()
+            base = LocalIndex(index_dir)
+            for config in args.index_configs:
+                index, resident_bytes = configure(base, config, args.rerank_candidates)
+                row = {
+                    "model": spec,
+                    "index": config,
+                    "dim": document_vectors.shape[1],
+                    "embed_docs_per_s": docs_per_second,
+                    "index_mb": resident_bytes / 1024 / 1024,
+                }
+                row.update(evaluate(index, query_vectors, gold_rows))
+                results.append(row)
+                logging.info(f"{spec} / {config}: recall@5={row['recall@5']:.3f}, p50={row['search_p50_ms']:.2f}ms")
+            del base, index
+
+    # 满足达标线的配置中，依次取嵌入最快（模型最便宜）、索引内存最小、检索最快的
+    recommended = None
+    if args.min_recall is not None:
+        passing = [row for row in results if row["recall@5"] >= args.min_recall]
+        if passing:
+            recommended = min(passing, key=lambda row: (-row["embed_docs_per_s"], row["index_mb"], row["search_p50_ms"]))
+        else:
+            logging.warning(f"No configuration reaches recall@5 >= {args.min_recall}")
+    print_table(results, recommended)
+
+    if args.output:
+        with open(args.output, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows({name: row[name] for name in COLUMNS} for row in results)
+        logging.info(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+将 Milvus 集合导出为内存映射的本地索引（见 utils/local_index.py）
+
+导出后 StdService 会自动改用本地索引检索，多 worker 部署（serve.py）时所有进程共享同一份索引。
+使用 --metadata-only 时只导出概念存储（utils/concept_store.py），仍由 Milvus 做向量检索，
+但检索结果只返回主键和距离，元数据在本地补全。
+
+用法（在项目根目录执行）：
+    python backend/tools/export_local_index.py --db backend/db/snomed_bge_m3.db --collection concepts_only_name
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+from pymilvus import Collection, MilvusClient, connections
+from tqdm import tqdm
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.local_index import LocalIndexWriter, index_dir_for
+from utils.concept_store import ConceptStoreWriter, FIELDS as METADATA_FIELDS
+from utils.sparse_encoder import SparseIndexWriter
+
+# 设置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+parser = argparse.ArgumentParser(description="Export a Milvus collection to a memory-mapped local index")
+parser.add_argument("--db", default="backend/db/snomed_bge_m3.db", help="Milvus Lite 数据库文件")
+parser.add_argument("--collection", default="concepts_only_name", help="集合名称")
+parser.add_argument("--model", default="BAAI/bge-m3", help="构建该集合时使用的嵌入模型")
+parser.add_argument("--output", default=None, help="输出目录，默认 <db>_index/<collection>")
+parser.add_argument("--batch-size", type=int, default=1000)
+parser.add_argument("--metadata-only", action="store_true", help="只导出概念存储，不导出向量")
+args = parser.parse_args()
+
+output_dir = args.output or index_dir_for(args.db, args.collection)
+
+# 读取集合结构和条目数
+client = MilvusClient(args.db)
+description = client.describe_collection(args.collection)
+field_names = {field["name"] for field in description["fields"]}
+vector_dim = next(field["params"]["dim"] for field in description["fields"] if field["name"] == "vector")
+row_count = int(client.get_collection_stats(args.collection)["row_count"])
+logging.info(f"Exporting {row_count} rows (dim={vector_dim}) from {args.collection} to {output_dir}")
+
+# query_iterator 按主键分页，可以遍历整个集合
+connections.connect(alias="export", uri=args.db)
+collection = Collection(args.collection, using="export")
+collection.load()
+output_fields = ["id"] + [name for name in METADATA_FIELDS if name in field_names]
+if not args.metadata_only:
+    output_fields.append("vector")
+# 入库时存储了 BM25 稀疏向量的集合，同时导出倒排表供 hybrid 检索使用
+export_sparse = not args.metadata_only and "sparse_vector" in field_names
+if export_sparse:
+    output_fields.append("sparse_vector")
+iterator = collection.query_iterator(batch_size=args.batch_size, output_fields=output_fields)
+
+if args.metadata_only:
+    writer = ConceptStoreWriter(output_dir)
+else:
+    writer = LocalIndexWriter(output_dir, row_count, vector_dim, info={
+        "model": args.model,
+        "source_db": args.db,
+        "collection": args.collection,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+sparse_writer = SparseIndexWriter(output_dir) if export_sparse else None
+exported = 0
+
+with tqdm(total=row_count, desc="Exporting") as progress:
+    while True:
+        batch = iterator.next()
+        if not batch:
+            break
+        ids = [row["id"] for row in batch]
+        metadata = [{name: row.get(name) for name in METADATA_FIELDS} for row in batch]
+        if args.metadata_only:
+            writer.add(ids, metadata)
+        else:
+            # FLOAT16_VECTOR 字段以原始字节返回
+            vectors = [np.frombuffer(row["vector"], dtype=np.float16) if isinstance(row["vector"], bytes)
+                       else row["vector"] for row in batch]
+            writer.add(ids, vectors, metadata)
+        if sparse_writer is not None:
+            for offset, row in enumerate(batch):
+                sparse_writer.add(exported + offset, dict(row["sparse_vector"]))
+        exported += len(batch)
+        progress.update(len(batch))
+
+iterator.close()
+writer.close()
+if sparse_writer is not None:
+    sparse_writer.close()
+connections.disconnect("export")
+logging.info(f"Local index written to {output_dir}")
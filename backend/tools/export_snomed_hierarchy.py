@@ -0,0 +1,78 @@
+"""
+将 SNOMED 概念、ISA 关系和描述快照为内存映射的层级索引（见 utils/snomed_hierarchy.py）
+
+数据来源二选一：
+- Neo4j（默认）：读取 tools/build.cypher 建立的 ObjectConcept、ISA、HAS_DESCRIPTION，连接参数取自 .env 的 NEO4J_*；
+- --csv-dir：直接读取 build.cypher 导入 Neo4j 时使用的 concept_new.csv、descrip_new.csv、isa_rel_new.csv。
+只保留 active = 1 的概念、关系和描述。
+
+导出后 StdService 可按层级过滤检索结果（search_within），create_milvus_db_with_graph.py 从快照读取同义词，不再逐条查询 Neo4j。
+
+用法（在项目根目录执行）：
+    python backend/tools/export_snomed_hierarchy.py --output backend/db/snomed_hierarchy
+    python backend/tools/export_snomed_hierarchy.py --csv-dir /var/lib/neo4j/import --output backend/db/snomed_hierarchy
+"""
+import argparse
+import csv
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.snomed_hierarchy import build_hierarchy
+
+load_dotenv()
+
+# 设置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+parser = argparse.ArgumentParser(description="Snapshot the SNOMED ISA hierarchy and descriptions")
+parser.add_argument("--output", default="backend/db/snomed_hierarchy", help="输出目录")
+parser.add_argument("--csv-dir", default=None, help="从 RF2 导出的 CSV 读取，而不是 Neo4j")
+parser.add_argument("--fetch-size", type=int, default=10000, help="Neo4j 结果流的批大小")
+args = parser.parse_args()
+
+
+def active(value):
+    return str(value).strip() in ("1", "true", "True")
+
+
+def read_csv(name):
+    csv.field_size_limit(sys.maxsize)
+    with open(os.path.join(args.csv_dir, name), newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+if args.csv_dir:
+    concepts = [(row["id"], row.get("FSN", "")) for row in read_csv("concept_new.csv") if active(row["active"])]
+    edges = [(row["sourceId"], row["destinationId"]) for row in read_csv("isa_rel_new.csv") if active(row["active"])]
+    descriptions = [(row["sctid"], row["term"]) for row in read_csv("descrip_new.csv") if active(row["active"])]
+    source = f"csv:{os.path.abspath(args.csv_dir)}"
+else:
+    from neo4j import GraphDatabase
+    neo4j_uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
+    driver = GraphDatabase.driver(neo4j_uri, auth=(os.getenv("NEO4J_USER", "neo4j"),
+                                                   os.getenv("NEO4J_PASSWORD", "neo4j")))
+    with driver.session(fetch_size=args.fetch_size) as session:
+        logging.info("Reading concepts")
+        concepts = [(record["id"], record["fsn"]) for record in session.run(
+            "MATCH (c:ObjectConcept) WHERE c.active = '1' RETURN c.id AS id, c.FSN AS fsn")]
+        logging.info("Reading ISA edges")
+        edges = [(record["source"], record["destination"]) for record in session.run(
+            "MATCH (c1:ObjectConcept)-[r:ISA]->(c2:ObjectConcept) WHERE r.active = '1' "
+            "RETURN c1.id AS source, c2.id AS destination")]
+        logging.info("Reading descriptions")
+        descriptions = [(record["id"], record["term"]) for record in session.run(
+            "MATCH (c:ObjectConcept)-[:HAS_DESCRIPTION]->(d:Description) WHERE d.active = '1' "
+            "RETURN c.id AS id, d.term AS term")]
+    driver.close()
+    source = f"neo4j:{neo4j_uri}"
+
+logging.info(f"Building hierarchy from {len(concepts)} concepts, {len(edges)} ISA edges, "
+             f"{len(descriptions)} descriptions")
+info = build_hierarchy(args.output, concepts, edges, descriptions, source=source)
+if info["cyclic_concepts"]:
+    logging.warning(f"{info['cyclic_concepts']} concepts are on ISA cycles; only their direct parents were kept")
+logging.info(f"Wrote {args.output}: {info}")
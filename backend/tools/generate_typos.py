@@ -0,0 +1,109 @@
+"""
+批量生成带合成拼写错误的病历（纠错评测语料）
+
+流式读取 JSONL / CSV / Parquet 中的病历，按 --batch-size 分批注入键盘相邻键错误（utils/typo_generator.py），
+输出 JSONL：每条记录包含 id、text（原文）、text_with_mistakes 和 edits（每处错误的真值）。
+第 k 批使用由 (--seed, k) 确定的随机数生成器，相同的输入、--seed 和 --batch-size 得到完全相同的输出，与 --workers 无关。
+
+用法（在项目根目录执行）：
+    python backend/tools/generate_typos.py --input notes.jsonl --output noisy.jsonl --seed 42
+    python backend/tools/generate_typos.py --input notes.parquet --output noisy.jsonl --probability 0.2 --max-errors 3 --workers 8
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from tqdm import tqdm
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.typo_generator import TypoGenerator, batch_rng
+from batch_standardize import batched, detect_format, read_records
+
+# 设置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 工作进程中的生成器和参数
+_generator = None
+_settings = None
+
+
+def init_worker(settings):
+    global _generator, _settings
+    _settings = settings
+    _generator = TypoGenerator(settings["keyboard"], min_length=settings["min_length"])
+
+
+def corrupt_batch(task):
+    """处理一批记录，返回已序列化的 JSONL 文本和错误数"""
+    batch_index, records = task
+    ids = [record_id for record_id, _ in records]
+    texts = [text for _, text in records]
+    corrupted, edits = _generator.corrupt_batch(texts, _settings["probability"], _settings["max_errors"],
+                                                batch_rng(_settings["seed"], batch_index))
+    lines = [
+        json.dumps({"id": record_id, "text": text, "text_with_mistakes": noisy, "edits": record_edits},
+                   ensure_ascii=False)
+        for record_id, text, noisy, record_edits in zip(ids, texts, corrupted, edits)
+    ]
+    return "\n".join(lines) + "\n", len(records), sum(len(record_edits) for record_edits in edits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inject synthetic keyboard typos into clinical notes")
+    parser.add_argument("--input", required=True, help="输入文件（JSONL / CSV / Parquet）")
+    parser.add_argument("--output", required=True, help="输出 JSONL 文件")
+    parser.add_argument("--input-format", choices=["jsonl", "csv", "parquet"])
+    parser.add_argument("--text-field", default="text")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--probability", type=float, default=0.3, help="每个单词出错的概率")
+    parser.add_argument("--max-errors", type=int, default=5, help="每条病历最多的错误数")
+    parser.add_argument("--keyboard", choices=["qwerty", "azerty"], default="qwerty")
+    parser.add_argument("--min-length", type=int, default=3, help="参与注入错误的最短单词长度")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=10000, help="每批病历数（影响随机序列的划分）")
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数，1 表示在当前进程中运行")
+    args = parser.parse_args()
+
+    settings = {
+        "probability": args.probability,
+        "max_errors": args.max_errors,
+        "keyboard": args.keyboard,
+        "min_length": args.min_length,
+        "seed": args.seed,
+    }
+    records = read_records(args.input, detect_format(args.input, args.input_format), args.text_field, args.id_field)
+    tasks = enumerate(batched(records, args.batch_size))
+
+    started = time.time()
+    total_records = total_edits = 0
+    pool = None
+    if args.workers > 1:
+        pool = multiprocessing.get_context("spawn").Pool(args.workers, initializer=init_worker, initargs=(settings,))
+        results = pool.imap(corrupt_batch, tasks)
+    else:
+        init_worker(settings)
+        results = map(corrupt_batch, tasks)
+
+    try:
+        with open(args.output, "w", encoding="utf-8") as output, tqdm(unit="notes") as progress:
+            for text, record_count, edit_count in results:
+                output.write(text)
+                total_records += record_count
+                total_edits += edit_count
+                progress.update(record_count)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = max(time.time() - started, 1e-9)
+    logging.info(f"Wrote {total_records} notes with {total_edits} edits to {args.output} "
+                 f"in {elapsed:.1f}s ({total_records / elapsed * 60:,.0f} notes/min)")
+
+
+if __name__ == "__main__":
+    main()
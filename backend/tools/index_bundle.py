@@ -0,0 +1,149 @@
+"""
+导出 / 导入 / 校验预构建的索引包（见 utils/index_bundle.py）
+
+新节点导入索引包后 StdService 直接 mmap 本地索引，不需要重新运行 create_milvus_db.py 计算全部概念的嵌入。
+
+用法（在项目根目录执行）：
+    # 先用 tools/export_local_index.py 导出本地索引，再打包（记录模型指纹需要加载嵌入模型）
+    python backend/tools/index_bundle.py export --db backend/db/snomed_bge_m3.db --collection concepts_only_name --model BAAI/bge-m3 --output snomed_bge_m3.bundle.tar
+    # 新节点：解包并校验，StdService 直接使用
+    python backend/tools/index_bundle.py import --bundle snomed_bge_m3.bundle.tar --db backend/db/snomed_bge_m3.db --collection concepts_only_name
+    # 或者批量写入 Milvus 集合（沿用包中的主键），本地只保留概念存储和 manifest
+    python backend/tools/index_bundle.py import --bundle snomed_bge_m3.bundle.tar --db backend/db/snomed_bge_m3.db --collection concepts_only_name --milvus
+    python backend/tools/index_bundle.py verify --db backend/db/snomed_bge_m3.db --collection concepts_only_name
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+from tqdm import tqdm
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.index_bundle import (MANIFEST_FILE, pack_bundle, read_manifest, unpack_bundle, verify_bundle,
+                                write_manifest)
+from utils.local_index import INDEX_FILE, LocalIndex, index_dir_for
+from utils.concept_store import FIELDS as CONCEPT_FIELDS
+
+# 设置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 写入 Milvus 时各字符串字段的最大长度
+FIELD_MAX_LENGTH = {
+    "concept_id": 50,
+    "concept_name": 1000,
+    "domain_id": 20,
+    "vocabulary_id": 20,
+    "concept_class_id": 20,
+    "standard_concept": 1,
+    "concept_code": 50,
+    "synonyms": 65535,
+}
+
+
+def export_bundle(args, index_dir):
+    embedding_func = None
+    if not args.no_fingerprint:
+        from utils.embedding_config import EmbeddingConfig, EmbeddingProvider
+        from utils.embedding_factory import EmbeddingFactory
+        embedding_func = EmbeddingFactory.create_embedding_function(
+            EmbeddingConfig(provider=EmbeddingProvider(args.provider), model_name=args.model))
+    manifest = write_manifest(index_dir, args.model, args.model_revision, embedding_func)
+    logging.info(f"Wrote {MANIFEST_FILE} for {len(manifest['files'])} files in {index_dir}")
+    if args.output:
+        pack_bundle(index_dir, args.output)
+        logging.info(f"Bundle written to {args.output} ({os.path.getsize(args.output) / 1024 / 1024:.1f} MB)")
+
+
+def load_into_milvus(args, index_dir):
+    """把本地索引的向量和元数据按原主键写入 Milvus 集合，之后本地只保留概念存储"""
+    from pymilvus import CollectionSchema, DataType, FieldSchema, MilvusClient
+
+    index = LocalIndex(index_dir)
+    count, dim = index.vectors.shape
+    client = MilvusClient(args.db)
+    if client.has_collection(args.collection):
+        if not args.overwrite:
+            raise SystemExit(f"Collection {args.collection} already exists, use --overwrite to replace it")
+        client.drop_collection(args.collection)
+
+    fields = [
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=dim),
+    ] + [FieldSchema(name=name, dtype=DataType.VARCHAR, max_length=FIELD_MAX_LENGTH[name]) for name in CONCEPT_FIELDS]
+    schema = CollectionSchema(fields, f"SNOMED-CT Concepts ({index.model})", enable_dynamic_field=True)
+    client.create_collection(collection_name=args.collection, schema=schema)
+    index_params = client.prepare_index_params()
+    index_params.add_index(field_name="vector", index_type="AUTOINDEX", metric_type="COSINE")
+    client.create_index(collection_name=args.collection, index_params=index_params)
+
+    with tqdm(total=count, desc="Loading into Milvus") as progress:
+        for start in range(0, count, args.batch_size):
+            end = min(start + args.batch_size, count)
+            vectors = np.asarray(index.vectors[start:end], dtype=np.float32)
+            data = []
+            for offset, row in enumerate(range(start, end)):
+                record = {name: str(value or "")[:FIELD_MAX_LENGTH[name]]
+                          for name, value in index.metadata(row).items()}
+                record.update(id=int(index.ids[row]), vector=vectors[offset])
+                data.append(record)
+            client.insert(collection_name=args.collection, data=data)
+            progress.update(end - start)
+    client.load_collection(args.collection)
+    del index
+
+    # 删除向量文件，StdService 改为 Milvus 检索 + 本地概念存储补全元数据；manifest 只保留剩余文件
+    manifest = read_manifest(index_dir)
+    for name in list(manifest["files"]):
+        if name == INDEX_FILE or name.startswith("vectors") or name in ("ids.npy", "projection.npz"):
+            os.remove(os.path.join(index_dir, name))
+            del manifest["files"][name]
+    manifest["milvus"] = {"uri": args.db, "collection": args.collection}
+    with open(os.path.join(index_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    logging.info(f"Loaded {count} concepts into {args.collection}; kept the concept store in {index_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export, import and verify prebuilt index bundles")
+    parser.add_argument("command", choices=["export", "import", "verify"])
+    parser.add_argument("--db", default="backend/db/snomed_bge_m3.db", help="Milvus 数据库文件")
+    parser.add_argument("--collection", default="concepts_only_name", help="集合名称")
+    parser.add_argument("--index-dir", default=None, help="本地索引目录，默认 <db>_index/<collection>")
+    parser.add_argument("--bundle", default=None, help="import / verify 的索引包文件")
+    parser.add_argument("--output", default=None, help="export 输出的索引包文件，省略时只写入 manifest")
+    parser.add_argument("--provider", default="huggingface", help="记录模型指纹时使用的嵌入模型提供商")
+    parser.add_argument("--model", default="BAAI/bge-m3", help="构建索引时使用的嵌入模型")
+    parser.add_argument("--model-revision", default=None, help="模型版本（如 HuggingFace commit）")
+    parser.add_argument("--no-fingerprint", action="store_true", help="不加载模型、不记录模型指纹")
+    parser.add_argument("--no-verify", action="store_true", help="导入时只比较文件大小，不计算校验和")
+    parser.add_argument("--milvus", action="store_true", help="导入后批量写入 Milvus 集合")
+    parser.add_argument("--overwrite", action="store_true", help="--milvus 时替换已有集合")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    index_dir = args.index_dir or index_dir_for(args.db, args.collection)
+    if args.command == "export":
+        export_bundle(args, index_dir)
+    elif args.command == "import":
+        if not args.bundle:
+            raise SystemExit("import requires --bundle")
+        manifest = unpack_bundle(args.bundle, index_dir, checksums=not args.no_verify)
+        logging.info(f"Imported bundle built with {manifest['model']} "
+                     f"({manifest['index'].get('count')} concepts, dim {manifest['index'].get('dim')}) into {index_dir}")
+        if args.milvus:
+            load_into_milvus(args, index_dir)
+    else:
+        if args.bundle:
+            import tempfile
+            with tempfile.TemporaryDirectory() as staging:
+                manifest = unpack_bundle(args.bundle, os.path.join(staging, "bundle"))
+        else:
+            manifest = verify_bundle(index_dir)
+        logging.info(f"Bundle OK: model {manifest['model']}, {len(manifest['files'])} files")
+
+
+if __name__ == "__main__":
+    main()
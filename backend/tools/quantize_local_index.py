@@ -0,0 +1,65 @@
+"""
+为本地索引生成量化码并测量召回损失
+
+量化后 StdService 的本地检索变为两阶段：量化码粗排 + float32 精确重排。
+如果已经用 tools/reduce_local_index.py 降维，量化的是降维后的向量。
+召回率以精确检索的 top-k 为基准，查询取自索引中随机向量加高斯噪声（模拟与概念名称不完全一致的实体文本）。
+
+用法（在项目根目录执行）：
+    python backend/tools/quantize_local_index.py --index-dir backend/db/snomed_bge_m3_index/concepts_only_name --kind int8
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.local_index import INDEX_FILE, LocalIndex, evaluate_recall, sample_queries
+from utils.quantization import QUANTIZATION_KINDS, Quantizer
+
+# 设置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+parser = argparse.ArgumentParser(description="Quantize a local index and measure recall loss")
+parser.add_argument("--index-dir", default="backend/db/snomed_bge_m3_index/concepts_only_name")
+parser.add_argument("--kind", choices=QUANTIZATION_KINDS, default="int8")
+parser.add_argument("--rerank-candidates", type=int, default=100, help="粗排候选数，越大召回越高、重排越慢")
+parser.add_argument("--eval-queries", type=int, default=500)
+parser.add_argument("--noise", type=float, default=0.05, help="评估查询的噪声标准差（按维度）")
+parser.add_argument("--k", type=int, default=5)
+parser.add_argument("--seed", type=int, default=42)
+args = parser.parse_args()
+
+# 编码全部向量（有降维向量时编码降维后的向量）
+index = LocalIndex(args.index_dir)
+vectors = index.vectors
+source = index.reduced if index.reduced is not None else vectors
+quantizer = Quantizer.fit(args.kind, source)
+codes = np.concatenate([quantizer.encode(source[start:start + 65536])
+                        for start in range(0, len(source), 65536)])
+quantizer.save(args.index_dir, codes)
+logging.info(f"Encoded {len(source)} vectors (dim={source.shape[1]}) as {args.kind}: "
+             f"{vectors.nbytes / 2**20:.1f} MiB -> {codes.nbytes / 2**20:.1f} MiB "
+             f"({vectors.nbytes / codes.nbytes:.0f}x smaller than float32 full width)")
+
+# 测量两阶段检索相对精确检索的召回率和延迟
+queries = sample_queries(vectors, args.eval_queries, args.noise, args.seed)
+index.quantizer, index.codes, index.rerank_candidates = quantizer, codes, args.rerank_candidates
+metrics = evaluate_recall(index, queries, args.k)
+recall = metrics[f"recall@{args.k}"]
+logging.info(f"recall@{args.k}={recall:.4f}, exact {metrics['exact_ms']:.2f} ms/query, "
+             f"{args.kind} two-stage {metrics['search_ms']:.2f} ms/query")
+
+# 写入 index.json，StdService 下次打开索引时启用两阶段检索
+index.info["quantization"] = {
+    "kind": args.kind,
+    "rerank_candidates": args.rerank_candidates,
+    "compression": round(vectors.nbytes / codes.nbytes, 1),
+    f"recall@{args.k}": round(recall, 4),
+}
+with open(os.path.join(args.index_dir, INDEX_FILE), "w", encoding="utf-8") as f:
+    json.dump(index.info, f, ensure_ascii=False, indent=2)
+logging.info(f"Updated {os.path.join(args.index_dir, INDEX_FILE)}")
@@ -0,0 +1,69 @@
+"""
+为本地索引生成降维向量（Matryoshka 截断或 PCA）并测量召回损失
+
+降维后 StdService 的本地检索先在 128-256 维的向量上粗排，再对前 rerank_candidates 个候选做全维精确重排。
+BGE-M3 没有做 Matryoshka 训练，直接截断前缀损失较大，建议使用 pca。
+降维会使已有的量化码失效，需要重新运行 tools/quantize_local_index.py（量化降维后的向量）。
+
+用法（在项目根目录执行）：
+    python backend/tools/reduce_local_index.py --index-dir backend/db/snomed_bge_m3_index/concepts_only_name --kind pca --dim 256
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.local_index import INDEX_FILE, LocalIndex, evaluate_recall, sample_queries
+from utils.projection import PROJECTION_KINDS, REDUCED_VECTORS_FILE, Projection
+
+# 设置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+parser = argparse.ArgumentParser(description="Add a reduced-dimension first stage to a local index")
+parser.add_argument("--index-dir", default="backend/db/snomed_bge_m3_index/concepts_only_name")
+parser.add_argument("--kind", choices=PROJECTION_KINDS, default="pca")
+parser.add_argument("--dim", type=int, default=256)
+parser.add_argument("--rerank-candidates", type=int, default=100, help="全维重排的候选数")
+parser.add_argument("--eval-queries", type=int, default=500)
+parser.add_argument("--noise", type=float, default=0.05, help="评估查询的噪声标准差（按维度）")
+parser.add_argument("--k", type=int, default=5)
+parser.add_argument("--seed", type=int, default=42)
+args = parser.parse_args()
+
+index = LocalIndex(args.index_dir)
+vectors = index.vectors
+if args.dim >= vectors.shape[1]:
+    parser.error(f"--dim must be smaller than the index dimension ({vectors.shape[1]})")
+
+# 拟合投影并写出降维向量
+projection = Projection.fit(args.kind, vectors, args.dim)
+reduced = projection.transform_all(vectors)
+projection.save(args.index_dir)
+np.save(os.path.join(args.index_dir, REDUCED_VECTORS_FILE), reduced)
+logging.info(f"Projected {len(vectors)} vectors {vectors.shape[1]} -> {args.dim} dims ({args.kind})")
+
+# 测量两阶段检索相对精确检索的召回率和延迟（不叠加量化）
+queries = sample_queries(vectors, args.eval_queries, args.noise, args.seed)
+index.projection, index.reduced, index.rerank_candidates = projection, reduced, args.rerank_candidates
+index.quantizer, index.codes = None, None
+metrics = evaluate_recall(index, queries, args.k)
+recall = metrics[f"recall@{args.k}"]
+logging.info(f"recall@{args.k}={recall:.4f}, exact {metrics['exact_ms']:.2f} ms/query, "
+             f"{args.dim}-dim two-stage {metrics['search_ms']:.2f} ms/query")
+
+# 写入 index.json；旧的量化码基于全维向量，已经不适用
+index.info["projection"] = {
+    "kind": args.kind,
+    "dim": args.dim,
+    "rerank_candidates": args.rerank_candidates,
+    f"recall@{args.k}": round(recall, 4),
+}
+if index.info.pop("quantization", None):
+    logging.warning("Dropped existing quantization; re-run tools/quantize_local_index.py to quantize the reduced vectors")
+with open(os.path.join(args.index_dir, INDEX_FILE), "w", encoding="utf-8") as f:
+    json.dump(index.info, f, ensure_ascii=False, indent=2)
+logging.info(f"Updated {os.path.join(args.index_dir, INDEX_FILE)}")
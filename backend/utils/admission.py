@@ -0,0 +1,187 @@
+"""
+按端点的准入控制和降级判断
+
+每个端点有固定的并发上限和有界等待队列：
+- 队列已满时立即拒绝（429 + Retry-After），不再让请求无限排队；
+- 在截止时间内没有等到执行槽位时拒绝（503 + Retry-After）；
+- 已开始执行但超过截止时间时返回 504，执行槽位在后台任务真正结束后才释放，
+  因此被放弃的 LLM 调用不会让实际并发超过上限。
+截止时间来自请求头 X-Request-Timeout-Ms，没有时使用端点的默认值。
+
+LatencyMonitor 记录 LLM 调用耗时的指数滑动平均，超过阈值时端点切换到本地降级实现，
+并每隔 probe_interval 秒放行一次真实调用，用来探测 LLM 是否已经恢复。
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from functools import partial
+from typing import Any, Callable, Optional
+
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+
+class Overloaded(Exception):
+    """请求因过载或超过截止时间被拒绝"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def request_deadline(headers, default_timeout: float) -> float:
+    """根据请求头计算截止时间（time.monotonic() 时间基准）"""
+    value = headers.get(DEADLINE_HEADER)
+    timeout = default_timeout
+    if value:
+        try:
+            timeout = min(float(value) / 1000.0, default_timeout)
+        except ValueError:
+            pass
+    return time.monotonic() + timeout
+
+
+class LatencyMonitor:
+    """
+    LLM 调用耗时的指数滑动平均
+
+    Args:
+        threshold_ms: 平均耗时超过该值时建议降级，0 表示不降级
+        alpha: 滑动平均的权重
+        probe_interval: 降级期间放行真实调用的间隔（秒）
+    """
+
+    def __init__(self, threshold_ms: float = 0.0, alpha: float = 0.2, probe_interval: float = 5.0):
+        self.threshold_ms = threshold_ms
+        self.alpha = alpha
+        self.probe_interval = probe_interval
+        self.average_ms: Optional[float] = None
+        self._last_probe = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            ms = seconds * 1000.0
+            self.average_ms = ms if self.average_ms is None else self.alpha * ms + (1 - self.alpha) * self.average_ms
+
+    def degraded(self) -> bool:
+        """当前请求是否应该使用降级实现"""
+        with self._lock:
+            if not self.threshold_ms or self.average_ms is None or self.average_ms <= self.threshold_ms:
+                return False
+            now = time.monotonic()
+            if now - self._last_probe >= self.probe_interval:
+                self._last_probe = now
+                return False
+            return True
+
+
+class AdmissionController:
+    """
+    单个端点的准入控制
+
+    Args:
+        name: 端点名称（用于错误信息）
+        max_concurrency: 同时执行的请求数
+        max_queue: 等待执行槽位的请求数上限
+        default_timeout: 请求没有携带截止时间时的默认超时（秒）
+    """
+
+    def __init__(self, name: str, max_concurrency: int = 4, max_queue: int = 16, default_timeout: float = 60.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._service_time = LatencyMonitor()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def from_env(cls, name: str, max_concurrency: int, max_queue: int, default_timeout: float) -> "AdmissionController":
+        """从环境变量 <NAME>_MAX_CONCURRENCY、<NAME>_MAX_QUEUE、<NAME>_TIMEOUT 读取配置"""
+        prefix = name.upper()
+        return cls(name,
+                   int(os.getenv(f"{prefix}_MAX_CONCURRENCY", max_concurrency)),
+                   int(os.getenv(f"{prefix}_MAX_QUEUE", max_queue)),
+                   float(os.getenv(f"{prefix}_TIMEOUT", default_timeout)))
+
+    def retry_after(self) -> int:
+        """按平均执行时间和排队长度估算的重试等待秒数"""
+        average = (self._service_time.average_ms or 1000.0) / 1000.0
+        return max(1, math.ceil(average * (self.waiting + 1) / self.max_concurrency))
+
+    async def acquire(self, deadline: float):
+        """
+        占用一个执行槽位，用完后必须调用 release（流式响应在整个输出过程中占用槽位）
+
+        Raises:
+            Overloaded: 队列已满（429）或等待超时（503）
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+
+        if self.active + self.waiting >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise Overloaded(429, f"{self.name} queue is full", self.retry_after())
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded(503, f"{self.name} is overloaded", self.retry_after())
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self, elapsed: Optional[float] = None, monitor: Optional[LatencyMonitor] = None):
+        """释放 acquire 占用的槽位，elapsed 为成功执行的耗时（秒）"""
+        self.active -= 1
+        self._slots.release()
+        if elapsed is not None:
+            self._service_time.observe(elapsed)
+            if monitor is not None:
+                monitor.observe(elapsed)
+
+    async def run(self, func: Callable, *args, deadline: float, monitor: Optional[LatencyMonitor] = None) -> Any:
+        """
+        在截止时间内执行阻塞函数（在线程池中）或协程函数
+
+        Args:
+            func: 阻塞的服务方法，或 async 服务方法（超时时直接取消）
+            deadline: 截止时间（time.monotonic() 时间基准）
+            monitor: 记录本次执行耗时的 LatencyMonitor；超过截止时间时按已等待的时间记录，
+                否则卡住的 LLM 调用永远不会被计入，也就不会触发降级
+
+        Raises:
+            Overloaded: 队列已满（429）、等待超时（503）或执行超时（504）
+        """
+        await self.acquire(deadline)
+        started = time.monotonic()
+        if asyncio.iscoroutinefunction(func):
+            future = asyncio.ensure_future(func(*args))
+        else:
+            future = asyncio.get_running_loop().run_in_executor(None, partial(func, *args))
+        timed_out = False
+
+        def _done(f):
+            # 后台调用真正结束后才释放槽位；超时的调用已经按截止时间计入 monitor
+            succeeded = not f.cancelled() and f.exception() is None
+            self.release(time.monotonic() - started if succeeded else None, None if timed_out else monitor)
+
+        future.add_done_callback(_done)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            timed_out = True
+            if monitor is not None:
+                monitor.observe(time.monotonic() - started)
+            # 线程无法中断，只能等它结束；协程直接取消，尽快释放槽位
+            if isinstance(future, asyncio.Task):
+                future.cancel()
+            raise Overloaded(504, f"{self.name} deadline exceeded")
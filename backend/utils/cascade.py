@@ -0,0 +1,170 @@
+"""
+置信度门控的级联策略：向量检索结果明确时直接返回，只有模糊的情况才升级到 LLM 扩展或重排
+
+判断方式与 utils/confidence.py 相同：第一名的 COSINE 相似度不低于 min_score，且领先第二名不少于 min_margin。
+阈值按以下优先级读取：
+    1. 环境变量 CASCADE_<NAME>_MIN_SCORE / CASCADE_<NAME>_MIN_MARGIN（NAME 为策略名的大写，如 ABBR、STD）
+    2. tools/calibrate_cascade.py 在带标注的数据上拟合并写入的阈值文件（CASCADE_THRESHOLDS_FILE，默认 db/cascade_thresholds.json）
+    3. 代码中的默认值
+每个策略统计直接返回和升级的次数，升级率通过 /api/cascade/metrics 查看。
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from utils.confidence import is_decisive, top_margin
+
+THRESHOLDS_FILE = os.getenv("CASCADE_THRESHOLDS_FILE", "db/cascade_thresholds.json")
+
+
+def load_thresholds(path: str = THRESHOLDS_FILE) -> Dict[str, Dict]:
+    """读取阈值文件，不存在时返回空字典"""
+    if not os.path.isfile(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_thresholds(name: str, thresholds: Dict, path: str = THRESHOLDS_FILE):
+    """把一个策略的阈值写入阈值文件（保留其他策略）"""
+    all_thresholds = load_thresholds(path)
+    all_thresholds[name] = thresholds
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(all_thresholds, f, ensure_ascii=False, indent=2)
+
+
+class CascadePolicy:
+    """
+    Args:
+        name: 策略名（abbr/std）
+        min_score: 第一名的最低相似度
+        min_margin: 第一名与第二名的最小差距
+        window: 计算近期升级率的决策数
+    """
+
+    def __init__(self, name: str, min_score: float, min_margin: float, source: str = "default",
+                 window: int = 1000):
+        self.name = name
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.source = source
+        self._lock = threading.Lock()
+        self._accepted = 0
+        self._escalated = 0
+        self._recent = deque(maxlen=window)
+
+    @classmethod
+    def from_config(cls, name: str, min_score: float = 0.75, min_margin: float = 0.05,
+                    path: str = THRESHOLDS_FILE) -> "CascadePolicy":
+        """按环境变量、阈值文件、默认值的优先级创建策略"""
+        env_score = os.getenv(f"CASCADE_{name.upper()}_MIN_SCORE")
+        env_margin = os.getenv(f"CASCADE_{name.upper()}_MIN_MARGIN")
+        if env_score is not None or env_margin is not None:
+            return cls(name, float(env_score if env_score is not None else min_score),
+                       float(env_margin if env_margin is not None else min_margin), source="env")
+        calibrated = load_thresholds(path).get(name)
+        if calibrated:
+            return cls(name, float(calibrated["min_score"]), float(calibrated["min_margin"]), source=path)
+        return cls(name, min_score, min_margin)
+
+    def accepts(self, results: List[Dict], score_key: str = "distance") -> bool:
+        """向量检索结果是否可以直接返回，并计入统计"""
+        accepted = is_decisive(results, self.min_score, self.min_margin, score_key)
+        self.record(escalated=not accepted)
+        return accepted
+
+    def record(self, escalated: bool):
+        with self._lock:
+            if escalated:
+                self._escalated += 1
+            else:
+                self._accepted += 1
+            self._recent.append(escalated)
+
+    def stats(self) -> Dict:
+        """直接返回 / 升级次数、累计和近期升级率，以及当前阈值"""
+        with self._lock:
+            total = self._accepted + self._escalated
+            recent = list(self._recent)
+        return {
+            "min_score": self.min_score,
+            "min_margin": self.min_margin,
+            "thresholds_source": self.source,
+            "decisions": total,
+            "accepted": self._accepted,
+            "escalated": self._escalated,
+            "escalation_rate": self._escalated / total if total else 0.0,
+            "recent_escalation_rate": sum(recent) / len(recent) if recent else 0.0,
+        }
+
+
+def confidence_features(results_list: Sequence[List[Dict]], score_key: str = "distance"):
+    """每组检索结果的 (第一名得分, 领先幅度)，没有结果时为 (-inf, 0)"""
+    top = np.array([float(results[0][score_key]) if results else -np.inf for results in results_list])
+    margins = np.array([top_margin(results, score_key) for results in results_list])
+    return top, margins
+
+
+def calibrate(top_scores: Sequence[float], margins: Sequence[float], correct: Sequence[bool],
+              target_precision: float = 0.95, min_accepted: int = 20, grid: int = 50) -> Optional[Dict]:
+    """
+    在带标注的数据上拟合阈值：直接返回的结果中第一名正确的比例不低于 target_precision，且直接返回的比例最大
+
+    候选阈值取观测值的分位数；逐个 min_score 候选计算，每次在 numpy 中同时评估全部 min_margin 候选。
+
+    Args:
+        top_scores: 每个查询第一名的相似度
+        margins: 每个查询第一名领先第二名的幅度
+        correct: 每个查询的第一名是否为标准答案
+        target_precision: 直接返回结果的最低准确率
+        min_accepted: 直接返回的最少查询数，避免在极少数样本上过拟合
+        grid: 每个维度的候选阈值数
+
+    Returns:
+        {"min_score", "min_margin", "precision", "acceptance_rate", "escalation_rate", "samples",
+         "target_precision", "baseline_precision"}，没有满足条件的阈值时返回 None
+    """
+    top_scores = np.asarray(top_scores, dtype=np.float64)
+    margins = np.asarray(margins, dtype=np.float64)
+    correct = np.asarray(correct, dtype=bool)
+    finite = np.isfinite(top_scores)
+    if not finite.any():
+        return None
+    quantiles = np.linspace(0.0, 1.0, grid)
+    score_candidates = np.unique(np.quantile(top_scores[finite], quantiles))
+    # 负的领先幅度表示第一名不是相似度最高的结果（hybrid / 联合检索），不作为候选阈值
+    margin_candidates = np.unique(np.concatenate(([0.0], np.maximum(np.quantile(margins[finite], quantiles), 0.0))))
+
+    # accepted_count[i, j] / correct_count[i, j]：(score_candidates[i], margin_candidates[j]) 下直接返回 / 其中正确的查询数
+    margin_ok = margins[None, :] >= margin_candidates[:, None]
+    accepted_count = np.zeros((len(score_candidates), len(margin_candidates)), dtype=np.int64)
+    correct_count = np.zeros_like(accepted_count)
+    for i, threshold in enumerate(score_candidates):
+        accepted = margin_ok & (top_scores >= threshold)[None, :]
+        accepted_count[i] = accepted.sum(axis=1)
+        correct_count[i] = (accepted & correct[None, :]).sum(axis=1)
+    precision = np.divide(correct_count, accepted_count, out=np.zeros(accepted_count.shape), where=accepted_count > 0)
+    feasible = (precision >= target_precision) & (accepted_count >= min_accepted)
+    if not feasible.any():
+        return None
+    # 直接返回最多的组合；相同时取准确率更高的
+    order = np.lexsort((np.where(feasible, precision, -1).ravel(), np.where(feasible, accepted_count, -1).ravel()))
+    i, j = np.unravel_index(order[-1], accepted_count.shape)
+    samples = len(top_scores)
+    return {
+        "min_score": float(score_candidates[i]),
+        "min_margin": float(margin_candidates[j]),
+        "precision": float(precision[i, j]),
+        "acceptance_rate": float(accepted_count[i, j] / samples),
+        "escalation_rate": float(1 - accepted_count[i, j] / samples),
+        "samples": samples,
+        "target_precision": target_precision,
+        "baseline_precision": float(correct.mean()),
+        "calibrated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
@@ -0,0 +1,143 @@
+"""
+紧凑的本地概念元数据存储
+
+domain_id / vocabulary_id / concept_class_id / standard_concept 等低基数字段驻留为 uint16 编码，
+概念名称、同义词等字符串统一存放在一个 UTF-8 字符串池（arena）中，按行号以偏移量读取。
+所有数组以只读 mmap 方式打开，检索时 Milvus 只需返回主键和距离，由本存储补全元数据。
+
+文件（与本地索引位于同一目录）：
+    concepts.json               字段列表和各类别字段的取值表
+    concept_pks.npy             int64 (N,)，每行对应的 Milvus 主键
+    concept_codes.npy           uint16 (N, C)，类别字段编码
+    concept_strings.bin         字符串池
+    concept_string_offsets.npy  uint64 (N * S + 1,)，第 row 行第 f 个字符串字段位于 [row * S + f, row * S + f + 1)
+"""
+import json
+import mmap
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+CONCEPTS_FILE = "concepts.json"
+PKS_FILE = "concept_pks.npy"
+CODES_FILE = "concept_codes.npy"
+STRINGS_FILE = "concept_strings.bin"
+STRING_OFFSETS_FILE = "concept_string_offsets.npy"
+
+# 概念字段，顺序与 StdService 返回结果一致
+FIELDS = [
+    "concept_id", "concept_name", "domain_id",
+    "vocabulary_id", "concept_class_id", "standard_concept",
+    "concept_code", "synonyms"
+]
+CATEGORY_FIELDS = ["domain_id", "vocabulary_id", "concept_class_id", "standard_concept"]
+STRING_FIELDS = [name for name in FIELDS if name not in CATEGORY_FIELDS]
+
+
+class ConceptStore:
+    """
+    只读的概念元数据存储，按行号或 Milvus 主键读取
+    """
+    _opened: Dict[str, "ConceptStore"] = {}
+    _opened_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, CONCEPTS_FILE), encoding="utf-8") as f:
+            info = json.load(f)
+        self.categories: Dict[str, List[Optional[str]]] = info["categories"]
+        self.pks = np.load(os.path.join(path, PKS_FILE), mmap_mode="r")
+        self._pk_order = np.argsort(self.pks, kind="stable")
+        self._sorted_pks = np.asarray(self.pks)[self._pk_order]
+        self._codes = np.load(os.path.join(path, CODES_FILE), mmap_mode="r")
+        self._offsets = np.load(os.path.join(path, STRING_OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(path, STRINGS_FILE), "rb") as f:
+            # 空文件不能 mmap
+            self._strings = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        self._category_columns = [(name, self.categories[name]) for name in CATEGORY_FIELDS]
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, CONCEPTS_FILE))
+
+    @classmethod
+    def open(cls, path: str) -> "ConceptStore":
+        """打开（或复用已打开的）概念存储"""
+        path = os.path.abspath(path)
+        with cls._opened_lock:
+            store = cls._opened.get(path)
+            if store is None:
+                store = cls(path)
+                cls._opened[path] = store
+            return store
+
+    def __len__(self) -> int:
+        return self.pks.shape[0]
+
+    def rows_for_pks(self, pks: Iterable[int]) -> np.ndarray:
+        """将 Milvus 主键转换为行号，不存在的主键返回 -1"""
+        pks = np.asarray(list(pks), dtype=np.int64)
+        if len(self._sorted_pks) == 0:
+            return np.full(len(pks), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self._sorted_pks, pks), len(self._sorted_pks) - 1)
+        found = self._sorted_pks[positions] == pks
+        return np.where(found, self._pk_order[positions], -1)
+
+    def get(self, row: int) -> Dict:
+        """读取第 row 行概念的全部字段"""
+        record = {}
+        base = row * len(STRING_FIELDS)
+        for i, name in enumerate(STRING_FIELDS):
+            start, end = int(self._offsets[base + i]), int(self._offsets[base + i + 1])
+            record[name] = self._strings[start:end].decode("utf-8")
+        codes = self._codes[row]
+        for i, (name, values) in enumerate(self._category_columns):
+            record[name] = values[codes[i]]
+        return {name: record[name] for name in FIELDS}
+
+
+class ConceptStoreWriter:
+    """
+    流式写入概念存储
+    """
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._pks: List[int] = []
+        self._codes: List[List[int]] = []
+        self._interned: Dict[str, Dict[Optional[str], int]] = {name: {} for name in CATEGORY_FIELDS}
+        self._strings = open(os.path.join(path, STRINGS_FILE), "wb")
+        self._offsets = [0]
+
+    def _intern(self, name: str, value: Optional[str]) -> int:
+        table = self._interned[name]
+        code = table.get(value)
+        if code is None:
+            code = len(table)
+            if code > np.iinfo(np.uint16).max:
+                raise ValueError(f"Too many distinct values for category field {name}")
+            table[value] = code
+        return code
+
+    def add(self, pks: List[int], records: List[Dict]):
+        """追加一批概念"""
+        for pk, record in zip(pks, records):
+            self._pks.append(int(pk))
+            self._codes.append([self._intern(name, record.get(name)) for name in CATEGORY_FIELDS])
+            for name in STRING_FIELDS:
+                data = (record.get(name) or "").encode("utf-8")
+                self._strings.write(data)
+                self._offsets.append(self._offsets[-1] + len(data))
+
+    def close(self):
+        self._strings.close()
+        np.save(os.path.join(self.path, PKS_FILE), np.asarray(self._pks, dtype=np.int64))
+        codes = np.asarray(self._codes, dtype=np.uint16).reshape(len(self._pks), len(CATEGORY_FIELDS))
+        np.save(os.path.join(self.path, CODES_FILE), codes)
+        np.save(os.path.join(self.path, STRING_OFFSETS_FILE), np.asarray(self._offsets, dtype=np.uint64))
+        categories = {name: list(table.keys()) for name, table in self._interned.items()}
+        with open(os.path.join(self.path, CONCEPTS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"fields": FIELDS, "count": len(self._pks), "categories": categories}, f,
+                      ensure_ascii=False, indent=2)
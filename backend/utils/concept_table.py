@@ -0,0 +1,56 @@
+"""
+SNOMED 概念 CSV 的列式读取（tools/create_milvus_db*.py 入库使用）
+
+PyArrow 多线程读取整个 CSV，所有列按字符串读取，空字段填为 "NA"（与原来 pandas 的 dtype=str + fillna("NA") 对应，
+但 "None"、"null" 等字面值保持原样，不会被当作缺失值）。
+文档文本用 Arrow 的向量化字符串函数拼接，每批按列切片后直接作为 Milvus 列式插入的数据，入库过程中不再逐行构造字典，
+除嵌入计算外每批只剩几次列切片。
+"""
+import csv
+from typing import Dict, List, Sequence
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+MISSING = "NA"
+
+# 写入 Milvus 的概念元数据列，顺序与集合 schema 一致
+CONCEPT_COLUMNS = [
+    "concept_id", "concept_name", "domain_id", "vocabulary_id", "concept_class_id",
+    "standard_concept", "concept_code", "valid_start_date", "valid_end_date",
+]
+
+
+def read_concepts(path: str, missing: str = MISSING) -> pa.Table:
+    """读取概念 CSV，所有列为字符串，空字段替换为 missing"""
+    with open(path, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f))
+    table = pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(
+        column_types={name: pa.string() for name in header},
+        null_values=[""],
+        strings_can_be_null=True,
+    ))
+    return pa.table({name: pc.fill_null(table.column(name), missing) for name in table.column_names})
+
+
+def build_documents(names, *parts) -> pa.ChunkedArray:
+    """
+    向量化拼接嵌入文档：concept_name 后依次接上各附加文本（空格分隔），附加文本为空字符串时跳过
+
+    Args:
+        names: 概念名称列
+        parts: 与 names 等长的附加文本列（Arrow 数组或字符串列表）
+    """
+    documents = names
+    for part in parts:
+        part = part if isinstance(part, (pa.Array, pa.ChunkedArray)) else pa.array(part, type=pa.string())
+        joined = pc.binary_join_element_wise(documents, part, " ")
+        documents = pc.if_else(pc.equal(part, ""), documents, joined)
+    return documents
+
+
+def column_batch(table: pa.Table, start: int, end: int, columns: Sequence[str]) -> Dict[str, List]:
+    """table 第 [start, end) 行指定列的 Python 列表（列式插入的数据）"""
+    batch = table.slice(start, end - start)
+    return {name: batch.column(name).to_pylist() for name in columns}
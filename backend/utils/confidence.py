@@ -0,0 +1,35 @@
+"""
+检索结果的置信度判断
+
+distance 为 COSINE 相似度（越大越相近）。稠密检索的结果按 distance 降序排列；
+hybrid 和联合检索的结果按 fusion_score 排列，第一名不一定是 distance 最高的一个。
+第一名（即返回给调用方的结果）足够相近、且比其余结果中最相近的一个高出足够差距时，认为结果是明确的，可以不再调用 LLM。
+"""
+from typing import Dict, List
+
+
+def top_margin(results: List[Dict], score_key: str = "distance") -> float:
+    """
+    第一名与其余结果中最高得分的差，只有一个结果时为第一名得分
+
+    结果不是按 score_key 排列时（如 hybrid 模式按 fusion_score 排列），第一名不是得分最高的一个，差值为负
+    """
+    if not results:
+        return 0.0
+    top = float(results[0][score_key])
+    return top - max(float(result[score_key]) for result in results[1:]) if len(results) > 1 else top
+
+
+def is_decisive(results: List[Dict], min_score: float, min_margin: float, score_key: str = "distance") -> bool:
+    """
+    检索结果是否明确
+
+    Args:
+        results: 检索结果，第一名为返回给调用方的结果
+        min_score: 第一名的最低得分
+        min_margin: 第一名比其余结果中最高得分高出的最小差值（按不小于 0 处理，第一名不是得分最高的结果时不会明确）
+        score_key: 得分字段
+    """
+    if not results:
+        return False
+    return float(results[0][score_key]) >= min_score and top_margin(results, score_key) >= max(min_margin, 0.0)
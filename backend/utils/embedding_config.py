@@ -6,9 +6,11 @@ class EmbeddingProvider(Enum):
     BEDROCK = "bedrock"
     OPENAI = "openai"
     HUGGINGFACE = "huggingface"
+    FAKE = "fake"  # 离线压测用的确定性假嵌入
 
 @dataclass
 class EmbeddingConfig:
     provider: EmbeddingProvider
     model_name: str  # 直接使用字符串，而不是枚举
     aws_region: Optional[str] = None
+    dimension: Optional[int] = None  # 仅 FAKE 使用，默认读取 FAKE_EMBEDDING_DIM
@@ -5,11 +5,27 @@ from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_openai import OpenAIEmbeddings
 import boto3
 import os
+import threading
 from utils.embedding_config import EmbeddingProvider, EmbeddingConfig
+from utils.fake_backends import FakeEmbeddings
 
 class EmbeddingFactory:
+    # 已创建的嵌入函数，相同配置在进程内只加载一次模型（多 worker 部署时在 fork 前加载即可共享）
+    _cache = {}
+    _cache_lock = threading.Lock()
+
     @staticmethod
     def create_embedding_function(config: EmbeddingConfig):
+        key = (config.provider, config.model_name, config.aws_region, config.dimension)
+        with EmbeddingFactory._cache_lock:
+            embedding_function = EmbeddingFactory._cache.get(key)
+            if embedding_function is None:
+                embedding_function = EmbeddingFactory._create(config)
+                EmbeddingFactory._cache[key] = embedding_function
+            return embedding_function
+
+    @staticmethod
+    def _create(config: EmbeddingConfig):
         if config.provider == EmbeddingProvider.BEDROCK:
             bedrock_client = boto3.client(
                 service_name='bedrock-runtime',
@@ -32,5 +48,17 @@ class EmbeddingFactory:
             return HuggingFaceEmbeddings(
                 model_name=config.model_name
             )
+
+        elif config.provider == EmbeddingProvider.FAKE:
+            return FakeEmbeddings.from_env(config.dimension)
             
-        raise ValueError(f"Unsupported embedding provider: {config.provider}")
\ No newline at end of file
+        raise ValueError(f"Unsupported embedding provider: {config.provider}")
+
+def embed_queries(embedding_function, queries):
+    """
+    批量计算查询向量，编码方式与 embed_query 相同
+
+    指令模型和非对称模型（如 multilingual-e5-large-instruct、gte-Qwen2）对查询和文档的编码方式不同，
+    查询不能用 embed_documents 批量编码，否则批量检索的结果与逐条检索不一致。
+    """
+    return [embedding_function.embed_query(query) for query in queries]
@@ -0,0 +1,250 @@
+"""
+离线压测用的假（stub）LLM 与嵌入后端
+
+不依赖 Ollama / OpenAI / HuggingFace 等真实模型服务，输出完全由输入内容决定，
+延迟分布和 token 流式速率可配置，用于单独测量 FastAPI 框架、序列化和调度开销。
+"""
+import hashlib
+import math
+import os
+import random
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+# 生成假文本时使用的医学词表（保证输出看起来像临床文本，且长度稳定）
+_VOCABULARY = [
+    "patient", "presents", "with", "acute", "chronic", "pain", "fever", "dyspnea",
+    "hypertension", "diabetes", "mellitus", "history", "of", "denies", "reports",
+    "examination", "reveals", "tenderness", "abdomen", "chest", "bilateral",
+    "normal", "stable", "assessment", "plan", "follow", "up", "medication",
+    "daily", "twice", "mg", "shortness", "breath", "cough", "nausea", "vomiting",
+]
+
+
+class LatencyModel:
+    """
+    可配置的延迟分布采样器
+
+    支持的分布：
+    - constant: 固定为 mean_ms
+    - uniform: [mean_ms - jitter_ms, mean_ms + jitter_ms] 均匀分布
+    - normal: 均值 mean_ms、标准差 jitter_ms 的正态分布（截断为非负）
+    - lognormal: 均值 mean_ms、标准差 jitter_ms 的对数正态分布（长尾）
+    - exponential: 均值 mean_ms 的指数分布
+    """
+    # 共享的采样器（LRU）；配置来自请求参数，数量必须有上限
+    _instances: "OrderedDict[tuple, LatencyModel]" = OrderedDict()
+    _instances_lock = threading.Lock()
+    max_instances = 256
+
+    def __init__(self, distribution: str = "constant", mean_ms: float = 0.0,
+                 jitter_ms: float = 0.0, seed: Optional[int] = None):
+        if distribution not in ("constant", "uniform", "normal", "lognormal", "exponential"):
+            raise ValueError(f"Unsupported latency distribution: {distribution}")
+        self.distribution = distribution
+        self.mean_ms = max(float(mean_ms), 0.0)
+        self.jitter_ms = max(float(jitter_ms), 0.0)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, distribution: str, mean_ms: float, jitter_ms: float,
+            seed: Optional[int]) -> "LatencyModel":
+        """
+        获取共享的采样器实例
+
+        服务每个请求都会重新构造 LLM，共享采样器保证同一配置下的
+        随机序列在请求之间连续（设置 seed 时整次压测可复现）。
+        最多保留 max_instances 个配置，超出时淘汰最久未使用的采样器（再次使用时随机序列从头开始）。
+        """
+        key = (distribution, float(mean_ms), float(jitter_ms), seed)
+        with cls._instances_lock:
+            instance = cls._instances.get(key)
+            if instance is None:
+                instance = cls(distribution, mean_ms, jitter_ms, seed)
+                cls._instances[key] = instance
+                while len(cls._instances) > cls.max_instances:
+                    cls._instances.popitem(last=False)
+            else:
+                cls._instances.move_to_end(key)
+            return instance
+
+    def sample_seconds(self) -> float:
+        """采样一次延迟，单位为秒"""
+        if self.distribution == "constant" or self.mean_ms == 0.0:
+            return self.mean_ms / 1000.0
+
+        with self._lock:
+            if self.distribution == "uniform":
+                value = self._rng.uniform(self.mean_ms - self.jitter_ms, self.mean_ms + self.jitter_ms)
+            elif self.distribution == "normal":
+                value = self._rng.gauss(self.mean_ms, self.jitter_ms)
+            elif self.distribution == "lognormal":
+                # 由目标均值和标准差反推底层正态分布参数
+                sigma2 = math.log(1.0 + (self.jitter_ms / self.mean_ms) ** 2)
+                mu = math.log(self.mean_ms) - sigma2 / 2.0
+                value = self._rng.lognormvariate(mu, math.sqrt(sigma2))
+            else:  # exponential
+                value = self._rng.expovariate(1.0 / self.mean_ms)
+
+        return max(value, 0.0) / 1000.0
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def _option(options: Dict[str, Any], key: str, env: str, default: str) -> str:
+    """按 请求选项 > 环境变量 > 默认值 的顺序读取配置"""
+    value = options.get(key)
+    if value is None or value == "":
+        value = os.getenv(env, default)
+    return str(value)
+
+
+class FakeLLM(LLM):
+    """
+    确定性的假 LLM
+
+    相同的 prompt 总是得到相同的输出；首 token 延迟按 LatencyModel 采样，
+    之后按 tokens_per_second 的速率逐个输出 token（invoke 时总耗时相同）。
+    """
+    model: str = "fake"
+    latency_distribution: str = "constant"
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    tokens_per_second: float = 0.0  # 0 表示不限速
+    output_tokens: int = 32
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_options(cls, llm_options: dict) -> "FakeLLM":
+        """
+        根据 llmOptions 构造假 LLM
+
+        Args:
+            llm_options: 语言模型配置选项，除 provider/model 外还支持：
+                - latencyDistribution: 延迟分布 (constant/uniform/normal/lognormal/exponential)
+                - latencyMs: 平均首 token 延迟（毫秒）
+                - latencyJitterMs: 延迟抖动/标准差（毫秒）
+                - tokensPerSecond: 流式输出速率，0 表示不限速
+                - outputTokens: 输出 token 数
+                - seed: 随机种子
+              未提供的选项依次读取 FAKE_LLM_* 环境变量
+        """
+        seed = _option(llm_options, "seed", "FAKE_LLM_SEED", "")
+        return cls(
+            model=llm_options.get("model", "fake"),
+            latency_distribution=_option(llm_options, "latencyDistribution", "FAKE_LLM_LATENCY_DISTRIBUTION", "constant"),
+            latency_ms=float(_option(llm_options, "latencyMs", "FAKE_LLM_LATENCY_MS", "0")),
+            latency_jitter_ms=float(_option(llm_options, "latencyJitterMs", "FAKE_LLM_LATENCY_JITTER_MS", "0")),
+            tokens_per_second=float(_option(llm_options, "tokensPerSecond", "FAKE_LLM_TOKENS_PER_SECOND", "0")),
+            output_tokens=int(_option(llm_options, "outputTokens", "FAKE_LLM_OUTPUT_TOKENS", "32")),
+            seed=int(seed) if seed else None,
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "latency_distribution": self.latency_distribution,
+            "latency_ms": self.latency_ms,
+            "tokens_per_second": self.tokens_per_second,
+        }
+
+    def _tokens(self, prompt: str) -> List[str]:
+        """根据 prompt 的哈希确定性地生成输出 token 序列"""
+        tokens = []
+        digest = b""
+        for i in range(self.output_tokens):
+            # 每 32 个 token 消耗一个 sha256 摘要
+            if i % 32 == 0:
+                digest = _digest(f"{i // 32}:{prompt}")
+            word = _VOCABULARY[digest[i % 32] % len(_VOCABULARY)]
+            tokens.append(word if i == 0 else " " + word)
+        return tokens
+
+    def _first_token_delay(self) -> float:
+        return LatencyModel.get(self.latency_distribution, self.latency_ms,
+                                self.latency_jitter_ms, self.seed).sample_seconds()
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager=None, **kwargs: Any) -> str:
+        tokens = self._tokens(prompt)
+        delay = self._first_token_delay()
+        if self.tokens_per_second > 0:
+            delay += len(tokens) / self.tokens_per_second
+        if delay > 0:
+            time.sleep(delay)
+        return "".join(tokens)
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        delay = self._first_token_delay()
+        if delay > 0:
+            time.sleep(delay)
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        for token in self._tokens(prompt):
+            if interval:
+                time.sleep(interval)
+            chunk = GenerationChunk(text=token)
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    确定性的假嵌入函数
+
+    向量由文本哈希展开得到并做 L2 归一化，相同文本总是得到相同向量；
+    默认维度与 BGE-M3 一致（1024），可以直接查询现有的 Milvus 集合。
+    """
+    def __init__(self, dimension: int = 1024, latency: Optional[LatencyModel] = None):
+        self.dimension = dimension
+        self.latency = latency or LatencyModel()
+
+    @classmethod
+    def from_env(cls, dimension: Optional[int] = None) -> "FakeEmbeddings":
+        """根据 FAKE_EMBEDDING_* 环境变量构造假嵌入函数"""
+        seed = os.getenv("FAKE_EMBEDDING_SEED", "")
+        latency = LatencyModel.get(
+            os.getenv("FAKE_EMBEDDING_LATENCY_DISTRIBUTION", "constant"),
+            float(os.getenv("FAKE_EMBEDDING_LATENCY_MS", "0")),
+            float(os.getenv("FAKE_EMBEDDING_LATENCY_JITTER_MS", "0")),
+            int(seed) if seed else None,
+        )
+        return cls(dimension or int(os.getenv("FAKE_EMBEDDING_DIM", "1024")), latency)
+
+    def _vector(self, text: str) -> List[float]:
+        values = []
+        counter = 0
+        while len(values) < self.dimension:
+            block = _digest(f"{counter}:{text}")
+            # 每个 32 字节摘要展开为 8 个 [-1, 1) 区间的分量
+            values.extend(v / 2147483648.0 for v in struct.unpack("<8i", block))
+            counter += 1
+        values = values[:self.dimension]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # 批量调用只模拟一次延迟，与真实模型的批处理行为一致
+        delay = self.latency.sample_seconds()
+        if delay > 0:
+            time.sleep(delay)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
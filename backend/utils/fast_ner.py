@@ -0,0 +1,186 @@
+"""
+带分词缓存的 token-classification 推理（transformers pipeline 的轻量替代）
+
+短文本 NER 调用中，pipeline 的非模型开销（逐次分词、逐 token 构造字典、Python 侧的 simple 聚合）占了大头。
+这里：
+- 强制使用 Rust 实现的 fast tokenizer，按句子批量分词并取 offset_mapping；
+- 分词结果按句子文本做 LRU 缓存，病历模板中重复出现的句子不再分词；
+- 一次前向处理一批序列，超过模型最大长度的文本按句子边界切成多个窗口；
+- simple 聚合在 numpy 数组上完成：相邻且实体类型相同、且后一个不是 B- 的 token 合并为一个实体，得分取平均。
+
+输出格式与 pipeline(aggregation_strategy="simple") 相同：entity_group、score、word、start、end，
+其中 word 直接取原文 text[start:end]（pipeline 是把子词拼回字符串，大小写和空白可能与原文略有差异）。
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+import torch
+from transformers import AutoModelForTokenClassification, AutoTokenizer
+
+from utils.text_segments import split_sentences
+
+
+class FastTokenClassifier:
+    """
+    Args:
+        model_name: HuggingFace 模型名称
+        device: 设备编号，-1 表示 CPU（与 pipeline 的 device 参数一致）
+        cache_size: 句子分词缓存的条目数
+        batch_size: 默认的前向批大小
+    """
+
+    def __init__(self, model_name: str, device: int = -1, cache_size: int = 10000, batch_size: int = 16):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        if not self.tokenizer.is_fast:
+            raise ValueError(f"{model_name} has no fast (Rust) tokenizer; offset mapping requires one")
+        self.model = AutoModelForTokenClassification.from_pretrained(model_name)
+        self.device = torch.device("cpu" if device < 0 else f"cuda:{device}")
+        self.model.to(self.device).eval()
+        self.batch_size = batch_size
+
+        # 标签 id -> 实体类型下标（O 为 -1）和是否 B- 开头
+        labels = [self.model.config.id2label[i] for i in range(len(self.model.config.id2label))]
+        groups = []
+        label_group = np.full(len(labels), -1, dtype=np.int32)
+        label_begin = np.zeros(len(labels), dtype=bool)
+        for i, label in enumerate(labels):
+            if label == "O":
+                continue
+            tag = label[2:] if label[:2] in ("B-", "I-") else label
+            if tag not in groups:
+                groups.append(tag)
+            label_group[i] = groups.index(tag)
+            label_begin[i] = label.startswith("B-")
+        self.groups = groups
+        self.label_group = label_group
+        self.label_begin = label_begin
+
+        max_length = min(self.tokenizer.model_max_length,
+                         getattr(self.model.config, "max_position_embeddings", 512) or 512)
+        # 预留 [CLS] / [SEP]
+        self.window = max_length - 2
+
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _tokenize_sentences(self, sentences: List[str]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """分词（不含特殊 token），返回 (input_ids, offsets)，offsets 相对句子起点"""
+        results = [None] * len(sentences)
+        missing = {}
+        with self._cache_lock:
+            for i, sentence in enumerate(sentences):
+                cached = self._cache.get(sentence)
+                if cached is not None:
+                    self._cache.move_to_end(sentence)
+                    results[i] = cached
+                    self.cache_hits += 1
+                else:
+                    missing.setdefault(sentence, []).append(i)
+                    self.cache_misses += 1
+        if missing:
+            texts = list(missing)
+            encoded = self.tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True,
+                                     return_attention_mask=False, return_token_type_ids=False)
+            with self._cache_lock:
+                for text, ids, offsets in zip(texts, encoded["input_ids"], encoded["offset_mapping"]):
+                    entry = (np.asarray(ids, dtype=np.int64), np.asarray(offsets, dtype=np.int64).reshape(-1, 2))
+                    for i in missing[text]:
+                        results[i] = entry
+                    self._cache[text] = entry
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+        return results
+
+    def _windows(self, text: str) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """把文本切成不超过模型长度的窗口，返回 [(input_ids, 全文 offsets)]"""
+        spans = split_sentences(text)
+        tokenized = self._tokenize_sentences([text[start:end] for start, end in spans])
+        windows = []
+        ids_parts, offset_parts, length = [], [], 0
+        for (start, _), (ids, offsets) in zip(spans, tokenized):
+            offsets = offsets + start
+            # 单个句子超长时按 token 切开
+            for chunk in range(0, max(len(ids), 1), self.window):
+                chunk_ids, chunk_offsets = ids[chunk:chunk + self.window], offsets[chunk:chunk + self.window]
+                if length + len(chunk_ids) > self.window and ids_parts:
+                    windows.append((np.concatenate(ids_parts), np.concatenate(offset_parts)))
+                    ids_parts, offset_parts, length = [], [], 0
+                ids_parts.append(chunk_ids)
+                offset_parts.append(chunk_offsets)
+                length += len(chunk_ids)
+        if ids_parts and length:
+            windows.append((np.concatenate(ids_parts), np.concatenate(offset_parts)))
+        return windows
+
+    @torch.inference_mode()
+    def _predict(self, windows: List[Tuple[np.ndarray, np.ndarray]], batch_size: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """批量前向，返回每个窗口每个 token 的 (标签 id, 概率)"""
+        cls_id, sep_id, pad_id = self.tokenizer.cls_token_id, self.tokenizer.sep_token_id, self.tokenizer.pad_token_id
+        outputs = []
+        for begin in range(0, len(windows), batch_size):
+            batch = windows[begin:begin + batch_size]
+            width = max(len(ids) for ids, _ in batch) + 2
+            input_ids = np.full((len(batch), width), pad_id, dtype=np.int64)
+            attention = np.zeros((len(batch), width), dtype=np.int64)
+            for row, (ids, _) in enumerate(batch):
+                input_ids[row, 0], input_ids[row, 1:len(ids) + 1], input_ids[row, len(ids) + 1] = cls_id, ids, sep_id
+                attention[row, :len(ids) + 2] = 1
+            logits = self.model(input_ids=torch.from_numpy(input_ids).to(self.device),
+                                attention_mask=torch.from_numpy(attention).to(self.device)).logits
+            probabilities = torch.softmax(logits.float(), dim=-1)
+            scores, labels = probabilities.max(dim=-1)
+            scores, labels = scores.cpu().numpy(), labels.cpu().numpy()
+            for row, (ids, _) in enumerate(batch):
+                outputs.append((labels[row, 1:len(ids) + 1], scores[row, 1:len(ids) + 1]))
+        return outputs
+
+    def _aggregate(self, text: str, offsets: np.ndarray, labels: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        """simple 聚合：在数组上找实体边界，按组求平均得分"""
+        if len(labels) == 0:
+            return []
+        group = self.label_group[labels]
+        begin = self.label_begin[labels]
+        boundary = np.ones(len(group), dtype=bool)
+        boundary[1:] = (group[1:] != group[:-1]) | begin[1:]
+        starts = np.flatnonzero(boundary)
+        ends = np.r_[starts[1:], len(group)]
+        means = np.add.reduceat(scores, starts) / (ends - starts)
+
+        entities = []
+        for first, last, score in zip(starts, ends - 1, means):
+            if group[first] < 0:
+                continue
+            start, end = int(offsets[first, 0]), int(offsets[last, 1])
+            # sentencepiece 的词首 token 可能把前导空格计入偏移
+            while start < end and text[start].isspace():
+                start += 1
+            entities.append({
+                "entity_group": self.groups[group[first]],
+                "score": float(score),
+                "word": text[start:end],
+                "start": start,
+                "end": end,
+            })
+        return entities
+
+    def __call__(self, inputs: Union[str, List[str]], batch_size: int = None) -> Union[List[Dict], List[List[Dict]]]:
+        """与 pipeline 相同的调用方式：单个文本返回实体列表，文本列表返回实体列表的列表"""
+        single = isinstance(inputs, str)
+        texts = [inputs] if single else list(inputs)
+
+        windows, owners = [], []
+        for index, text in enumerate(texts):
+            for window in self._windows(text):
+                windows.append(window)
+                owners.append(index)
+        predictions = self._predict(windows, batch_size or self.batch_size)
+
+        results = [[] for _ in texts]
+        for index, (_, offsets), (labels, scores) in zip(owners, windows, predictions):
+            results[index].extend(self._aggregate(texts[index], offsets, labels, scores))
+        return results[0] if single else results
@@ -0,0 +1,77 @@
+"""
+多路检索结果融合
+
+每一路结果是按得分降序排列的 [(key, score), ...]，key 可以是行号、主键或 concept_id。
+"""
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+RankedList = Sequence[Tuple[Hashable, float]]
+
+
+def reciprocal_rank_fusion(ranked_lists: List[RankedList], weights: Optional[List[float]] = None,
+                           k: int = 60) -> List[Tuple[Hashable, float]]:
+    """
+    倒数排名融合（RRF）：score = Σ weight / (k + rank)，只依赖名次，不受各路得分尺度影响
+    """
+    weights = weights or [1.0] * len(ranked_lists)
+    fused: Dict[Hashable, float] = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, (key, _) in enumerate(ranked, start=1):
+            fused[key] = fused.get(key, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def weighted_score_fusion(ranked_lists: List[RankedList],
+                          weights: Optional[List[float]] = None) -> List[Tuple[Hashable, float]]:
+    """
+    加权得分融合：每一路得分先做 min-max 归一化到 [0, 1]，再按权重求和
+    """
+    weights = weights or [1.0] * len(ranked_lists)
+    fused: Dict[Hashable, float] = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        if not ranked:
+            continue
+        scores = [score for _, score in ranked]
+        low, high = min(scores), max(scores)
+        span = high - low
+        for key, score in ranked:
+            normalized = (score - low) / span if span > 0 else 1.0
+            fused[key] = fused.get(key, 0.0) + weight * normalized
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def max_score_fusion(ranked_lists: List[RankedList],
+                     weights: Optional[List[float]] = None) -> List[Tuple[Hashable, float]]:
+    """
+    最大得分融合：取各路中加权后的最高得分，要求各路得分可以直接比较（如同一嵌入模型的余弦相似度）
+    """
+    weights = weights or [1.0] * len(ranked_lists)
+    fused: Dict[Hashable, float] = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for key, score in ranked:
+            score = weight * score
+            if key not in fused or score > fused[key]:
+                fused[key] = score
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def fuse(ranked_lists: List[RankedList], method: str = "rrf",
+         weights: Optional[List[float]] = None) -> List[Tuple[Hashable, float]]:
+    """
+    按指定方法融合多路结果
+
+    Args:
+        ranked_lists: 多路检索结果
+        method: 融合方法 (rrf/weighted/max)
+        weights: 各路权重，默认均为 1
+
+    Returns:
+        融合后的 [(key, 融合得分), ...]，按得分降序
+    """
+    if method == "rrf":
+        return reciprocal_rank_fusion(ranked_lists, weights)
+    elif method == "weighted":
+        return weighted_score_fusion(ranked_lists, weights)
+    elif method == "max":
+        return max_score_fusion(ranked_lists, weights)
+    raise ValueError(f"Unsupported fusion method: {method}")
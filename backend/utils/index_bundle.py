@@ -0,0 +1,189 @@
+"""
+可移植的预构建索引包
+
+本地索引目录（utils/local_index.py：向量、主键、概念元数据、可选的降维/量化/BM25 文件）加上 manifest.json
+即为一个索引包，可打包为未压缩的 tar 分发到新节点，解包后 StdService 直接 mmap 使用，不需要重新计算嵌入。
+
+manifest.json：
+    bundle_version   包格式版本
+    model            构建向量的嵌入模型
+    model_revision   模型版本（可选，如 HuggingFace commit）
+    fingerprint      模型对固定探针文本的嵌入，用于发现同名但权重不同的模型
+    index            index.json 中的索引参数（维度、条目数、度量方式、降维/量化配置）
+    files            {文件名: {"size", "sha256"}}
+"""
+import hashlib
+import json
+import os
+import tarfile
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from utils.local_index import INDEX_FILE
+
+MANIFEST_FILE = "manifest.json"
+BUNDLE_VERSION = 1
+
+# 模型指纹使用的探针文本，以及判定为同一模型的最小余弦相似度
+FINGERPRINT_TEXT = "acute myocardial infarction with shortness of breath"
+FINGERPRINT_MIN_SIMILARITY = 0.999
+
+_HASH_CHUNK = 16 * 1024 * 1024
+
+
+class BundleError(ValueError):
+    """索引包损坏，或与当前的嵌入模型配置不一致"""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(embedding_func) -> list:
+    """嵌入模型对探针文本的向量（写入 manifest，加载时比对）"""
+    return [float(value) for value in embedding_func.embed_query(FINGERPRINT_TEXT)]
+
+
+def write_manifest(path: str, model: str, model_revision: Optional[str] = None,
+                   embedding_func=None) -> Dict:
+    """
+    为索引目录计算校验和并写入 manifest.json
+
+    Args:
+        path: 本地索引目录
+        model: 嵌入模型名称，必须与 index.json 中记录的一致（如有）
+        model_revision: 模型版本
+        embedding_func: 提供时记录模型指纹
+    """
+    with open(os.path.join(path, INDEX_FILE), encoding="utf-8") as f:
+        index_info = json.load(f)
+    if index_info.get("model") and index_info["model"] != model:
+        raise BundleError(f"Index at {path} was built with {index_info['model']}, not {model}")
+
+    files = {}
+    for name in sorted(os.listdir(path)):
+        file_path = os.path.join(path, name)
+        if name == MANIFEST_FILE or not os.path.isfile(file_path):
+            continue
+        files[name] = {"size": os.path.getsize(file_path), "sha256": file_sha256(file_path)}
+
+    manifest = {
+        "bundle_version": BUNDLE_VERSION,
+        "model": model,
+        "model_revision": model_revision,
+        "fingerprint": fingerprint(embedding_func) if embedding_func is not None else None,
+        "index": index_info,
+        "files": files,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def read_manifest(path: str) -> Optional[Dict]:
+    """读取索引目录的 manifest.json，不存在时返回 None"""
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("bundle_version", 0) > BUNDLE_VERSION:
+        raise BundleError(f"Index bundle at {path} has unsupported version {manifest['bundle_version']}")
+    return manifest
+
+
+def verify_bundle(path: str, checksums: bool = True) -> Dict:
+    """
+    校验索引目录中的文件与 manifest 一致
+
+    Args:
+        checksums: 为 False 时只比较文件大小（大索引启动时的快速检查）
+
+    Raises:
+        BundleError: 缺少 manifest、文件缺失、大小或校验和不一致
+    """
+    manifest = read_manifest(path)
+    if manifest is None:
+        raise BundleError(f"No {MANIFEST_FILE} in {path}")
+    for name, expected in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.isfile(file_path):
+            raise BundleError(f"Index bundle file missing: {name}")
+        if os.path.getsize(file_path) != expected["size"]:
+            raise BundleError(f"Index bundle file has wrong size: {name}")
+        if checksums and file_sha256(file_path) != expected["sha256"]:
+            raise BundleError(f"Index bundle file checksum mismatch: {name}")
+    return manifest
+
+
+def check_model(manifest: Dict, model: str, embedding_func=None):
+    """
+    确认索引包由当前配置的嵌入模型构建，不一致时抛出 BundleError
+
+    manifest 中有指纹且提供了 embedding_func 时，再比对探针文本的嵌入（维度和余弦相似度）。
+    """
+    if manifest.get("model") != model:
+        raise BundleError(f"Index bundle was built with {manifest.get('model')}, but {model} is configured")
+    expected = manifest.get("fingerprint")
+    if expected is None or embedding_func is None:
+        return
+    expected = np.asarray(expected, dtype=np.float32)
+    actual = np.asarray(fingerprint(embedding_func), dtype=np.float32)
+    if actual.shape != expected.shape:
+        raise BundleError(f"Embedding dimension {actual.shape[0]} does not match index bundle ({expected.shape[0]})")
+    similarity = float(actual @ expected / (np.linalg.norm(actual) * np.linalg.norm(expected) or 1.0))
+    if similarity < FINGERPRINT_MIN_SIMILARITY:
+        raise BundleError(f"Embedding model {model} does not reproduce the index bundle fingerprint "
+                          f"(similarity {similarity:.4f}); the weights differ from the ones used to build it")
+
+
+def pack_bundle(path: str, output: str):
+    """把带 manifest 的索引目录打包为未压缩的 tar（向量数据压缩收益很小，解包即可 mmap）"""
+    verify_bundle(path, checksums=False)
+    with tarfile.open(output, "w") as tar:
+        for name in sorted(os.listdir(path)):
+            if os.path.isfile(os.path.join(path, name)):
+                tar.add(os.path.join(path, name), arcname=name)
+
+
+def unpack_bundle(bundle: str, path: str, checksums: bool = True) -> Dict:
+    """
+    解包到索引目录并校验，返回 manifest
+
+    先解包到同级临时目录，校验通过后再替换目标目录，失败时不影响已有索引。
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    staging = f"{os.path.abspath(path)}.importing"
+    if os.path.isdir(staging):
+        _remove_dir(staging)
+    os.makedirs(staging)
+    try:
+        with tarfile.open(bundle, "r") as tar:
+            for member in tar.getmembers():
+                # 只接受平铺的普通文件，避免路径穿越
+                if not member.isfile() or os.path.basename(member.name) != member.name:
+                    raise BundleError(f"Unexpected entry in index bundle: {member.name}")
+            tar.extractall(staging)
+        manifest = verify_bundle(staging, checksums)
+    except Exception:
+        _remove_dir(staging)
+        raise
+
+    if os.path.isdir(path):
+        _remove_dir(path)
+    os.replace(staging, path)
+    return manifest
+
+
+def _remove_dir(path: str):
+    for name in os.listdir(path):
+        os.remove(os.path.join(path, name))
+    os.rmdir(path)
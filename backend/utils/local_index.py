@@ -0,0 +1,263 @@
+"""
+基于内存映射文件的本地向量索引
+
+从 Milvus 集合导出的向量和概念元数据（见 utils/concept_store.py）以 .npy 等文件保存，
+以只读 mmap 方式打开，多个 worker 进程共享同一份页缓存，不会各自复制一份索引。
+
+目录结构（默认位于 db/<dbName>_index/<collectionName>/）：
+    index.json              索引描述（维度、条目数、度量方式、嵌入模型）
+    vectors.npy             float32 (N, D)，已 L2 归一化
+    ids.npy                 int64 (N,)，对应 Milvus 主键
+    concept*                概念元数据存储，行号与 vectors.npy 一致
+    vectors_reduced.npy     可选的降维向量（见 utils/projection.py）
+    vectors_<kind>.npy      可选的量化码（见 utils/quantization.py），有降维向量时量化的是降维后的向量
+存在降维向量或量化码时，先在其上粗排，再用 float32 原始向量精确重排。
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.concept_store import ConceptStore, ConceptStoreWriter
+from utils.quantization import Quantizer
+from utils.projection import Projection, REDUCED_VECTORS_FILE
+
+INDEX_FILE = "index.json"
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.npy"
+
+
+def index_dir_for(db_path: str, collection_name: str) -> str:
+    """
+    Milvus 数据库文件对应的本地索引目录
+
+    例如 db/snomed_bge_m3.db + concepts_only_name
+    对应 db/snomed_bge_m3_index/concepts_only_name
+    """
+    return os.path.join(f"{os.path.splitext(db_path)[0]}_index", collection_name)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """按行做 L2 归一化，使内积等于余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """返回得分最高的 k 个下标（按得分降序）"""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class LocalIndex:
+    """
+    只读的本地向量索引
+
+    同一目录在进程内只打开一次（见 open），在 fork 之前打开即可让所有 worker 共享。
+    """
+    _opened: Dict[str, "LocalIndex"] = {}
+    _opened_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE), encoding="utf-8") as f:
+            self.info = json.load(f)
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        self.ids = np.load(os.path.join(path, IDS_FILE), mmap_mode="r")
+        self.concepts = ConceptStore.open(path)
+
+        # 降维和量化配置分别由 tools/reduce_local_index.py、tools/quantize_local_index.py 写入 index.json
+        self.projection = None
+        self.reduced = None
+        self.quantizer = None
+        self.codes = None
+        self.rerank_candidates = 0
+        projection = self.info.get("projection")
+        if projection:
+            self.projection = Projection.load(path)
+            self.reduced = np.load(os.path.join(path, REDUCED_VECTORS_FILE), mmap_mode="r")
+            self.rerank_candidates = int(projection.get("rerank_candidates", 100))
+        quantization = self.info.get("quantization")
+        if quantization:
+            self.quantizer, self.codes = Quantizer.load(path, quantization["kind"])
+            self.rerank_candidates = int(quantization.get("rerank_candidates", 100))
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, INDEX_FILE))
+
+    @classmethod
+    def open(cls, path: str) -> "LocalIndex":
+        """打开（或复用已打开的）本地索引"""
+        path = os.path.abspath(path)
+        with cls._opened_lock:
+            index = cls._opened.get(path)
+            if index is None:
+                index = cls(path)
+                cls._opened[path] = index
+            return index
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def model(self) -> Optional[str]:
+        return self.info.get("model")
+
+    def search(self, query_vector, limit: int = 5) -> List[Tuple[int, float]]:
+        """
+        余弦相似度检索
+
+        有降维向量或量化码时先在其上粗排取 rerank_candidates 个候选，
+        再读取候选的 float32 向量精确重排；返回的相似度总是精确值。
+
+        Args:
+            query_vector: 查询向量
+            limit: 返回结果数量
+
+        Returns:
+            [(行号, 余弦相似度), ...]，按相似度降序
+        """
+        if self.quantizer is None and self.projection is None:
+            return self.exact_search(query_vector, limit)
+
+        query = normalize(np.asarray(query_vector, dtype=np.float32))
+        coarse_query = self.projection.transform(query) if self.projection is not None else query
+        if self.quantizer is not None:
+            coarse = self.quantizer.scores(self.codes, coarse_query)
+        else:
+            coarse = self.reduced @ coarse_query
+        # 候选按行号排序后读取，mmap 上的访问更接近顺序读
+        candidates = np.sort(top_k(coarse, max(limit, self.rerank_candidates)))
+        exact = self.vectors[candidates] @ query
+        best = top_k(exact, limit)
+        return [(int(candidates[i]), float(exact[i])) for i in best]
+
+    def exact_search(self, query_vector, limit: int = 5) -> List[Tuple[int, float]]:
+        """在 float32 原始向量上的精确检索"""
+        query = normalize(np.asarray(query_vector, dtype=np.float32))
+        scores = self.vectors @ query
+        rows = top_k(scores, limit)
+        return [(int(row), float(scores[row])) for row in rows]
+
+    def search_batch(self, query_vectors, limit: int = 5, chunk_rows: int = 65536) -> List[List[Tuple[int, float]]]:
+        """
+        批量检索，结果与逐条调用 search 相同
+
+        没有降维和量化时按行分块做矩阵乘法（一次读取向量块服务所有查询），
+        否则逐条走两阶段检索。
+        """
+        if self.quantizer is not None or self.projection is not None:
+            return [self.search(query_vector, limit) for query_vector in query_vectors]
+
+        queries = normalize(np.asarray(query_vectors, dtype=np.float32))
+        if len(queries) == 0:
+            return []
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self.vectors), chunk_rows):
+            block = np.asarray(self.vectors[start:start + chunk_rows]) @ queries.T  # (rows, queries)
+            k = min(limit, block.shape[0])
+            rows = np.argpartition(-block, k - 1, axis=0)[:k].T  # (queries, k)
+            scores = np.take_along_axis(block.T, rows, axis=1)
+            best_rows = np.concatenate([best_rows, rows + start], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            if best_rows.shape[1] > limit:
+                keep = np.argpartition(-best_scores, limit - 1, axis=1)[:, :limit]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        return [[(int(row), float(score)) for row, score in zip(rows, scores)]
+                for rows, scores in zip(best_rows, best_scores)]
+
+    def scores(self, rows: List[int], query_vector) -> List[float]:
+        """计算指定行与查询向量的精确余弦相似度"""
+        query = normalize(np.asarray(query_vector, dtype=np.float32))
+        return [float(score) for score in self.vectors[np.asarray(rows, dtype=np.int64)] @ query]
+
+    def metadata(self, row: int) -> Dict:
+        """读取第 row 行概念的元数据"""
+        return self.concepts.get(row)
+
+
+def sample_queries(vectors: np.ndarray, count: int, noise: float, seed: int = 42) -> np.ndarray:
+    """从索引中随机取向量并加高斯噪声，作为评估粗排召回率的查询"""
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(len(vectors), size=min(count, len(vectors)), replace=False))
+    return normalize(np.asarray(vectors[sample]) + rng.normal(0, noise, (len(sample), vectors.shape[1])))
+
+
+def evaluate_recall(index: "LocalIndex", queries: np.ndarray, k: int = 5) -> Dict[str, float]:
+    """
+    以精确检索的 top-k 为基准，测量 index.search（两阶段检索）的召回率和平均延迟
+    """
+    hits = 0
+    exact_time = search_time = 0.0
+    for query in queries:
+        started = time.perf_counter()
+        exact = {row for row, _ in index.exact_search(query, k)}
+        exact_time += time.perf_counter() - started
+        started = time.perf_counter()
+        approx = {row for row, _ in index.search(query, k)}
+        search_time += time.perf_counter() - started
+        hits += len(exact & approx)
+    return {
+        f"recall@{k}": hits / (len(queries) * k),
+        "exact_ms": exact_time / len(queries) * 1000,
+        "search_ms": search_time / len(queries) * 1000,
+    }
+
+
+class LocalIndexWriter:
+    """
+    流式写入本地索引
+
+    预先知道条目数时向量直接写入 mmap 的 .npy 文件，导出全量 SNOMED 也不需要把所有向量放进内存。
+    """
+    def __init__(self, path: str, count: int, dim: int, info: Optional[Dict] = None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.info = dict(info or {})
+        self.info.update({"count": count, "dim": dim, "metric": "COSINE"})
+        self._vectors = np.lib.format.open_memmap(
+            os.path.join(path, VECTORS_FILE), mode="w+", dtype=np.float32, shape=(count, dim))
+        self._ids = np.lib.format.open_memmap(
+            os.path.join(path, IDS_FILE), mode="w+", dtype=np.int64, shape=(count,))
+        self._concepts = ConceptStoreWriter(path)
+        self._row = 0
+
+    def add(self, ids: List[int], vectors, metadata: List[Dict]):
+        """追加一批条目"""
+        end = self._row + len(ids)
+        if end > self._vectors.shape[0]:
+            raise ValueError(f"LocalIndexWriter expected {self._vectors.shape[0]} rows, got more")
+        self._vectors[self._row:end] = normalize(np.asarray(vectors, dtype=np.float32))
+        self._ids[self._row:end] = ids
+        self._concepts.add(ids, metadata)
+        self._row = end
+
+    def close(self):
+        """写入概念存储和 index.json；实际条目数少于预期时截断"""
+        self._concepts.close()
+        self._vectors.flush()
+        self._ids.flush()
+        count = self._row
+        if count != self._vectors.shape[0]:
+            vectors = np.array(self._vectors[:count])
+            ids = np.array(self._ids[:count])
+            del self._vectors, self._ids
+            np.save(os.path.join(self.path, VECTORS_FILE), vectors)
+            np.save(os.path.join(self.path, IDS_FILE), ids)
+            self.info["count"] = count
+        with open(os.path.join(self.path, INDEX_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.info, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,240 @@
+"""
+异步 Milvus 访问：客户端池、单次调用截止时间、退避重试和熔断
+
+阻塞的 MilvusClient 调用在专用的有界线程池中执行，每个线程持有自己的客户端（即连接池），
+线程数等于池大小，慢查询最多占满这些线程，不会占用 FastAPI 的默认线程池。
+截止时间同时传给 asyncio.wait_for 和 pymilvus 的 timeout 参数，超时后调用方立即返回，
+底层 gRPC 请求也会在同一时间被取消、释放线程。
+
+只有连接和超时类的失败（见 is_transport_error）会重试并计入熔断；过滤表达式错误、字段不存在等
+请求本身的错误说明服务可达，直接抛出，不会触发熔断。
+
+每个客户端第一次访问某个集合前先调用 load_collection，不依赖其他客户端或 StdService 是否已加载该集合。
+
+client_factory 可以替换为返回进程内替身对象的函数（只需实现 load_collection 和被调用的方法，如 search），
+便于在没有 Milvus 服务的情况下测试超时、重试和熔断行为；也可以直接指向 Milvus Lite 文件。
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# pymilvus 中表示连接不可用的异常类名（按名称判断，避免导入 pymilvus）
+_TRANSPORT_EXCEPTIONS = {"MilvusUnavailableException", "ConnectionNotExistException", "ConnectError"}
+# gRPC 中表示连接不可用或超时的状态码
+_TRANSPORT_STATUS = {"UNAVAILABLE", "DEADLINE_EXCEEDED"}
+
+
+def is_transport_error(error: BaseException) -> bool:
+    """是否为连接或超时类的失败（可以重试、计入熔断），而不是请求本身的错误"""
+    if isinstance(error, (asyncio.TimeoutError, OSError)):
+        return True
+    if any(cls.__name__ in _TRANSPORT_EXCEPTIONS for cls in type(error).__mro__):
+        return True
+    # grpc.RpcError.code() 或 MilvusException.code 为 gRPC 状态码
+    code = getattr(error, "code", None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            return False
+    return getattr(code, "name", None) in _TRANSPORT_STATUS
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器处于打开状态，调用被直接拒绝"""
+
+
+class CircuitBreaker:
+    """
+    连续失败达到 failure_threshold 次后打开，reset_timeout 秒内拒绝所有调用；
+    之后进入半开状态，只放行一次试探调用，成功则关闭，失败则重新打开。
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release_probe(self):
+        """试探调用被取消、没有结果时释放试探名额，下一次调用可以重新试探"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit opened after {self._failures} consecutive failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class MilvusClientPool:
+    """
+    Milvus 客户端池
+
+    Args:
+        uri: Milvus 地址或 Milvus Lite 数据库文件路径
+        size: 客户端（线程）数；Milvus Lite 文件默认 1，服务端默认 MILVUS_POOL_SIZE（4）
+        timeout: 默认的单次调用截止时间（秒），包含重试在内
+        retries: 失败后的最大重试次数
+        backoff: 首次重试前的等待时间（秒），之后指数增长并加随机抖动
+        breaker: 熔断器，默认连续 5 次失败后打开 30 秒
+        client_factory: 创建客户端的函数，默认 MilvusClient(uri)
+        transport_error: 判断异常是否为连接或超时类失败的函数，默认 is_transport_error
+    """
+    _pools: Dict[str, "MilvusClientPool"] = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, uri: str, size: Optional[int] = None, timeout: Optional[float] = None,
+                 retries: int = 2, backoff: float = 0.05, breaker: Optional[CircuitBreaker] = None,
+                 client_factory: Optional[Callable[[], Any]] = None,
+                 transport_error: Callable[[BaseException], bool] = is_transport_error):
+        if size is None:
+            size = 1 if uri.endswith(".db") else int(os.getenv("MILVUS_POOL_SIZE", "4"))
+        self.uri = uri
+        self.size = size
+        self.timeout = timeout if timeout is not None else float(os.getenv("MILVUS_TIMEOUT", "2.0"))
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.client_factory = client_factory or self._default_factory
+        self.transport_error = transport_error
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="milvus")
+        self._local = threading.local()
+        self._clients = []
+        self._clients_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, uri: str) -> "MilvusClientPool":
+        """进程内按 uri 共享的客户端池"""
+        with cls._pools_lock:
+            pool = cls._pools.get(uri)
+            if pool is None:
+                pool = cls(uri)
+                cls._pools[uri] = pool
+            return pool
+
+    def _default_factory(self):
+        from pymilvus import MilvusClient
+        return MilvusClient(self.uri)
+
+    def _client(self):
+        """当前线程的客户端，首次使用时创建"""
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self.client_factory()
+            self._local.client = client
+            self._local.loaded = set()
+            with self._clients_lock:
+                self._clients.append(client)
+        return client
+
+    def _invoke(self, method: str, kwargs: Dict, timeout: float):
+        client = self._client()
+        collection_name = kwargs.get("collection_name")
+        if collection_name is not None and collection_name not in self._local.loaded:
+            # 加载已加载的集合不会重复加载，这里只保证本客户端检索前集合一定处于加载状态
+            client.load_collection(collection_name, timeout=timeout)
+            self._local.loaded.add(collection_name)
+        return getattr(client, method)(timeout=timeout, **kwargs)
+
+    async def call(self, method: str, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        在池中调用客户端方法（如 search、get、query）
+
+        Args:
+            method: MilvusClient 的方法名
+            timeout: 截止时间（秒），默认 self.timeout；重试共用同一截止时间
+            **kwargs: 传给客户端方法的参数
+
+        Raises:
+            CircuitOpenError: 熔断器打开
+            asyncio.TimeoutError: 截止时间内没有成功
+            其他异常: 请求本身的错误立即抛出；连接类错误在重试次数用尽后抛出最后一次的异常
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Milvus circuit open for {self.uri}")
+            # 熔断器只在事件循环中访问，allow 之后立即读取状态即可知道本次是否为半开状态下的试探调用
+            probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.breaker.record_failure()
+                    raise asyncio.TimeoutError(f"Milvus {method} deadline exceeded")
+                try:
+                    future = loop.run_in_executor(self._executor, partial(self._invoke, method, kwargs, remaining))
+                    result = await asyncio.wait_for(future, remaining)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if not self.transport_error(e):
+                        # 服务可达，只是请求有误：不重试，也不计入熔断
+                        self.breaker.record_success()
+                        raise
+                    self.breaker.record_failure()
+                    remaining = deadline - time.monotonic()
+                    delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                    if attempt >= self.retries or delay >= remaining:
+                        logger.warning(f"Milvus {method} failed after {attempt + 1} attempts: {e!r}")
+                        raise
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+            except asyncio.CancelledError:
+                # 客户端断开或准入截止时间取消了任务：试探调用没有结果，释放名额，否则熔断器会一直拒绝调用
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def close(self):
+        """关闭线程池和所有客户端"""
+        self._executor.shutdown(wait=False)
+        with self._clients_lock:
+            for client in self._clients:
+                close = getattr(client, "close", None)
+                if close is not None:
+                    close()
+            self._clients = []
@@ -0,0 +1,58 @@
+"""
+按客户端需要裁剪 /api/ner、/api/std 的响应
+
+verbosity:
+    full     原样返回
+    compact  去掉合并实体中的 original_entities 和检索结果中的 synonyms
+    minimal  检索结果只保留 concept_id 和 distance，实体只保留类型和位置，NER 响应不再回传原文
+fields 显式指定检索结果保留的字段（如 ["concept_id", "concept_name", "distance"]），优先于 verbosity。
+"""
+from typing import Dict, List, Optional
+
+VERBOSITY_LEVELS = ("full", "compact", "minimal")
+
+_HIT_DROP = {"compact": {"synonyms"}}
+_HIT_KEEP = {"minimal": ("concept_id", "distance")}
+_ENTITY_KEEP = {"minimal": ("entity_group", "word", "start", "end")}
+
+
+def _slim_hits(hits: List[Dict], verbosity: str, fields: Optional[List[str]]) -> List[Dict]:
+    keep = fields or _HIT_KEEP.get(verbosity)
+    if keep:
+        return [{name: hit[name] for name in keep if name in hit} for hit in hits]
+    drop = _HIT_DROP.get(verbosity)
+    if drop:
+        return [{name: value for name, value in hit.items() if name not in drop} for hit in hits]
+    return hits
+
+
+def _slim_entity(entity: Dict, verbosity: str) -> Dict:
+    keep = _ENTITY_KEEP.get(verbosity)
+    if keep:
+        return {name: entity[name] for name in keep if name in entity}
+    return {name: value for name, value in entity.items() if name != "original_entities"}
+
+
+def slim_ner_response(result: Dict, verbosity: str = "full") -> Dict:
+    """裁剪 NERService.process 的结果"""
+    if verbosity == "full":
+        return result
+    dropped = ("entities", "text") if verbosity == "minimal" else ("entities",)
+    slim = {name: value for name, value in result.items() if name not in dropped}
+    slim["entities"] = [_slim_entity(entity, verbosity) for entity in result.get("entities", [])]
+    return slim
+
+
+def slim_std_response(result: Dict, verbosity: str = "full", fields: Optional[List[str]] = None) -> Dict:
+    """裁剪标准化结果（standardized_terms 或增量分析的 entities 中的 standardized_results）"""
+    if verbosity == "full" and not fields:
+        return result
+    slim = dict(result)
+    for key in ("standardized_terms", "entities"):
+        if key in result:
+            slim[key] = [
+                dict(_slim_entity(term, "compact"),
+                     standardized_results=_slim_hits(term.get("standardized_results", []), verbosity, fields))
+                for term in result[key]
+            ]
+    return slim
@@ -0,0 +1,144 @@
+"""
+请求级性能剖析
+
+- stage(): 记录请求内各阶段（NER、StdService 构造、嵌入、Milvus 检索等）的耗时，
+  未开启剖析的请求中只是一次 ContextVar 读取，几乎没有开销
+- StackSampler: 后台线程定时采样进程内各线程的栈（NER、嵌入、LLM 调用多在 asyncio.to_thread 或线程池中执行），
+  输出 flamegraph.pl / speedscope 可以直接读取的 collapsed-stack 文件
+"""
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# 当前请求的阶段耗时表，未开启剖析时为 None
+_current_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("profiling_timings", default=None)
+
+
+class stage:
+    """
+    阶段计时上下文管理器，同名阶段多次进入时耗时累加
+
+    用法：
+        with stage("embedding"):
+            ...
+    """
+    __slots__ = ("name", "timings", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = _current_timings.get()
+        if self.timings is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.timings is not None:
+            elapsed = (time.perf_counter() - self.started) * 1000.0
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+        return False
+
+
+def start_request():
+    """开启当前请求的阶段计时，返回用于 finish_request 的 token"""
+    return _current_timings.set({})
+
+
+def finish_request(token) -> Dict[str, float]:
+    """结束当前请求的阶段计时，返回 {阶段名: 毫秒}"""
+    timings = _current_timings.get() or {}
+    _current_timings.reset(token)
+    return timings
+
+
+def server_timing_header(timings: Dict[str, float], total_ms: float) -> str:
+    """将阶段耗时格式化为标准的 Server-Timing 响应头"""
+    parts = [f"{name};dur={duration:.2f}" for name, duration in timings.items()]
+    parts.append(f"total;dur={total_ms:.2f}")
+    return ", ".join(parts)
+
+
+# 线程空闲等待时的栈顶（模块, 函数），这类样本不计入
+_IDLE_FRAMES = {
+    ("threading", "wait"), ("threading", "_wait_for_tstate_lock"), ("queue", "get"),
+    ("selectors", "select"), ("concurrent.futures.thread", "_worker"),
+}
+
+
+class StackSampler:
+    """
+    线程栈采样器
+
+    在后台线程中按固定间隔读取线程的当前栈帧，按 "线程名;模块:函数;模块:函数 次数" 的 collapsed 格式聚合。
+    默认采样进程内全部线程（事件循环线程和执行 to_thread / run_in_executor 的工作线程），跳过空闲等待的线程；
+    采样在整个进程内进行，同时进行的其他请求也会被计入。
+
+    Args:
+        thread_id: 只采样该线程，为 None 时采样全部线程
+        interval: 采样间隔（秒）
+    """
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frames = {self.thread_id: frames[self.thread_id]} if self.thread_id in frames else {}
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in frames.items():
+                if thread_id == own:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+                    names.append((module, code.co_name))
+                    frame = frame.f_back
+                if not names or names[0] in _IDLE_FRAMES:
+                    continue
+                stack = ";".join(f"{module}:{function}" for module, function in reversed(names))
+                self.stacks[f"{thread_names.get(thread_id, thread_id)};{stack}"] += 1
+
+    def dump(self, directory: str, label: str) -> Optional[str]:
+        """
+        将采样结果写入 collapsed-stack 文件
+
+        Args:
+            directory: 输出目录，不存在时自动创建
+            label: 文件名标签（如请求路径）
+
+        Returns:
+            写入的文件路径，没有采样数据时返回 None
+        """
+        if not self.stacks:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        safe_label = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_") or "request"
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}-{os.getpid()}-{uuid.uuid4().hex[:8]}.collapsed"
+        path = os.path.join(directory, filename)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
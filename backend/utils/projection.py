@@ -0,0 +1,81 @@
+"""
+降维投影：用于第一阶段的低维粗排
+
+- truncate: 取前 dim 维后重新归一化（Matryoshka 方式，适用于以 MRL 训练的嵌入模型）
+- pca: 在概念向量上拟合的 PCA 投影，适用于 BGE-M3 这类未做 MRL 训练的模型
+"""
+import os
+
+import numpy as np
+
+PROJECTION_KINDS = ("truncate", "pca")
+PROJECTION_FILE = "projection.npz"
+REDUCED_VECTORS_FILE = "vectors_reduced.npy"
+
+# 拟合/变换时每次处理的行数
+_CHUNK_ROWS = 65536
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class Projection:
+    def __init__(self, kind: str, dim: int, mean: np.ndarray = None, components: np.ndarray = None):
+        if kind not in PROJECTION_KINDS:
+            raise ValueError(f"Unsupported projection: {kind}")
+        self.kind = kind
+        self.dim = dim
+        self.mean = mean
+        self.components = components  # (D, dim)
+
+    @classmethod
+    def fit(cls, kind: str, vectors: np.ndarray, dim: int) -> "Projection":
+        """
+        拟合投影；pca 按块累加协方差矩阵，不需要把全部向量读入内存
+        """
+        if kind == "truncate":
+            return cls(kind, dim)
+
+        count, width = vectors.shape
+        total = np.zeros(width, dtype=np.float64)
+        gram = np.zeros((width, width), dtype=np.float64)
+        for start in range(0, count, _CHUNK_ROWS):
+            chunk = np.asarray(vectors[start:start + _CHUNK_ROWS], dtype=np.float64)
+            total += chunk.sum(axis=0)
+            gram += chunk.T @ chunk
+        mean = total / count
+        covariance = gram / count - np.outer(mean, mean)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        components = eigenvectors[:, np.argsort(eigenvalues)[::-1][:dim]]
+        return cls(kind, dim, mean.astype(np.float32), components.astype(np.float32))
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """投影到 dim 维并重新归一化（支持单个向量或矩阵）"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.kind == "truncate":
+            reduced = vectors[..., :self.dim]
+        else:
+            reduced = (vectors - self.mean) @ self.components
+        return _normalize(np.array(reduced, dtype=np.float32))
+
+    def transform_all(self, vectors: np.ndarray) -> np.ndarray:
+        """按块投影全部向量"""
+        return np.concatenate([self.transform(vectors[start:start + _CHUNK_ROWS])
+                               for start in range(0, vectors.shape[0], _CHUNK_ROWS)])
+
+    def save(self, path: str):
+        arrays = {"kind": np.array(self.kind), "dim": np.array(self.dim)}
+        if self.kind == "pca":
+            arrays.update(mean=self.mean, components=self.components)
+        np.savez(os.path.join(path, PROJECTION_FILE), **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "Projection":
+        data = np.load(os.path.join(path, PROJECTION_FILE))
+        kind = str(data["kind"])
+        if kind == "pca":
+            return cls(kind, int(data["dim"]), data["mean"], data["components"])
+        return cls(kind, int(data["dim"]))
@@ -0,0 +1,97 @@
+"""
+本地索引的向量量化
+
+- float16: 半精度，内存减半，精度损失可以忽略
+- int8: 按维度对称标量量化，内存为 float32 的 1/4
+- binary: 符号位二值化（packbits），内存为 float32 的 1/32，用汉明距离粗排
+
+量化码常驻内存做粗排，float32 原始向量只通过 mmap 读取候选行做精确重排，
+因此常驻内存只有量化码的大小。
+"""
+import os
+from typing import Optional
+
+import numpy as np
+
+QUANTIZATION_KINDS = ("float16", "int8", "binary")
+
+# 每次反量化的行数，控制粗排时的临时内存
+_CHUNK_ROWS = 65536
+
+# 0-255 每个字节中 1 的个数，用于计算汉明距离
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def codes_file(kind: str) -> str:
+    return f"vectors_{kind}.npy"
+
+
+INT8_SCALE_FILE = "vectors_int8_scale.npy"
+
+
+class Quantizer:
+    """
+    量化码的编码与粗排打分
+
+    粗排得分越大越相似（binary 使用负汉明距离）。
+    """
+    def __init__(self, kind: str, scale: Optional[np.ndarray] = None):
+        if kind not in QUANTIZATION_KINDS:
+            raise ValueError(f"Unsupported quantization: {kind}")
+        self.kind = kind
+        self.scale = scale
+
+    @classmethod
+    def fit(cls, kind: str, vectors: np.ndarray) -> "Quantizer":
+        """int8 需要先统计每个维度的最大绝对值"""
+        scale = None
+        if kind == "int8":
+            max_abs = np.zeros(vectors.shape[1], dtype=np.float32)
+            for start in range(0, vectors.shape[0], _CHUNK_ROWS):
+                chunk = np.abs(np.asarray(vectors[start:start + _CHUNK_ROWS], dtype=np.float32))
+                np.maximum(max_abs, chunk.max(axis=0), out=max_abs)
+            max_abs[max_abs == 0] = 1.0
+            scale = max_abs / 127.0
+        return cls(kind, scale)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.kind == "float16":
+            return vectors.astype(np.float16)
+        if self.kind == "int8":
+            return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+        return np.packbits(vectors > 0, axis=-1)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """计算所有量化码与查询向量（float32，已归一化）的粗排得分"""
+        if self.kind == "binary":
+            query_bits = np.packbits(query > 0)
+            scores = np.empty(codes.shape[0], dtype=np.float32)
+            for start in range(0, codes.shape[0], _CHUNK_ROWS):
+                chunk = codes[start:start + _CHUNK_ROWS]
+                scores[start:start + len(chunk)] = -_POPCOUNT[np.bitwise_xor(chunk, query_bits)].sum(axis=1, dtype=np.int32)
+            return scores
+
+        # int8 把缩放系数乘到查询上，避免对量化码整体反量化
+        weights = query * self.scale if self.kind == "int8" else query
+        scores = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], _CHUNK_ROWS):
+            chunk = np.asarray(codes[start:start + _CHUNK_ROWS], dtype=np.float32)
+            scores[start:start + len(chunk)] = chunk @ weights
+        return scores
+
+    def save(self, path: str, codes: np.ndarray):
+        np.save(os.path.join(path, codes_file(self.kind)), codes)
+        if self.scale is not None:
+            np.save(os.path.join(path, INT8_SCALE_FILE), self.scale)
+
+    @classmethod
+    def load(cls, path: str, kind: str):
+        """
+        加载量化码，返回 (Quantizer, codes)
+
+        与原始向量一样以 mmap 方式打开，多个 worker 共享；粗排会顺序扫描全部量化码，使其常驻页缓存。
+        """
+        codes = np.load(os.path.join(path, codes_file(kind)), mmap_mode="r")
+        scale = np.load(os.path.join(path, INT8_SCALE_FILE)) if kind == "int8" else None
+        return cls(kind, scale), codes
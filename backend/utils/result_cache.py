@@ -0,0 +1,90 @@
+"""
+分析结果缓存：进程内 LRU + 可选的 SQLite 持久化
+
+值以 JSON 字符串保存，每次读取都得到独立的对象，调用方修改返回结果不会污染缓存。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+def cache_key(*parts: Any) -> str:
+    """对任意可 JSON 序列化的内容计算稳定的 sha256 键"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    大小受限的结果缓存
+
+    Args:
+        max_entries: 内存中最多保留的条目数（LRU 淘汰）
+        path: SQLite 文件路径，为 None 时只使用内存
+        max_persisted: SQLite 中最多保留的条目数，超出时按最近访问时间淘汰
+    """
+    _EVICT_CHECK_INTERVAL = 100
+
+    def __init__(self, max_entries: int = 1024, path: Optional[str] = None, max_persisted: int = 100000):
+        self.max_entries = max_entries
+        self.max_persisted = max_persisted
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, accessed REAL)")
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value = row[0]
+                    self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self._remember(key, value)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(value)
+
+    def put(self, key: str, result: Any):
+        value = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, value)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO results (key, value, accessed) VALUES (?, ?, ?)",
+                                 (key, value, time.time()))
+                self._puts += 1
+                if self._puts % self._EVICT_CHECK_INTERVAL == 0:
+                    self._evict_persisted()
+                self._db.commit()
+
+    def _remember(self, key: str, value: str):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_persisted(self):
+        count = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_persisted:
+            self._db.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)",
+                (count - self.max_persisted,))
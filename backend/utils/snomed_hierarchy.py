@@ -0,0 +1,308 @@
+"""
+进程内的 SNOMED CT 层级索引（由 tools/export_snomed_hierarchy.py 从 Neo4j 或 RF2 CSV 导出）
+
+Neo4j 中的 ObjectConcept、ISA 和 HAS_DESCRIPTION（见 tools/build.cypher）被快照为只读 mmap 数组：
+    hierarchy.json              概念数、边数、来源
+    concept_ids.npy             int64 (N,)，升序排列的 SCTID，行号即下标
+    parents_indptr.npy          int64 (N + 1,)，CSR：第 row 行的父概念为 parents_indices[indptr[row]:indptr[row + 1]]
+    parents_indices.npy         int32 (E,)
+    children_indptr.npy / children_indices.npy      反向 CSR
+    ancestors_indptr.npy / ancestors_indices.npy    传递闭包 CSR，每行的祖先行号升序排列，is_a 用二分查找
+    fsn_strings.bin / fsn_offsets.npy               FSN 字符串池，uint64 (N + 1,)
+    terms_indptr.npy            int64 (N + 1,)，第 row 行的描述为第 [indptr[row], indptr[row + 1]) 条
+    term_strings.bin / term_offsets.npy             描述字符串池，uint64 (T + 1,)
+
+SNOMED 是多重继承的 DAG，按区间编号无法表达，这里预先计算每个概念的全部祖先（平均几十个），
+祖先查询是一次切片，is_a 是一次 np.searchsorted，都在微秒级，不需要访问 Neo4j。
+"""
+import json
+import mmap
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+HIERARCHY_FILE = "hierarchy.json"
+CONCEPT_IDS_FILE = "concept_ids.npy"
+
+SctId = Union[int, str]
+
+
+def _load_arena(path: str, strings_file: str):
+    with open(os.path.join(path, strings_file), "rb") as f:
+        # 空文件不能 mmap
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+
+class SnomedHierarchy:
+    """
+    只读的 SNOMED 层级索引，概念以 SCTID（字符串或整数）表示
+    """
+    _opened: Dict[str, "SnomedHierarchy"] = {}
+    _opened_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, HIERARCHY_FILE), encoding="utf-8") as f:
+            self.info = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.concept_ids = load(CONCEPT_IDS_FILE)
+        self._parents = (load("parents_indptr.npy"), load("parents_indices.npy"))
+        self._children = (load("children_indptr.npy"), load("children_indices.npy"))
+        self._ancestors = (load("ancestors_indptr.npy"), load("ancestors_indices.npy"))
+        self._fsn_offsets = load("fsn_offsets.npy")
+        self._fsn_strings = _load_arena(path, "fsn_strings.bin")
+        self._terms_indptr = load("terms_indptr.npy")
+        self._term_offsets = load("term_offsets.npy")
+        self._term_strings = _load_arena(path, "term_strings.bin")
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, HIERARCHY_FILE))
+
+    @classmethod
+    def open(cls, path: str) -> "SnomedHierarchy":
+        """打开（或复用已打开的）层级索引"""
+        path = os.path.abspath(path)
+        with cls._opened_lock:
+            hierarchy = cls._opened.get(path)
+            if hierarchy is None:
+                hierarchy = cls(path)
+                cls._opened[path] = hierarchy
+            return hierarchy
+
+    def __len__(self) -> int:
+        return self.concept_ids.shape[0]
+
+    def __contains__(self, sctid: SctId) -> bool:
+        return self.row(sctid) >= 0
+
+    def row(self, sctid: SctId) -> int:
+        """SCTID 对应的行号，不存在时返回 -1"""
+        try:
+            value = int(sctid)
+        except (TypeError, ValueError):
+            return -1
+        position = int(np.searchsorted(self.concept_ids, value))
+        if position < len(self.concept_ids) and self.concept_ids[position] == value:
+            return position
+        return -1
+
+    def _ids(self, rows) -> List[str]:
+        return [str(sctid) for sctid in self.concept_ids[np.asarray(rows, dtype=np.int64)]]
+
+    def _slice(self, csr, sctid: SctId) -> np.ndarray:
+        row = self.row(sctid)
+        if row < 0:
+            return np.empty(0, dtype=np.int32)
+        indptr, indices = csr
+        return indices[indptr[row]:indptr[row + 1]]
+
+    def fsn(self, sctid: SctId) -> Optional[str]:
+        """概念的 FSN（完全限定名），不存在时返回 None"""
+        row = self.row(sctid)
+        if row < 0:
+            return None
+        return self._fsn_strings[int(self._fsn_offsets[row]):int(self._fsn_offsets[row + 1])].decode("utf-8")
+
+    def parents(self, sctid: SctId) -> List[str]:
+        """直接父概念（ISA 的目标）"""
+        return self._ids(self._slice(self._parents, sctid))
+
+    def children(self, sctid: SctId) -> List[str]:
+        """直接子概念"""
+        return self._ids(self._slice(self._children, sctid))
+
+    def ancestors(self, sctid: SctId) -> List[str]:
+        """全部祖先（不含自身）"""
+        return self._ids(self._slice(self._ancestors, sctid))
+
+    def descendants(self, sctid: SctId, max_depth: Optional[int] = None) -> List[str]:
+        """全部后代（不含自身，广度优先），max_depth 限制层数"""
+        start = self.row(sctid)
+        if start < 0:
+            return []
+        indptr, indices = self._children
+        seen = {start}
+        frontier = [start]
+        depth = 0
+        while frontier and (max_depth is None or depth < max_depth):
+            next_frontier = []
+            for row in frontier:
+                for child in indices[indptr[row]:indptr[row + 1]]:
+                    child = int(child)
+                    if child not in seen:
+                        seen.add(child)
+                        next_frontier.append(child)
+            frontier = next_frontier
+            depth += 1
+        seen.discard(start)
+        return self._ids(sorted(seen))
+
+    def is_a(self, sctid: SctId, ancestor: SctId) -> bool:
+        """sctid 是否为 ancestor 本身或其（传递）下位概念"""
+        row, target = self.row(sctid), self.row(ancestor)
+        if row < 0 or target < 0:
+            return False
+        if row == target:
+            return True
+        indptr, indices = self._ancestors
+        ancestors = indices[indptr[row]:indptr[row + 1]]
+        position = int(np.searchsorted(ancestors, target))
+        return position < len(ancestors) and ancestors[position] == target
+
+    def roll_up(self, sctid: SctId, targets: Sequence[SctId]) -> Optional[str]:
+        """返回 targets 中第一个是 sctid 自身或其祖先的概念，用于把细粒度概念归并到指定层级"""
+        for target in targets:
+            if self.is_a(sctid, target):
+                return str(target)
+        return None
+
+    def synonyms(self, sctid: SctId) -> List[str]:
+        """概念的有效描述（同义词、FSN 等）"""
+        row = self.row(sctid)
+        if row < 0:
+            return []
+        terms = []
+        for i in range(int(self._terms_indptr[row]), int(self._terms_indptr[row + 1])):
+            start, end = int(self._term_offsets[i]), int(self._term_offsets[i + 1])
+            terms.append(self._term_strings[start:end].decode("utf-8"))
+        return terms
+
+    def synonyms_batch(self, sctids: Sequence[SctId], separator: str = " ") -> List[str]:
+        """批量查询同义词（一次 searchsorted 定位全部行号），每个概念的描述以 separator 连接，不存在的概念为空字符串"""
+        values = np.fromiter((int(s) if str(s).isdigit() else -1 for s in sctids), dtype=np.int64, count=len(sctids))
+        if not len(self.concept_ids):
+            return [""] * len(values)
+        rows = np.minimum(np.searchsorted(self.concept_ids, values), len(self.concept_ids) - 1)
+        found = self.concept_ids[rows] == values
+        texts = []
+        for row, ok in zip(rows, found):
+            if not ok:
+                texts.append("")
+                continue
+            first, last = int(self._terms_indptr[row]), int(self._terms_indptr[row + 1])
+            offsets = self._term_offsets[first:last + 1]
+            texts.append(separator.join(self._term_strings[int(offsets[i]):int(offsets[i + 1])].decode("utf-8")
+                                        for i in range(last - first)))
+        return texts
+
+
+def _write_arena(path: str, strings_file: str, offsets_file: str, strings: Iterable[str]):
+    offsets = [0]
+    with open(os.path.join(path, strings_file), "wb") as f:
+        for value in strings:
+            data = (value or "").encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    np.save(os.path.join(path, offsets_file), np.asarray(offsets, dtype=np.uint64))
+
+
+def _csr(count: int, sources: np.ndarray, targets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    order = np.lexsort((targets, sources))
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=count), out=indptr[1:])
+    return indptr, targets[order].astype(np.int32)
+
+
+def build_hierarchy(path: str, concepts: Iterable[Tuple[SctId, str]], isa_edges: Iterable[Tuple[SctId, SctId]],
+                    descriptions: Iterable[Tuple[SctId, str]], source: str = "") -> Dict:
+    """
+    写出层级索引
+
+    Args:
+        path: 输出目录
+        concepts: (SCTID, FSN)
+        isa_edges: (子概念 SCTID, 父概念 SCTID)，两端不在 concepts 中的边被忽略
+        descriptions: (SCTID, 描述文本)
+        source: 数据来源说明，写入 hierarchy.json
+
+    Returns:
+        hierarchy.json 的内容
+    """
+    os.makedirs(path, exist_ok=True)
+    fsns = {}
+    for sctid, fsn in concepts:
+        fsns[int(sctid)] = fsn or ""
+    concept_ids = np.asarray(sorted(fsns), dtype=np.int64)
+    count = len(concept_ids)
+    np.save(os.path.join(path, CONCEPT_IDS_FILE), concept_ids)
+    _write_arena(path, "fsn_strings.bin", "fsn_offsets.npy", (fsns[int(sctid)] for sctid in concept_ids))
+
+    def rows(values):
+        values = np.asarray(values, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(concept_ids, values), max(count - 1, 0))
+        return np.where(concept_ids[positions] == values, positions, -1) if count else np.full(len(values), -1)
+
+    # 邻接表（去重、去自环、去掉未知概念）
+    edges = np.asarray([(int(child), int(parent)) for child, parent in isa_edges], dtype=np.int64).reshape(-1, 2)
+    child_rows, parent_rows = rows(edges[:, 0]), rows(edges[:, 1])
+    valid = (child_rows >= 0) & (parent_rows >= 0) & (child_rows != parent_rows)
+    pairs = np.unique(np.stack([child_rows[valid], parent_rows[valid]], axis=1), axis=0).reshape(-1, 2)
+    parents_indptr, parents_indices = _csr(count, pairs[:, 0], pairs[:, 1])
+    children_indptr, children_indices = _csr(count, pairs[:, 1], pairs[:, 0])
+    for name, array in (("parents_indptr", parents_indptr), ("parents_indices", parents_indices),
+                        ("children_indptr", children_indptr), ("children_indices", children_indices)):
+        np.save(os.path.join(path, f"{name}.npy"), array)
+
+    # 传递闭包：按拓扑序（父概念先于子概念）合并父概念的祖先集合
+    pending = np.diff(parents_indptr).astype(np.int64)
+    queue = deque(np.flatnonzero(pending == 0).tolist())
+    ancestors: List[Optional[np.ndarray]] = [None] * count
+    empty = np.empty(0, dtype=np.int32)
+    processed = 0
+    while queue:
+        row = queue.popleft()
+        parents = parents_indices[parents_indptr[row]:parents_indptr[row + 1]]
+        if len(parents):
+            ancestors[row] = np.unique(np.concatenate([parents] + [ancestors[p] for p in parents])).astype(np.int32)
+        else:
+            ancestors[row] = empty
+        processed += 1
+        for child in children_indices[children_indptr[row]:children_indptr[row + 1]]:
+            pending[child] -= 1
+            if pending[child] == 0:
+                queue.append(int(child))
+    cyclic = count - processed
+    for row in range(count):
+        if ancestors[row] is None:
+            # ISA 中存在环（不应出现）：只保留直接父概念
+            ancestors[row] = parents_indices[parents_indptr[row]:parents_indptr[row + 1]].astype(np.int32)
+    ancestors_indptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in ancestors], out=ancestors_indptr[1:])
+    np.save(os.path.join(path, "ancestors_indptr.npy"), ancestors_indptr)
+    np.save(os.path.join(path, "ancestors_indices.npy"),
+            np.concatenate(ancestors).astype(np.int32) if count else empty)
+
+    # 描述按概念分组（稳定排序保持同一概念内的原有顺序）
+    description_ids, terms = [], []
+    for sctid, term in descriptions:
+        if term:
+            description_ids.append(int(sctid))
+            terms.append(term)
+    description_rows = rows(description_ids) if description_ids else np.empty(0, dtype=np.int64)
+    keep = np.flatnonzero(description_rows >= 0)
+    order = keep[np.argsort(description_rows[keep], kind="stable")]
+    terms_indptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(description_rows[keep], minlength=count), out=terms_indptr[1:])
+    np.save(os.path.join(path, "terms_indptr.npy"), terms_indptr)
+    _write_arena(path, "term_strings.bin", "term_offsets.npy", (terms[i] for i in order))
+
+    info = {
+        "concepts": count,
+        "isa_edges": int(len(pairs)),
+        "ancestor_entries": int(ancestors_indptr[-1]),
+        "descriptions": int(terms_indptr[-1]),
+        "cyclic_concepts": int(cyclic),
+        "source": source,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(os.path.join(path, HIERARCHY_FILE), "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    return info
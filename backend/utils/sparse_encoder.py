@@ -0,0 +1,155 @@
+"""
+BM25 稀疏向量编码与本地倒排检索
+
+文档侧保存 BM25 的词频饱和权重，查询侧保存 IDF，二者内积即为 BM25 得分，
+因此可以直接写入 Milvus 的 SPARSE_FLOAT_VECTOR 字段并使用 IP 度量检索。
+缩写和罕见药名在稠密向量中容易被淹没，通过词法匹配可以在较小的 top-k 下召回。
+"""
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from utils.local_index import top_k
+
+BM25_FILE = "bm25.json"
+SPARSE_INDPTR_FILE = "sparse_indptr.npy"
+SPARSE_ROWS_FILE = "sparse_rows.npy"
+SPARSE_WEIGHTS_FILE = "sparse_weights.npy"
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """小写化后按字母数字切分"""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25SparseEncoder:
+    """
+    在概念文本语料上拟合的 BM25 编码器
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+        self.idf: List[float] = []
+        self.avgdl = 0.0
+
+    def fit(self, docs: List[str]) -> "BM25SparseEncoder":
+        """统计词表、文档频率和平均文档长度"""
+        document_frequency = Counter()
+        total_length = 0
+        for doc in docs:
+            tokens = tokenize(doc)
+            total_length += len(tokens)
+            document_frequency.update(set(tokens))
+
+        count = max(len(docs), 1)
+        self.avgdl = total_length / count or 1.0
+        self.vocabulary = {token: i for i, token in enumerate(sorted(document_frequency))}
+        self.idf = [0.0] * len(self.vocabulary)
+        for token, df in document_frequency.items():
+            self.idf[self.vocabulary[token]] = math.log(1.0 + (count - df + 0.5) / (df + 0.5))
+        return self
+
+    def encode_documents(self, docs: List[str]) -> List[Dict[int, float]]:
+        """文档侧稀疏向量：BM25 词频饱和权重（未登录词忽略）"""
+        vectors = []
+        for doc in docs:
+            tokens = [token for token in tokenize(doc) if token in self.vocabulary]
+            length_norm = self.k1 * (1.0 - self.b + self.b * len(tokens) / self.avgdl)
+            vectors.append({
+                self.vocabulary[token]: tf * (self.k1 + 1.0) / (tf + length_norm)
+                for token, tf in Counter(tokens).items()
+            })
+        return vectors
+
+    def encode_query(self, query: str) -> Dict[int, float]:
+        """查询侧稀疏向量：每个已登录词的 IDF"""
+        return {
+            self.vocabulary[token]: self.idf[self.vocabulary[token]]
+            for token in set(tokenize(query)) if token in self.vocabulary
+        }
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "avgdl": self.avgdl,
+                       "vocabulary": self.vocabulary, "idf": self.idf}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25SparseEncoder":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        encoder = cls(data["k1"], data["b"])
+        encoder.avgdl = data["avgdl"]
+        encoder.vocabulary = data["vocabulary"]
+        encoder.idf = data["idf"]
+        return encoder
+
+
+class SparseIndex:
+    """
+    本地索引中的词项倒排表（按词项 id 组织的 CSR），与 LocalIndex 的行号一致
+    """
+    def __init__(self, path: str):
+        self.indptr = np.load(os.path.join(path, SPARSE_INDPTR_FILE), mmap_mode="r")
+        self.rows = np.load(os.path.join(path, SPARSE_ROWS_FILE), mmap_mode="r")
+        self.weights = np.load(os.path.join(path, SPARSE_WEIGHTS_FILE), mmap_mode="r")
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, SPARSE_INDPTR_FILE))
+
+    def search(self, query: Dict[int, float], limit: int = 5) -> List[Tuple[int, float]]:
+        """
+        按 BM25 得分检索
+
+        Returns:
+            [(行号, BM25 得分), ...]，按得分降序
+        """
+        rows, scores = [], []
+        for term, weight in query.items():
+            if term + 1 >= len(self.indptr):
+                continue
+            start, end = int(self.indptr[term]), int(self.indptr[term + 1])
+            rows.append(self.rows[start:end])
+            scores.append(self.weights[start:end] * weight)
+        if not rows:
+            return []
+        unique_rows, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        best = top_k(totals, limit)
+        return [(int(unique_rows[i]), float(totals[i])) for i in best]
+
+
+class SparseIndexWriter:
+    """
+    收集文档侧稀疏向量，关闭时按词项排序写成倒排表
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._rows: List[int] = []
+        self._terms: List[int] = []
+        self._weights: List[float] = []
+
+    def add(self, row: int, vector: Dict[int, float]):
+        for term, weight in vector.items():
+            self._rows.append(row)
+            self._terms.append(int(term))
+            self._weights.append(float(weight))
+
+    def close(self):
+        terms = np.asarray(self._terms, dtype=np.int64)
+        order = np.argsort(terms, kind="stable")
+        vocabulary_size = int(terms.max()) + 1 if len(terms) else 0
+        indptr = np.zeros(vocabulary_size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=vocabulary_size), out=indptr[1:])
+        np.save(os.path.join(self.path, SPARSE_INDPTR_FILE), indptr)
+        np.save(os.path.join(self.path, SPARSE_ROWS_FILE), np.asarray(self._rows, dtype=np.int32)[order])
+        np.save(os.path.join(self.path, SPARSE_WEIGHTS_FILE), np.asarray(self._weights, dtype=np.float32)[order])
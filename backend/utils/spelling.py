@@ -0,0 +1,166 @@
+"""
+本地拼写纠正（不依赖 LLM）
+
+词表来自 SNOMED 概念名称（data/SNOMED_5000.csv 的 concept_name 和 FSN）、缩写词典的全称、
+常用英语词表（data/english_words.txt）和常见临床用词。候选查找采用 SymSpell 的删除索引：
+词表中每个词及其删除一到两个字符的变体建立索引，查询词的删除变体与之相交即可找到编辑距离不超过 2 的候选，
+再用 Damerau-Levenshtein 距离确认。
+
+用作 /api/corr 在 LLM 过慢时的降级实现，宁可漏改也不误改：
+- 词表中的词及其常见屈折形式（-s、-ed、-ing、-ly 等）视为正确；
+- 词表外的词只有在距离 1 的候选恰好一个时才替换；没有距离 1 的候选时，
+  不短于 min_distance2_length 的长词在距离 2 的候选恰好一个时替换；
+- 其余情况（包括有多个同样接近的候选）保持原样，保留原有大小写。
+"""
+import csv
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+_WORD = re.compile(r"[A-Za-z]+")
+
+ENGLISH_WORDS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  "data", "english_words.txt")
+
+# 病历中常见、但不一定出现在概念名称中的词
+COMMON_WORDS = """
+patient patients history presents presented presenting complains complaint complaints denies denied reports reported
+with without and the of for from was were has have had this that which after before during since today yesterday
+days weeks months years year old male female man woman admitted discharged discharge admission hospital clinic
+emergency department examination exam physical vital signs stable unstable normal abnormal mild moderate severe
+acute chronic pain left right bilateral upper lower medication medications dose daily twice three times every
+started stopped continue continued plan follow assessment diagnosis treatment therapy noted note notes also
+blood pressure heart rate temperature breathing respiratory oxygen saturation fever cough nausea vomiting
+diarrhea constipation fatigue weakness dizziness headache rash swelling shortness breath chest abdomen abdominal
+dizzy drowsy lightheaded nauseous itchy itching numb numbness tingling sweaty shaky faint fainted tender sore
+labs vitals meds prn bedbound ambulating ambulatory tolerating unremarkable afebrile
+""".split()
+
+
+def damerau_levenshtein(a: str, b: str, max_distance: int = 2) -> int:
+    """受限的 Damerau-Levenshtein 距离（相邻交换算一次编辑），超过 max_distance 时返回 max_distance + 1"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word: str, max_distance: int = 2) -> Set[str]:
+    """删除 1 到 max_distance 个字符得到的全部变体"""
+    variants, frontier = set(), {word}
+    for _ in range(max_distance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+def _base_forms(word: str) -> Set[str]:
+    """英语常见屈折变化可能对应的原形（walked -> walk, stopped -> stop, making -> make, labs -> lab）"""
+    forms = set()
+    for suffix in ("s", "es", "ed", "ing", "ly", "er", "est"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            stem = word[:-len(suffix)]
+            forms.add(stem)
+            forms.add(stem + "e")
+            if len(stem) > 3 and stem[-1] == stem[-2]:
+                forms.add(stem[:-1])
+    for suffix in ("ies", "ied", "ier", "iest", "ily"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            forms.add(word[:-len(suffix)] + "y")
+    return forms
+
+
+class LocalSpellingCorrector:
+    """
+    基于词表的保守拼写纠正
+
+    Args:
+        counts: 词（小写）到词频的映射
+        min_length: 只纠正不短于该长度的词，短词（多为缩写）保持原样
+        min_distance2_length: 允许纠正距离为 2 的最短词长
+    """
+
+    def __init__(self, counts: Dict[str, int], min_length: int = 4, min_distance2_length: int = 8):
+        self.counts = counts
+        self.min_length = min_length
+        self.min_distance2_length = min_distance2_length
+        # 删除索引：词本身和删除一到两个字符的变体 -> 词
+        self._index: Dict[str, List[str]] = defaultdict(list)
+        for word in counts:
+            for key in _deletes(word) | {word}:
+                self._index[key].append(word)
+
+    @classmethod
+    def from_sources(cls, concepts_csv: str, abbreviations_json: Optional[str] = None,
+                     extra_words: Iterable[str] = COMMON_WORDS,
+                     words_file: Optional[str] = ENGLISH_WORDS_FILE) -> "LocalSpellingCorrector":
+        """从概念 CSV、缩写词典、英语词表和常用词构建词表"""
+        counts = Counter(word.lower() for word in extra_words)
+        if words_file and os.path.isfile(words_file):
+            with open(words_file, encoding="utf-8") as f:
+                counts.update(word.lower() for word in _WORD.findall(f.read()))
+        with open(concepts_csv, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                text = f"{row.get('concept_name', '')} {row.get('FSN', '')}"
+                counts.update(word.lower() for word in _WORD.findall(text))
+        if abbreviations_json and os.path.isfile(abbreviations_json):
+            with open(abbreviations_json, encoding="utf-8") as f:
+                for expansions in json.load(f).values():
+                    for expansion in expansions:
+                        counts.update(word.lower() for word in _WORD.findall(expansion))
+        return cls(dict(counts))
+
+    def is_known(self, word: str) -> bool:
+        """词（小写）或其可能的原形在词表中"""
+        return word in self.counts or any(form in self.counts for form in _base_forms(word))
+
+    def suggest(self, word: str) -> Optional[str]:
+        """
+        返回替换词（小写）
+
+        词已知、过短，或者没有唯一的候选（距离 1 的候选恰好一个；长词没有距离 1 的候选时，距离 2 的候选恰好一个）
+        时返回 None
+        """
+        word = word.lower()
+        if len(word) < self.min_length or self.is_known(word):
+            return None
+        candidates = set()
+        for key in _deletes(word) | {word}:
+            candidates.update(self._index.get(key, ()))
+        by_distance: Dict[int, List[str]] = defaultdict(list)
+        for candidate in candidates:
+            distance = damerau_levenshtein(word, candidate)
+            if distance <= 2:
+                by_distance[distance].append(candidate)
+        if by_distance[1]:
+            return by_distance[1][0] if len(by_distance[1]) == 1 else None
+        if len(word) >= self.min_distance2_length and len(by_distance[2]) == 1:
+            return by_distance[2][0]
+        return None
+
+    def correct(self, text: str) -> str:
+        """纠正文本中的拼写错误，保留标点、空白和 ___ 占位符"""
+        def replace(match):
+            word = match.group(0)
+            suggestion = self.suggest(word)
+            if suggestion is None:
+                return word
+            if word.isupper():
+                return suggestion.upper()
+            if word[0].isupper():
+                return suggestion.capitalize()
+            return suggestion
+        return _WORD.sub(replace, text)
@@ -0,0 +1,39 @@
+"""
+临床文本切分：段落和句子，返回在原文中的 [start, end) 区间，便于结果偏移量换算
+"""
+import re
+from typing import List, Tuple
+
+# 空行分隔段落
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t\r\f\v]*\n")
+# 句末标点后跟空白，或换行
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?;。！？；])\s+|\n+")
+
+
+def _spans(text: str, pattern: re.Pattern) -> List[Tuple[int, int]]:
+    spans = []
+    start = 0
+    for match in pattern.finditer(text):
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, len(text)))
+    return [span for span in (_strip(text, s, e) for s, e in spans) if span[0] < span[1]]
+
+
+def _strip(text: str, start: int, end: int) -> Tuple[int, int]:
+    """去掉区间两端的空白"""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def split_paragraphs(text: str) -> List[Tuple[int, int]]:
+    """按空行切分段落"""
+    return _spans(text, _PARAGRAPH_BREAK)
+
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    """按句末标点和换行切分句子"""
+    return _spans(text, _SENTENCE_BREAK)
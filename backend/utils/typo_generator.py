@@ -0,0 +1,199 @@
+"""
+合成拼写错误生成（构造纠错评测语料）
+
+按键盘布局预先计算每个字母的相邻键表，对文本中的单词以给定概率注入一次错误：
+    substitution   替换为相邻键
+    insertion      在该字母后插入一个相邻键
+    deletion       删除该字母
+    transposition  与后一个字母交换（两字母相同时改为 substitution）
+所有随机数在 numpy 中按批一次生成，同一 seed 的结果完全可复现；批量模式对一批文本只做一次编码和一次抽样。
+只处理 ASCII 字母组成、长度不少于 min_length 的单词（与非 ASCII 字母或组合附加符号相连的字母串，
+如 "élan" 中的 "lan"，属于含非 ASCII 字母的单词，不处理），注入的字母保持原字母的大小写。
+
+每条错误返回真值，用于评测纠错结果：
+    {"type", "start", "end", "original", "replacement", "word", "corrupted_start", "corrupted_end"}
+start/end 为原文中被修改片段的位置，corrupted_start/corrupted_end 为错误文本中对应片段的位置。
+"""
+import unicodedata
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+KEYBOARD_ROWS = {
+    "qwerty": ["qwertyuiop", "asdfghjkl", "zxcvbnm"],
+    "azerty": ["azertyuiop", "qsdfghjklm", "wxcvbn"],
+}
+OPERATIONS = ("substitution", "insertion", "deletion", "transposition")
+SUBSTITUTION, INSERTION, DELETION, TRANSPOSITION = range(4)
+
+
+def adjacency_table(keyboard: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    键盘相邻键表
+
+    Returns:
+        (neighbors, counts)：neighbors[c, :counts[c]] 为小写字母 c（ASCII 码）的相邻键，非字母的 counts 为 0
+    """
+    if keyboard not in KEYBOARD_ROWS:
+        raise ValueError(f"Unsupported keyboard layout: {keyboard}")
+    rows = KEYBOARD_ROWS[keyboard]
+    position = {key: (row, column) for row, keys in enumerate(rows) for column, key in enumerate(keys)}
+    adjacent = {}
+    for key, (row, column) in position.items():
+        # 同一行左右两个键；各行错开半个键位，上一行取 column、column + 1，下一行取 column - 1、column
+        candidates = [(row, column - 1), (row, column + 1),
+                      (row - 1, column), (row - 1, column + 1),
+                      (row + 1, column - 1), (row + 1, column)]
+        adjacent[key] = [rows[r][c] for r, c in candidates if 0 <= r < len(rows) and 0 <= c < len(rows[r])]
+
+    width = max(len(keys) for keys in adjacent.values())
+    neighbors = np.zeros((128, width), dtype=np.uint32)
+    counts = np.zeros(128, dtype=np.int64)
+    for key, keys in adjacent.items():
+        neighbors[ord(key), :len(keys)] = [ord(k) for k in keys]
+        counts[ord(key)] = len(keys)
+    return neighbors, counts
+
+
+class TypoGenerator:
+    """
+    Args:
+        keyboard: 键盘布局 (qwerty/azerty)
+        min_length: 参与注入错误的最短单词长度
+        weights: substitution/insertion/deletion/transposition 四种错误的相对权重
+    """
+
+    def __init__(self, keyboard: str = "qwerty", min_length: int = 3,
+                 weights: Sequence[float] = (0.4, 0.2, 0.2, 0.2)):
+        self.keyboard = keyboard
+        self.neighbors, self.counts = adjacency_table(keyboard)
+        self.min_length = max(int(min_length), 2)
+        weights = np.asarray(weights, dtype=np.float64)
+        self.weights = weights / weights.sum()
+
+    def corrupt(self, text: str, probability: float = 0.3, max_errors: int = 5,
+                seed: Optional[int] = None) -> Tuple[str, List[Dict]]:
+        """对单个文本注入错误，返回 (错误文本, 错误列表)"""
+        corrupted, edits = self.corrupt_batch([text], probability, max_errors, np.random.default_rng(seed))
+        return corrupted[0], edits[0]
+
+    def corrupt_batch(self, texts: List[str], probability: float = 0.3, max_errors: int = 5,
+                      rng: Optional[np.random.Generator] = None) -> Tuple[List[str], List[List[Dict]]]:
+        """
+        对一批文本注入错误
+
+        Args:
+            texts: 文本列表
+            probability: 每个单词出错的概率
+            max_errors: 每个文本最多的错误数（超过时随机保留）
+            rng: 随机数生成器，结果只取决于它的状态和输入
+
+        Returns:
+            (错误文本列表, 每个文本的错误列表)
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        corrupted = list(texts)
+        all_edits: List[List[Dict]] = [[] for _ in texts]
+        if not texts:
+            return corrupted, all_edits
+
+        # 整批文本编码为一个码点数组，在数组上找单词边界
+        lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+        text_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+        lower = codes | 32
+        letters = (codes < 128) & (lower >= ord("a")) & (lower <= ord("z"))
+        # 文本边界也是单词边界
+        boundary = np.zeros(len(codes) + 1, dtype=bool)
+        boundary[text_starts] = True
+        padded = np.concatenate(([False], letters, [False]))
+        word_starts = np.flatnonzero(padded[1:] & ~(padded[:-1] & ~boundary))
+        word_ends = np.flatnonzero(padded[:-1] & ~(padded[1:] & ~boundary))
+        word_lengths = word_ends - word_starts
+        eligible = word_lengths >= self.min_length
+        # 与非 ASCII 字母相连（同一文本内）的字母串是含非 ASCII 字母的单词的一部分
+        wide = np.unique(codes[codes >= 128])
+        if len(wide):
+            foreign_codes = [code for code in wide.tolist()
+                             if chr(code).isalpha() or unicodedata.category(chr(code)).startswith("M")]
+            foreign = np.concatenate((np.isin(codes, foreign_codes), [False]))
+            before = np.where(boundary[word_starts], False, foreign[word_starts - 1])
+            after = np.where(boundary[word_ends], False, foreign[word_ends])
+            eligible &= ~before & ~after
+        word_starts, word_lengths = word_starts[eligible], word_lengths[eligible]
+
+        # 抽样出错的单词，每个文本最多保留 max_errors 个
+        chosen = rng.random(len(word_starts)) < probability
+        word_starts, word_lengths = word_starts[chosen], word_lengths[chosen]
+        owners = np.searchsorted(text_starts, word_starts, side="right") - 1
+        if len(word_starts) and max_errors is not None:
+            order = np.lexsort((rng.random(len(word_starts)), owners))
+            sorted_owners = owners[order]
+            group_first = np.searchsorted(sorted_owners, sorted_owners, side="left")
+            keep = np.sort(order[np.arange(len(order)) - group_first < max_errors])
+            word_starts, word_lengths, owners = word_starts[keep], word_lengths[keep], owners[keep]
+        if not len(word_starts):
+            return corrupted, all_edits
+
+        # 错误类型、位置和相邻键
+        count = len(word_starts)
+        operations = rng.choice(len(OPERATIONS), size=count, p=self.weights)
+        transposed = operations == TRANSPOSITION
+        offsets = np.floor(rng.random(count) * (word_lengths - transposed)).astype(np.int64)
+        positions = word_starts + offsets
+        chars = codes[positions]
+        next_chars = codes[np.minimum(positions + 1, len(codes) - 1)]
+        operations[transposed & (chars == next_chars)] = SUBSTITUTION
+        lower_chars = chars | 32
+        picks = np.floor(rng.random(count) * self.counts[lower_chars]).astype(np.int64)
+        replacements = self.neighbors[lower_chars, picks]
+        uppercase = chars < ord("a")
+        replacements[uppercase] -= 32
+
+        # 错误文本中的位置：同一文本内之前的插入/删除造成的偏移
+        deltas = np.select([operations == INSERTION, operations == DELETION], [1, -1], 0)
+        shifts = np.cumsum(deltas) - deltas
+        shifts -= shifts[np.searchsorted(owners, owners, side="left")]
+
+        group_starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        for first, last in zip(group_starts, np.r_[group_starts[1:], count]):
+            text_index = int(owners[first])
+            text = texts[text_index]
+            base = int(text_starts[text_index])
+            parts, cursor, edits = [], 0, []
+            for i in range(first, last):
+                operation = int(operations[i])
+                start = int(positions[i]) - base
+                word_start = int(word_starts[i]) - base
+                word = text[word_start:word_start + int(word_lengths[i])]
+                char, replacement = text[start], chr(int(replacements[i]))
+                if operation == SUBSTITUTION:
+                    end, new = start + 1, replacement
+                elif operation == INSERTION:
+                    end, new = start + 1, char + replacement
+                elif operation == DELETION:
+                    end, new = start + 1, ""
+                else:
+                    end, new = start + 2, text[start + 1] + char
+                parts.extend((text[cursor:start], new))
+                cursor = end
+                corrupted_start = start + int(shifts[i])
+                edits.append({
+                    "type": OPERATIONS[operation],
+                    "start": start,
+                    "end": end,
+                    "original": text[start:end],
+                    "replacement": new,
+                    "word": word,
+                    "corrupted_start": corrupted_start,
+                    "corrupted_end": corrupted_start + len(new),
+                })
+            parts.append(text[cursor:])
+            corrupted[text_index] = "".join(parts)
+            all_edits[text_index] = edits
+        return corrupted, all_edits
+
+
+def batch_rng(seed: int, batch_index: int) -> np.random.Generator:
+    """批量模式中第 batch_index 批使用的随机数生成器（与进程数和处理顺序无关）"""
+    return np.random.Generator(np.random.PCG64([int(seed), int(batch_index)]))